@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+r'''
+Benchmark ConeSearchIndex on a random all-sky catalogue.
+
+Usage: python benchmarks/cone_search.py [NUM_SOURCES [NUM_QUERIES [RADIUS_DEG]]]
+
+Defaults: 10^6 sources, 10^4 queries, 1 degree radius. A sample of the
+queries is checked against a brute force search.
+'''
+
+from __future__ import print_function
+
+import sys
+import time
+import numpy
+
+from lofarobsxml.conesearch import ConeSearchIndex, unit_vectors
+
+
+def random_directions(count, rng):
+    r'''
+    Return (ra_rad, dec_rad) arrays uniformly distributed on the sky.
+    '''
+    ra_rad  = rng.uniform(0.0, 2*numpy.pi, count)
+    dec_rad = numpy.arcsin(rng.uniform(-1.0, 1.0, count))
+    return ra_rad, dec_rad
+
+
+def main(argv):
+    num_sources = int(float(argv[1])) if len(argv) > 1 else 10**6
+    num_queries = int(float(argv[2])) if len(argv) > 2 else 10**4
+    radius_rad  = numpy.radians(float(argv[3]) if len(argv) > 3 else 1.0)
+    rng = numpy.random.RandomState(42)
+
+    ra_rad, dec_rad = random_directions(num_sources, rng)
+    query_ra, query_dec = random_directions(num_queries, rng)
+
+    start = time.time()
+    index = ConeSearchIndex(ra_rad, dec_rad)
+    build_s = time.time() - start
+
+    start = time.time()
+    results = index.query_many(query_ra, query_dec, radius_rad)
+    query_s = time.time() - start
+    matches = sum(len(rows) for rows, _ in results)
+
+    vectors = unit_vectors(ra_rad, dec_rad)
+    for i in range(0, num_queries, max(1, num_queries//20)):
+        centre = unit_vectors(query_ra[i], query_dec[i])[0]
+        brute  = numpy.flatnonzero(vectors.dot(centre) >= numpy.cos(radius_rad))
+        assert sorted(brute.tolist()) == sorted(results[i][0].tolist()), i
+
+    print('sources        : %d' % num_sources)
+    print('queries        : %d' % num_queries)
+    print('radius         : %.3f deg' % numpy.degrees(radius_rad))
+    print('matches        : %d' % matches)
+    print('build index    : %.3f s' % build_s)
+    print('query_many     : %.3f s (%.1f us/query)' %
+          (query_s, 1e6*query_s/num_queries))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+r'''
+Benchmark the cost of rendering Observations to XML with and without
+a RenderSession, and the cost of the per-observation ephem calls that
+the session replaces.
+
+Usage: python benchmarks/render_session.py [NUM_OBSERVATIONS [REPEAT]]
+
+Defaults: 2000 observations, best of 3. The start and end timestamps
+of all observations are checked against the former ephem.Date
+computation.
+'''
+
+from __future__ import print_function
+
+import sys
+import time
+import ephem
+
+from lofarobsxml import TargetSource, Angle, Beam, BackendProcessing, Observation
+from lofarobsxml.momformats import mom_timestamp
+from lofarobsxml.timeline import RenderSession, Timeline, timestamp_seconds
+
+
+def make_observations(count):
+    r'''
+    Return ``count`` consecutive 10 minute observations of 3C 196
+    with fractional start seconds.
+    '''
+    target  = TargetSource('3C 196', Angle(hms=(8, 13, 36.0)),
+                           Angle(sdms=('+', 48, 13, 3.0)))
+    backend = BackendProcessing()
+    timeline = Timeline.consecutive((2013, 10, 20, 18, 0, 0), [600]*count, 61)
+    return [Observation('HBA_DUAL_INNER', 'HBA_LOW',
+                        start_date[:-1] + (start_date[-1] + 0.4*(i % 3),),
+                        600.3, stations=['CS001', 'CS002'], clock_mhz=200,
+                        bit_mode=8, backend=backend, name='obs%05d' % i,
+                        beam_list=[Beam(0, target, '77..320')])
+            for i, start_date in enumerate(timeline.start_dates())]
+
+
+def ephem_interval(observation):
+    r'''
+    Start and end timestamps as computed before RenderSession,
+    including the unused current time.
+    '''
+    now = ephem.Observer().date
+    start_date = observation.start_date
+    end_date = ephem.Date(ephem.Date(start_date) +
+                          ephem.second*observation.duration_seconds).tuple()
+    rounded_start_date = start_date[:-1] + (int(round(start_date[-1])),)
+    rounded_end_date   = end_date[:-1] + (int(round(end_date[-1])),)
+    now = now.tuple()[:-1] + (int(round(now.tuple()[-1])),)
+    return (mom_timestamp(*rounded_start_date), mom_timestamp(*rounded_end_date))
+
+
+def timestamp_instant(timestamp):
+    r'''
+    Seconds since 1970 of a MoM timestamp, also if it has 60 seconds.
+    '''
+    date, clock = timestamp.split('T')
+    return timestamp_seconds(tuple([int(field) for field in
+                                    date.split('-') + clock.split(':')]))
+
+
+def best_time_s(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main(argv):
+    count  = int(float(argv[1])) if len(argv) > 1 else 2000
+    repeat = int(argv[2]) if len(argv) > 2 else 3
+    observations = make_observations(count)
+
+    def render_without_session():
+        for observation in observations:
+            observation.xml('benchmark')
+
+    def render_with_session():
+        with RenderSession():
+            for observation in observations:
+                observation.xml('benchmark')
+
+    def ephem_intervals():
+        for observation in observations:
+            ephem_interval(observation)
+
+    def session_intervals():
+        session = RenderSession()
+        for observation in observations:
+            session.interval(observation.start_date, observation.duration_seconds)
+
+    # The former computation printed e.g. 12:15:60 when rounding up
+    # to a full minute; compare instants instead of strings
+    minute_overflows = 0
+    with RenderSession() as session:
+        for observation in observations:
+            expected = ephem_interval(observation)
+            actual   = session.interval(observation.start_date,
+                                        observation.duration_seconds)
+            assert ([timestamp_instant(stamp) for stamp in actual] ==
+                    [timestamp_instant(stamp) for stamp in expected]), observation.name
+            minute_overflows += actual != expected
+
+    without_s = best_time_s(render_without_session, repeat)
+    with_s    = best_time_s(render_with_session, repeat)
+    ephem_s   = best_time_s(ephem_intervals, repeat)
+    integer_s = best_time_s(session_intervals, repeat)
+
+    print('observations            : %d' % count)
+    print('render without session  : %.1f us/observation' % (1e6*without_s/count))
+    print('render with session     : %.1f us/observation' % (1e6*with_s/count))
+    print('ephem start/end (before): %.1f us/observation' % (1e6*ephem_s/count))
+    print('integer start/end       : %.1f us/observation' % (1e6*integer_s/count))
+    print('fixed ":60" timestamps  : %d' % minute_overflows)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -6,16 +6,34 @@ from lofarobsxml.utilities import flatten_list, lofar_sidereal_time
 from lofarobsxml.utilities import station_list, validate_enumeration, next_date_with_lofar_lst
 from lofarobsxml.utilities import lofar_observer, next_sunrise, next_sunset
 from lofarobsxml.utilities import exclude_conflicting_eu_stations, exclude_conflicting_nl_stations
-from lofarobsxml.utilities import InvalidStationSetError
+from lofarobsxml.utilities import resolve_station_conflicts, STATION_CONFLICTS
+from lofarobsxml.utilities import InvalidStationSetError, UnknownStationError
+from lofarobsxml.utilities import StationSet, STATION_REGISTRY
 from lofarobsxml.utilities import lm_from_radec, radec_from_lm, rotate_lm_CCW
 from lofarobsxml.utilities import parse_subband_list, lower_case
 
 from lofarobsxml.targetsource    import SourceSpecificationError, NoSimbadCoordinatesError
-from lofarobsxml.targetsource    import TargetSource, simbad
+from lofarobsxml.targetsource    import SimbadOfflineError
+from lofarobsxml.targetsource    import TargetSource, SimbadCache, simbad, resolve_many
+from lofarobsxml.conesearch      import ConeSearchIndex
+from lofarobsxml.sourcetable     import SourceTable, read_source_table, load_source_table
 from lofarobsxml.sourcecatalogue import SourceCatalogue, NoSuitableSourceError
+from lofarobsxml.subbands        import SubbandSet, compress_subband_list
+from lofarobsxml.frequencies     import subband_frequencies_mhz, beams_outside_filter_band
 from lofarobsxml.folder          import Folder
 from lofarobsxml.beam            import Beam
 from lofarobsxml.backend         import Stokes, BackendProcessing, TiedArrayBeams
 from lofarobsxml.observation     import Observation, xml
+from lofarobsxml.observation     import BeamletBudgetError, validate_beamlet_budgets
+from lofarobsxml.observationspecificationbase import walk_tree, TopologyIndex
+from lofarobsxml.demix           import advise_demixing, DemixAdvice
+from lofarobsxml.datarates       import estimate_data_volumes, DataVolumeEstimate
+from lofarobsxml.resources       import estimate_pipeline_resources, cluster_load
+from lofarobsxml.processingschedule import ProcessingDAG, simulate_processing
+from lofarobsxml.timeconflicts import find_time_conflicts, find_project_time_conflicts, validate_observation_times, ObservationConflictError
+from lofarobsxml.surveypacker import SurveyField, pack_survey
+from lofarobsxml.timeline import Timeline, timestamp_seconds, RenderSession
+from lofarobsxml.stationpositions import station_positions, baseline_vectors, baseline_lengths
+from lofarobsxml.stationpositions import max_baseline_m, num_baselines, uvw_m
 
 import ephem
@@ -1,15 +1,18 @@
 from lofarobsxml.observationspecificationbase import ObservationSpecificationBase
-from lofarobsxml.utilities import lower_case, AutoReprBaseClass, indent
+from lofarobsxml.utilities import lower_case, AutoReprBaseClass, indent, typecheck
+from lofarobsxml.utilities import InternedConfig, interned_config, cached_rendering
 
 r'''
 This module contains the helper classes that contain the miriad
 different setting of the correlator. The main class here is
 BackendProcessing, which contains pointers to the other classes:
-TiedArrayBeams and Stokes, when needed.
+TiedArrayBeams and Stokes, when needed. TiedArrayBeams and Stokes
+instances are immutable and shared between all backends with equal
+settings.
 '''
 
 
-class TiedArrayBeams(AutoReprBaseClass):
+class TiedArrayBeams(InternedConfig):
     r'''
     Description of Tied Array Beam (TAB) settings.
 
@@ -18,9 +21,9 @@ class TiedArrayBeams(AutoReprBaseClass):
     flyseye : bool
         If True, store data streams from each station individually.
 
-    beams_ra_dec_rad : None or list of pairs of float
+    beams_ra_dec_rad : None or sequence of pairs of float
         The RA, Dec in rad of the phase centres of the TABs in J2000
-        coordinates.
+        coordinates. Stored as a tuple of tuples.
 
     nr_tab_rings : int
         Alternatively, one can specify with how many rings one wants
@@ -63,7 +66,7 @@ class TiedArrayBeams(AutoReprBaseClass):
     ...                         beams_ra_dec_rad = [(3.1, +0.5),
     ...                                             (3.2, +0.54)])
     >>> tab_fe
-    TiedArrayBeams(beams_ra_dec_rad = [(3.1, 0.5), (3.2, 0.54)],
+    TiedArrayBeams(beams_ra_dec_rad = ((3.1, 0.5), (3.2, 0.54)),
                    flyseye          = True,
                    nr_tab_rings     = 0,
                    tab_ring_size    = 0)
@@ -78,21 +81,46 @@ class TiedArrayBeams(AutoReprBaseClass):
         <tiedArrayBeam><coherent>true</coherent><angle1>3.200000</angle1><angle2>0.540000</angle2></tiedArrayBeam>
       </tiedArrayBeamList>
     </tiedArrayBeams>
+
+    Equal settings yield the same instance. Use replace() to change
+    a setting:
+
+    >>> tab_fe.replace(flyseye = False) is TiedArrayBeams(
+    ...     beams_ra_dec_rad = [(3.1, 0.5), (3.2, 0.54)])
+    True
     '''
-    def __init__(self, flyseye    = False,
-                 beam_offsets     = None,
-                 beams_ra_dec_rad  = None,
-                 nr_tab_rings     = 0,
-                 tab_ring_size    = 0):
-        self.flyseye = flyseye
+    __slots__ = ('flyseye', 'beams_ra_dec_rad', 'nr_tab_rings', 'tab_ring_size')
+
+    def __new__(cls, flyseye     = False,
+                beam_offsets     = None,
+                beams_ra_dec_rad = None,
+                nr_tab_rings     = 0,
+                tab_ring_size    = 0):
         if beam_offsets is not None:
             raise ValueError(
                 'Relative beam_offsets not supported as of LOFAR 2.4 (2014-06-30) use beams_ra_dec_rad instead')
-        self.beams_ra_dec_rad = beams_ra_dec_rad
-        self.nr_tab_rings = nr_tab_rings
-        self.tab_ring_size = tab_ring_size
+        if beams_ra_dec_rad is not None:
+            beams_ra_dec_rad = tuple([(float(ra_rad), float(dec_rad))
+                                      for ra_rad, dec_rad in beams_ra_dec_rad])
+        return interned_config(cls, (flyseye, beams_ra_dec_rad,
+                                     nr_tab_rings, tab_ring_size))
+
 
+    def validate(self):
+        r'''
+        Raise a ValueError or TypeError if problems with the
+        specification are detected.
+        '''
+        typecheck(self.flyseye, bool, 'TiedArrayBeams.flyseye')
+        typecheck(self.nr_tab_rings, int, 'TiedArrayBeams.nr_tab_rings')
+        typecheck(self.tab_ring_size, [int, float],
+                  'TiedArrayBeams.tab_ring_size')
+        if self.nr_tab_rings < 0:
+            raise ValueError('TiedArrayBeams.nr_tab_rings(%r) must be >= 0' %
+                             self.nr_tab_rings)
 
+
+    @cached_rendering
     def xml(self, project_name = None):
         output = ('''
 <tiedArrayBeams>
@@ -124,7 +152,7 @@ class TiedArrayBeams(AutoReprBaseClass):
 
 
 
-class Stokes(AutoReprBaseClass):
+class Stokes(InternedConfig):
     r'''
     Describes averaging and storage parameters for beam formed
     observations. This class is not derived from
@@ -184,18 +212,20 @@ class Stokes(AutoReprBaseClass):
     <numberCollapsedChannelsCS>16</numberCollapsedChannelsCS>
     <stokesDownsamplingStepsCS>64</stokesDownsamplingStepsCS>
     <whichCS>IQUV</whichCS>
+    >>> stk is Stokes('coherent', 512, 16, 64, 'IQUV')
+    True
     '''
+    __slots__ = ('mode', 'subbands_per_file', 'number_collapsed_channels',
+                 'stokes_downsampling_steps', 'polarizations')
 
-    def __init__(self, mode, subbands_per_file = 512,
-                 number_collapsed_channels = None,
-                 stokes_downsampling_steps = 1,
-                 polarizations = 'I'):
-        self.mode = mode
-        self.subbands_per_file = subbands_per_file
-        self.number_collapsed_channels = number_collapsed_channels
-        self.stokes_downsampling_steps = stokes_downsampling_steps
-        self.polarizations = polarizations
-        self.validate()
+    def __new__(cls, mode, subbands_per_file = 512,
+                number_collapsed_channels = None,
+                stokes_downsampling_steps = 1,
+                polarizations = 'I'):
+        return interned_config(cls, (mode, subbands_per_file,
+                                     number_collapsed_channels,
+                                     stokes_downsampling_steps,
+                                     polarizations))
 
 
     def validate(self):
@@ -234,12 +264,17 @@ class Stokes(AutoReprBaseClass):
         return self.mode[0].upper()+'S'
 
 
-    def xml(self, project_name = None):
+    @cached_rendering
+    def xml(self, project_name = None, channels_per_subband = None):
         r'''
         Produce the xml for the coherent stokes  or incoherent stokes
-        settings of the backend.
+        settings of the backend. If number_collapsed_channels is not
+        set, ``channels_per_subband`` is used instead.
         '''
-        if self.number_collapsed_channels is None:
+        number_collapsed_channels = self.number_collapsed_channels
+        if number_collapsed_channels is None:
+            number_collapsed_channels = channels_per_subband
+        if number_collapsed_channels is None:
             raise ValueError('Stokes.xml(): number_collapsed_channels is not set.')
         return ('''<subbandsPerFile%(suffix)s>%(subbands_per_file)d</subbandsPerFile%(suffix)s>
 <numberCollapsedChannels%(suffix)s>%(number_collapsed_channels)d</numberCollapsedChannels%(suffix)s>
@@ -247,7 +282,7 @@ class Stokes(AutoReprBaseClass):
 <which%(suffix)s>%(polarizations)s</which%(suffix)s>''' % 
                 {'suffix'                   : self.stokes_suffix(),
                  'subbands_per_file'        : self.subbands_per_file,
-                 'number_collapsed_channels': self.number_collapsed_channels,
+                 'number_collapsed_channels': number_collapsed_channels,
                  'stokes_downsampling_steps': self.stokes_downsampling_steps,
                  'polarizations'            : self.polarizations})
                
@@ -498,6 +533,8 @@ class BackendProcessing(AutoReprBaseClass):
                  enable_superterp              = False,
                  default_template = 'BeamObservation'
                  ):
+        self._frozen = False
+        self._xml_fragments = {}
         self.channels_per_subband = channels_per_subband
         self.integration_time_seconds = integration_time_seconds
         self.correlated_data = correlated_data
@@ -508,8 +545,8 @@ class BackendProcessing(AutoReprBaseClass):
         # correlator settings.
         if self.coherent_stokes_data:
             if self.coherent_stokes_data.number_collapsed_channels is None:
-                    self.coherent_stokes_data.number_collapsed_channels = \
-                        self.channels_per_subband
+                self.coherent_stokes_data = self.coherent_stokes_data.replace(
+                    number_collapsed_channels = self.channels_per_subband)
 
         self.tied_array_beams          = tied_array_beams
         if self.tied_array_beams  is None:
@@ -518,8 +555,8 @@ class BackendProcessing(AutoReprBaseClass):
         self.incoherent_stokes_data    = incoherent_stokes_data
         if self.incoherent_stokes_data:
             if self.incoherent_stokes_data.number_collapsed_channels is None:
-                    self.incoherent_stokes_data.number_collapsed_channels = \
-                        self.channels_per_subband
+                self.incoherent_stokes_data = self.incoherent_stokes_data.replace(
+                    number_collapsed_channels = self.channels_per_subband)
         self.stokes_integrate_channels = stokes_integrate_channels
         self.coherent_dedispersed_channels = coherent_dedispersed_channels
         self.bypass_pff                = bypass_pff
@@ -534,6 +571,69 @@ class BackendProcessing(AutoReprBaseClass):
 
 
 
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_frozen', False):
+            raise AttributeError(
+                'BackendProcessing is immutable once attached to an '
+                'Observation; create a new instance instead of setting %s' %
+                name)
+        super(BackendProcessing, self).__setattr__(name, value)
+
+
+
+    def freeze(self):
+        r'''
+        Make this instance immutable. Observations call this when the
+        backend is attached, so that its rendered XML can be cached.
+        Freezing a frozen instance, e.g. one shared by several
+        observations, has no effect.
+
+        **Examples**
+
+        >>> from lofarobsxml import Observation, Beam, TargetSource, Angle
+        >>> target = TargetSource('3C 196', Angle(hms = (8, 13, 36.0)),
+        ...                       Angle(sdms = ('+', 48, 13, 3.0)))
+        >>> bp = BackendProcessing()
+        >>> first, second = [Observation('HBA_DUAL', 'HBA_LOW', (2013, 10, 20, 18, minute, 0),
+        ...                              60, ['CS001'], 200, [Beam(0, target, '77..320')], bp)
+        ...                  for minute in (0, 2)]
+        >>> first.backend is second.backend
+        True
+        '''
+        self.__dict__['_frozen'] = True
+
+
+
+    def xml_fragment(self, amount = 0):
+        r'''
+        Return ``xml()`` indented by ``amount`` spaces. The text is
+        rendered once per indentation after ``freeze()``, and every
+        Observation sharing this backend reuses the same string.
+
+        **Examples**
+
+        >>> bp = BackendProcessing()
+        >>> bp.freeze()
+        >>> bp.freeze()
+        >>> bp.xml_fragment(6) is bp.xml_fragment(6)
+        True
+        >>> print(bp.xml_fragment(2).split('\n')[0])
+          <correlatedData>true</correlatedData>
+        >>> bp.channels_per_subband = 16
+        Traceback (most recent call last):
+        ...
+        AttributeError: BackendProcessing is immutable once attached to an Observation; create a new instance instead of setting channels_per_subband
+        '''
+        if not self._frozen:
+            return indent(self.xml(), amount)
+        try:
+            return self._xml_fragments[amount]
+        except KeyError:
+            return self._xml_fragments.setdefault(amount,
+                                                  indent(self.xml(), amount))
+
+
+
     def need_beam_observation(self):
         r'''
         '''
@@ -602,14 +702,11 @@ class BackendProcessing(AutoReprBaseClass):
         # If number_collapsed_channels is not set, default to
         # correlator settings.
         if self.incoherent_stokes_data:
-            if self.incoherent_stokes_data.number_collapsed_channels is None:
-                    self.incoherent_stokes_data.number_collapsed_channels = self.channels_per_subband
-            output += '\n'+indent(self.incoherent_stokes_data.xml(), 2)
+            output += '\n'+indent(self.incoherent_stokes_data.xml(
+                channels_per_subband = self.channels_per_subband), 2)
         if self.coherent_stokes_data:
-            if self.coherent_stokes_data.number_collapsed_channels is None:
-                    self.coherent_stokes_data.number_collapsed_channels = self.channels_per_subband
-
-            output += '\n'+indent(self.coherent_stokes_data.xml(), 2)
+            output += '\n'+indent(self.coherent_stokes_data.xml(
+                channels_per_subband = self.channels_per_subband), 2)
 
         output += '''
 </stokes>
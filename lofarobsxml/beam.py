@@ -1,6 +1,8 @@
 from lofarobsxml.observationspecificationbase import ObservationSpecificationBase
 from lofarobsxml.momformats import mom_duration, check_mom_topology
-from lofarobsxml.utilities import parse_subband_list, indent
+from lofarobsxml.utilities import indent
+from lofarobsxml.subbands import SubbandSet, compress_subband_list
+from lofarobsxml.frequencies import bandwidth_mhz, central_frequency_mhz
 
 class Beam(ObservationSpecificationBase):
     r'''
@@ -20,7 +22,8 @@ class Beam(ObservationSpecificationBase):
 
     subband_spec : string or list of int
         Sub band specification for this beam. Examples: '77..324',
-        [100, 200]
+        [100, 200]. In lists, ascending runs of consecutive subbands
+        are compressed to 'start..stop' ranges; the order is kept.
 
     duration_s : None or number
         Duration during which the beam is active. None implies during
@@ -53,6 +56,8 @@ class Beam(ObservationSpecificationBase):
                                           ra_angle  = Angle(shms = ('+', 19, 59, 28.3566)),
                                           dec_angle = Angle(sdms = ('+', 40, 44, 2.097))),
          tied_array_beams  = None)
+    >>> Beam(0, target, [300, 301, 302, 100, 101, 102, 102]).subband_spec
+    '300..302,100..102,102'
     >>> observation_stub = ObservationSpecificationBase('Observation')
     >>> observation_stub.backend = BackendProcessing()
     >>> observation_stub.clock_mhz = 200
@@ -129,8 +134,8 @@ class Beam(ObservationSpecificationBase):
 
         if type(subband_spec) == type(''):
             self.subband_spec     = subband_spec
-        elif type(subband_spec) == type([]):
-            self.subband_spec = ','.join([str(sub) for sub in subband_spec])
+        elif type(subband_spec) in [type([]), type(())]:
+            self.subband_spec = compress_subband_list(subband_spec)
         else:
             raise ValueError('subband_spec(%r) is not a string list of ints' %
                              subband_spec)
@@ -220,16 +225,9 @@ class Beam(ObservationSpecificationBase):
                                                              self.storage_cluster,
                                                              self.storage_partition)
         
-        sub_bands     = parse_subband_list(self.subband_spec)
+        sub_bands     = SubbandSet.from_spec(self.subband_spec)
         if len(sub_bands) == 0:
-            raise('Empty subband list %r' % self.subband_spec)
-        bandwidth_mhz = len(sub_bands)*(self.parent.clock_mhz/1024.0)
-        mean_sub_band = sum(sub_bands)/float(len(sub_bands))
-        central_frequency_mhz = mean_sub_band*(self.parent.clock_mhz/1024.0)
-        if self.parent.frequency_range == 'HBA_LOW':
-            central_frequency_mhz += self.parent.clock_mhz/2.0
-        if self.parent.frequency_range in ['HBA_MID', 'HBA_HIGH']:
-            central_frequency_mhz += self.parent.clock_mhz
+            raise ValueError('Empty subband list %r' % self.subband_spec)
 
         parameters = {
             'backend_measurement_type' : backend.measurement_type(),
@@ -243,8 +241,10 @@ class Beam(ObservationSpecificationBase):
             'dec_deg'                  : self.target_source.dec_deg(),
             'reference_frame'          : self.target_source.reference_frame,
             'mom_duration'             : mom_duration(seconds = duration_s),
-            'bandwidth_mhz'            : bandwidth_mhz,
-            'central_frequency_mhz'    : central_frequency_mhz,
+            'bandwidth_mhz'            : bandwidth_mhz(sub_bands,
+                                                       self.parent.clock_mhz),
+            'central_frequency_mhz'    : central_frequency_mhz(
+                sub_bands, self.parent.clock_mhz, self.parent.frequency_range),
             'subband_spec'             : self.subband_spec,
             'tied_array_beams'         : tied_array_beams,
             'result_data_products'     : result_data_products,
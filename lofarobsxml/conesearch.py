@@ -0,0 +1,197 @@
+r'''
+Cone searches over source catalogues. Sources are binned in
+declination zones and sorted by right ascension within each zone, so
+that a query only inspects the sources in a small RA range of the few
+zones that overlap the cone.
+'''
+
+from math import pi, sin, cos, atan, sqrt, floor
+import numpy
+
+
+
+def unit_vectors(ra_rad, dec_rad):
+    r'''
+    Return an (N, 3) array of unit vectors for the given directions.
+
+    **Examples**
+
+    >>> unit_vectors(numpy.array([0.0, pi/2]), numpy.array([0.0, 0.0])).round(12)
+    array([[1., 0., 0.],
+           [0., 1., 0.]])
+    '''
+    ra_rad  = numpy.asarray(ra_rad, dtype=numpy.float64)
+    dec_rad = numpy.asarray(dec_rad, dtype=numpy.float64)
+    cos_dec = numpy.cos(dec_rad)
+    return numpy.column_stack([cos_dec*numpy.cos(ra_rad),
+                               cos_dec*numpy.sin(ra_rad),
+                               numpy.sin(dec_rad)])
+
+
+
+def ra_half_width_rad(dec_rad, radius_rad):
+    r'''
+    Return the largest RA offset of any point within ``radius_rad``
+    of a direction at declination ``dec_rad``. Returns pi if the cone
+    contains a celestial pole.
+
+    **Examples**
+
+    >>> '%.6f' % ra_half_width_rad(0.0, 0.01)
+    '0.010000'
+    >>> '%.6f' % ra_half_width_rad(pi/3, 0.01)
+    '0.020001'
+    >>> ra_half_width_rad(1.5, 0.1) == pi
+    True
+    '''
+    if abs(dec_rad) + radius_rad >= pi/2:
+        return pi
+    return atan(sin(radius_rad)/
+                sqrt(abs(cos(dec_rad - radius_rad)*cos(dec_rad + radius_rad))))
+
+
+
+class ConeSearchIndex(object):
+    r'''
+    Spatial index for cone searches.
+
+    **Parameters**
+
+    ra_rad : array of floats
+        Right ascensions of the sources in radians.
+
+    dec_rad : array of floats
+        Declinations of the sources in radians.
+
+    zone_height_rad : float
+        Height of the declination zones. Choose it similar to the
+        typical search radius. Default: 1 degree.
+
+    **Examples**
+
+    >>> ra  = numpy.radians([10.0, 10.5, 12.0, 190.0, 359.9])
+    >>> dec = numpy.radians([45.0, 45.2, 45.0, -30.0, 45.0])
+    >>> index = ConeSearchIndex(ra, dec)
+    >>> rows, separations = index.query(numpy.radians(10.0),
+    ...                                 numpy.radians(45.0),
+    ...                                 numpy.radians(1.5))
+    >>> rows.tolist(), numpy.degrees(separations).round(3).tolist()
+    ([0, 1, 2], [0.0, 0.406, 1.414])
+
+    Cones wrap around RA = 0:
+
+    >>> rows, separations = index.query(0.0, numpy.radians(45.0),
+    ...                                 numpy.radians(0.5))
+    >>> rows.tolist()
+    [4]
+
+    Many pointings at once:
+
+    >>> results = index.query_many(numpy.radians([10.0, 190.0]),
+    ...                            numpy.radians([45.0, -30.0]),
+    ...                            numpy.radians(0.2))
+    >>> [rows.tolist() for rows, separations in results]
+    [[0], [3]]
+    '''
+    def __init__(self, ra_rad, dec_rad, zone_height_rad=pi/180.0):
+        ra_rad  = numpy.mod(numpy.asarray(ra_rad, dtype=numpy.float64), 2*pi)
+        dec_rad = numpy.asarray(dec_rad, dtype=numpy.float64)
+        self.zone_height_rad = zone_height_rad
+        self.num_zones = int(floor(pi/zone_height_rad)) + 1
+        zones = self.zone_of(dec_rad)
+        self.order   = numpy.lexsort((ra_rad, zones))
+        self.ra_rad  = ra_rad[self.order]
+        self.vectors = unit_vectors(ra_rad, dec_rad)[self.order]
+        self.zone_start = numpy.searchsorted(zones[self.order],
+                                             numpy.arange(self.num_zones + 1))
+
+
+    def __len__(self):
+        return len(self.order)
+
+
+    def zone_of(self, dec_rad):
+        r'''
+        Return the zone number(s) of ``dec_rad``.
+        '''
+        zones = numpy.floor((numpy.asarray(dec_rad) + pi/2)/
+                            self.zone_height_rad).astype(numpy.int64)
+        return numpy.clip(zones, 0, self.num_zones - 1)
+
+
+    def candidates(self, ra_rad, dec_rad, radius_rad):
+        r'''
+        Return positions, in sorted order, of all sources in the zones
+        and RA ranges that overlap the cone.
+        '''
+        first_zone = int(self.zone_of(dec_rad - radius_rad))
+        last_zone  = int(self.zone_of(dec_rad + radius_rad))
+        half_width = ra_half_width_rad(dec_rad, radius_rad)
+        ra_rad     = ra_rad % (2*pi)
+        if half_width >= pi:
+            ra_ranges = [(0.0, 2*pi)]
+        elif ra_rad - half_width < 0.0:
+            ra_ranges = [(0.0, ra_rad + half_width),
+                         (ra_rad - half_width + 2*pi, 2*pi)]
+        elif ra_rad + half_width > 2*pi:
+            ra_ranges = [(0.0, ra_rad + half_width - 2*pi),
+                         (ra_rad - half_width, 2*pi)]
+        else:
+            ra_ranges = [(ra_rad - half_width, ra_rad + half_width)]
+
+        slices = []
+        for zone in range(first_zone, last_zone + 1):
+            start, end = self.zone_start[zone], self.zone_start[zone + 1]
+            if start == end:
+                continue
+            zone_ra = self.ra_rad[start:end]
+            for ra_min, ra_max in ra_ranges:
+                low  = start + numpy.searchsorted(zone_ra, ra_min, 'left')
+                high = start + numpy.searchsorted(zone_ra, ra_max, 'right')
+                if high > low:
+                    slices.append(numpy.arange(low, high))
+        if len(slices) == 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+        return numpy.concatenate(slices)
+
+
+    def query(self, ra_rad, dec_rad, radius_rad):
+        r'''
+        Find all sources within ``radius_rad`` of (``ra_rad``,
+        ``dec_rad``).
+
+        **Returns**
+
+        A tuple (rows, separations_rad) of arrays, sorted by
+        separation. ``rows`` are indices into the arrays the index was
+        built from.
+        '''
+        positions = self.candidates(float(ra_rad), float(dec_rad),
+                                    float(radius_rad))
+        centre    = unit_vectors(ra_rad, dec_rad)[0]
+        chords    = numpy.sqrt(((self.vectors[positions] - centre)**2).sum(axis=1))
+        max_chord = 2*sin(min(float(radius_rad), pi)/2)
+        inside    = chords <= max_chord
+        positions = positions[inside]
+        separations = 2*numpy.arcsin(numpy.clip(chords[inside]/2, 0.0, 1.0))
+        ordering  = numpy.argsort(separations, kind='stable')
+        return self.order[positions[ordering]], separations[ordering]
+
+
+    def query_many(self, ra_rad, dec_rad, radius_rad):
+        r'''
+        Run ``query()`` for every direction in the arrays ``ra_rad``
+        and ``dec_rad``. ``radius_rad`` is either a scalar or an array
+        of the same length.
+
+        **Returns**
+
+        A list of (rows, separations_rad) tuples.
+        '''
+        ra_rad     = numpy.atleast_1d(numpy.asarray(ra_rad, dtype=numpy.float64))
+        dec_rad    = numpy.atleast_1d(numpy.asarray(dec_rad, dtype=numpy.float64))
+        radius_rad = numpy.broadcast_to(numpy.asarray(radius_rad,
+                                                      dtype=numpy.float64),
+                                        ra_rad.shape)
+        return [self.query(ra, dec, radius)
+                for ra, dec, radius in zip(ra_rad, dec_rad, radius_rad)]
@@ -0,0 +1,292 @@
+r'''
+Estimates of the data rates and data volumes that observations
+produce, per data product: correlated visibilities ('uv'), coherent
+Stokes ('cs') and incoherent Stokes ('is'). All beams in a project are
+evaluated in one vectorised pass.
+'''
+
+import numpy
+
+from .observationspecificationbase import walk_tree
+from .observation import Observation
+from .folder import Folder
+from .beam import Beam
+from .subbands import SubbandSet
+from .stationpositions import num_baselines
+
+
+DATA_PRODUCTS = ['uv', 'cs', 'is']
+
+# Four complex64 correlations per visibility. Weights, flags and
+# other metadata are not counted.
+UV_BYTES_PER_VISIBILITY = 4*8
+
+# One float32 per Stokes parameter or voltage component
+STOKES_BYTES_PER_SAMPLE = 4
+
+STOKES_PARAMETERS = {'I': 1, 'IQUV': 4, 'XXYY': 4}
+
+# Throughput limits in bytes per second, per data product and for
+# the sum of all products.
+DEFAULT_THROUGHPUT_LIMITS = {'uv'   : 2.0e9,
+                             'cs'   : 4.0e9,
+                             'is'   : 1.0e9,
+                             'total': 5.0e9}
+
+
+
+def number_of_tabs(tied_array_beams, num_stations):
+    r'''
+    Number of coherent tied array beams in one SAP. Fly's eye mode
+    yields one beam per station. Otherwise, every explicit direction
+    adds one beam, and ``nr_tab_rings`` hexagonal rings add
+    3r(r+1) + 1 beams.
+
+    **Examples**
+
+    >>> from lofarobsxml.backend import TiedArrayBeams
+    >>> number_of_tabs(TiedArrayBeams(flyseye = True), 24)
+    24
+    >>> number_of_tabs(TiedArrayBeams(nr_tab_rings = 2), 24)
+    19
+    >>> number_of_tabs(TiedArrayBeams(beams_ra_dec_rad = [(0.1, 0.2)]), 24)
+    1
+    '''
+    if tied_array_beams is None:
+        return 0
+    if tied_array_beams.flyseye:
+        return num_stations
+    rings = tied_array_beams.nr_tab_rings
+    num_tabs = len(tied_array_beams.beams_ra_dec_rad or [])
+    if rings > 0:
+        num_tabs += 3*rings*(rings + 1) + 1
+    return num_tabs
+
+
+
+def stokes_settings(stokes, channels_per_subband):
+    r'''
+    Return (enabled, parameters, output channels, downsampling steps)
+    for a Stokes instance or None.
+    '''
+    if stokes is None:
+        return (0, 0, channels_per_subband, 1)
+    return (1, STOKES_PARAMETERS[stokes.polarizations],
+            stokes.number_collapsed_channels or channels_per_subband,
+            stokes.stokes_downsampling_steps)
+
+
+
+def observation_settings(observation):
+    r'''
+    Return the numbers from an observation and its backend that
+    determine its data rates, in the order used by
+    ``estimate_data_volumes()``.
+    '''
+    backend  = observation.backend
+    channels = backend.channels_per_subband
+    return ((observation.clock_mhz, channels,
+             int(bool(backend.correlated_data)),
+             backend.integration_time_seconds) +
+            stokes_settings(backend.coherent_stokes_data, channels) +
+            stokes_settings(backend.incoherent_stokes_data, channels))
+
+
+
+class DataVolumeEstimate(object):
+    r'''
+    Data rates and volumes of a list of observations.
+
+    **Attributes**
+
+    observations : list of Observation
+        The observations, in tree order.
+
+    rate_bytes_per_s : dict of arrays
+        For every data product in DATA_PRODUCTS, the data rate of
+        every observation.
+
+    volume_bytes : dict of arrays
+        Likewise, the total data volume of every observation.
+
+    folders : list of Folder
+        Every Folder in the trees, in tree order.
+
+    folder_volume_bytes : dict of arrays
+        For every data product, the total volume of all observations
+        below every folder.
+    '''
+    def __init__(self, observations, rate_bytes_per_s, volume_bytes,
+                 folders, folder_volume_bytes):
+        self.observations        = observations
+        self.rate_bytes_per_s    = rate_bytes_per_s
+        self.volume_bytes        = volume_bytes
+        self.folders             = folders
+        self.folder_volume_bytes = folder_volume_bytes
+
+
+    def total_rate_bytes_per_s(self):
+        r'''
+        Return the summed rate of all data products per observation.
+        '''
+        return sum([self.rate_bytes_per_s[product] for product in DATA_PRODUCTS])
+
+
+    def total_volume_bytes(self):
+        r'''
+        Return the summed volume of all data products per observation.
+        '''
+        return sum([self.volume_bytes[product] for product in DATA_PRODUCTS])
+
+
+    def exceeding(self, limits_bytes_per_s=None):
+        r'''
+        Find observations with a data rate above a throughput limit.
+
+        **Parameters**
+
+        limits_bytes_per_s : None or dict
+            Limits per data product and/or 'total'. Missing keys are
+            not checked. Default: DEFAULT_THROUGHPUT_LIMITS.
+
+        **Returns**
+
+        A list of (observation, product, rate_bytes_per_s, limit)
+        tuples, ordered by observation.
+        '''
+        if limits_bytes_per_s is None:
+            limits_bytes_per_s = DEFAULT_THROUGHPUT_LIMITS
+        rates = dict(self.rate_bytes_per_s)
+        rates['total'] = self.total_rate_bytes_per_s()
+        flagged = []
+        for product in DATA_PRODUCTS + ['total']:
+            if product not in limits_bytes_per_s:
+                continue
+            limit = limits_bytes_per_s[product]
+            for index in numpy.flatnonzero(rates[product] > limit):
+                flagged.append((index, product, float(rates[product][index]), limit))
+        return [(self.observations[index], product, rate, limit)
+                for index, product, rate, limit in sorted(
+                    flagged, key=lambda flag: flag[0])]
+
+
+
+def estimate_data_volumes(items):
+    r'''
+    Estimate data rates and volumes of all Observations in the trees
+    rooted at ``items``.
+
+    **Returns**
+
+    A DataVolumeEstimate.
+
+    **Examples**
+
+    >>> from lofarobsxml import TargetSource, Angle, station_list
+    >>> from lofarobsxml.backend import BackendProcessing, Stokes, TiedArrayBeams
+    >>> target = TargetSource('3C 196', Angle(hms = (8, 13, 36.0)),
+    ...                       Angle(sdms = ('+', 48, 13, 3.0)))
+    >>> def observe(backend, stations, duration_seconds = 3600):
+    ...     return Observation('HBA_DUAL', 'HBA_LOW', (2013, 10, 20, 18, 0, 0),
+    ...                        duration_seconds, stations = stations,
+    ...                        clock_mhz = 200, backend = backend,
+    ...                        beam_list = [Beam(0, target, '77..320')])
+    >>> imaging = BackendProcessing(integration_time_seconds = 1)
+    >>> pulsar  = BackendProcessing(
+    ...     correlated_data = False, channels_per_subband = 16,
+    ...     coherent_stokes_data   = Stokes('coherent', polarizations = 'IQUV',
+    ...                                     stokes_downsampling_steps = 8),
+    ...     incoherent_stokes_data = Stokes('incoherent',
+    ...                                     stokes_downsampling_steps = 8),
+    ...     tied_array_beams = TiedArrayBeams(nr_tab_rings = 2))
+    >>> folder = Folder('Season', children = [
+    ...     Folder('Imaging', children = [observe(imaging, station_list('nl'))]),
+    ...     Folder('Pulsars', children = [observe(pulsar, station_list('core'), 600)])])
+    >>> estimate = estimate_data_volumes([folder])
+    >>> for product in DATA_PRODUCTS:
+    ...     print(product, (estimate.rate_bytes_per_s[product]/1e6).round(1).tolist())
+    uv [370.3, 0.0]
+    cs [0.0, 1810.9]
+    is [0.0, 23.8]
+    >>> (estimate.total_volume_bytes()/1e9).round(1).tolist()
+    [1333.0, 1100.9]
+    >>> [(folder.name, round(float(estimate.folder_volume_bytes['cs'][index])/1e9, 1))
+    ...  for index, folder in enumerate(estimate.folders)]
+    [('Season', 1086.6), ('Imaging', 0.0), ('Pulsars', 1086.6)]
+    >>> [(obs.label(), product) for obs, product, rate, limit
+    ...  in estimate.exceeding({'cs': 1e9, 'total': 1e9})]
+    [('Season.1.Pulsars.0', 'cs'), ('Season.1.Pulsars.0', 'total')]
+    '''
+    nodes        = list(walk_tree(items))
+    observations = [node for node in nodes if isinstance(node, Observation)]
+    folders      = [node for node in nodes if isinstance(node, Folder)]
+
+    # One row per (observation, beam)
+    observation_index, num_subbands, duration_s = [], [], []
+    num_stations, num_tabs = [], []
+    for index, observation in enumerate(observations):
+        for beam in observation.children or []:
+            if not isinstance(beam, Beam):
+                continue
+            tied_array_beams = (beam.tied_array_beams or
+                                observation.backend.tied_array_beams)
+            observation_index.append(index)
+            num_subbands.append(len(SubbandSet.from_spec(beam.subband_spec)))
+            duration_s.append(observation.duration_seconds
+                              if beam.duration_s is None else beam.duration_s)
+            num_stations.append(len(observation.stations))
+            num_tabs.append(number_of_tabs(tied_array_beams,
+                                           len(observation.stations)))
+    observation_index = numpy.array(observation_index, dtype=numpy.int64)
+    num_subbands = numpy.array(num_subbands, dtype=numpy.float64)
+    duration_s   = numpy.array(duration_s, dtype=numpy.float64)
+    num_stations = numpy.array(num_stations, dtype=numpy.int64)
+    num_tabs     = numpy.array(num_tabs, dtype=numpy.float64)
+
+    # Per-observation settings, broadcast to beams
+    settings = numpy.array([observation_settings(observation)
+                            for observation in observations],
+                           dtype=numpy.float64).reshape((-1, 12))
+    (clock_mhz, channels, correlated, integration_s,
+     cs_enabled, cs_parameters, cs_channels, cs_steps,
+     is_enabled, is_parameters, is_channels, is_steps) = \
+        settings[observation_index].T
+    subband_rate_hz = clock_mhz*1e6/1024.0
+
+    uv_rate = (correlated*num_baselines(num_stations, autocorrelations=True)*
+               num_subbands*channels*UV_BYTES_PER_VISIBILITY/integration_s)
+    cs_rate = (cs_enabled*num_tabs*num_subbands*cs_parameters*
+               subband_rate_hz*cs_channels/channels/cs_steps*
+               STOKES_BYTES_PER_SAMPLE)
+    is_rate = (is_enabled*num_subbands*is_parameters*
+               subband_rate_hz*is_channels/channels/is_steps*
+               STOKES_BYTES_PER_SAMPLE)
+
+    rate_bytes_per_s, volume_bytes = {}, {}
+    for product, beam_rate in zip(DATA_PRODUCTS, [uv_rate, cs_rate, is_rate]):
+        rate_bytes_per_s[product] = numpy.bincount(
+            observation_index, weights=beam_rate, minlength=len(observations))
+        volume_bytes[product] = numpy.bincount(
+            observation_index, weights=beam_rate*duration_s,
+            minlength=len(observations))
+
+    # Folder totals: one (folder, observation) pair per ancestor
+    folder_ids = dict([(id(folder), index) for index, folder in enumerate(folders)])
+    pair_folder, pair_observation = [], []
+    for index, observation in enumerate(observations):
+        ancestor = observation.parent
+        while ancestor is not None:
+            if id(ancestor) in folder_ids:
+                pair_folder.append(folder_ids[id(ancestor)])
+                pair_observation.append(index)
+            ancestor = ancestor.parent
+    pair_folder      = numpy.array(pair_folder, dtype=numpy.int64)
+    pair_observation = numpy.array(pair_observation, dtype=numpy.int64)
+    folder_volume_bytes = {}
+    for product in DATA_PRODUCTS:
+        folder_volume_bytes[product] = numpy.bincount(
+            pair_folder, weights=volume_bytes[product][pair_observation],
+            minlength=len(folders))
+
+    return DataVolumeEstimate(observations, rate_bytes_per_s, volume_bytes,
+                              folders, folder_volume_bytes)
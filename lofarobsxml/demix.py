@@ -0,0 +1,215 @@
+r'''
+Advice on which A-team sources NDPPP should demix. For every
+AveragingPipeline in a project, the elevation of the A-team sources
+during the input observation, and their angular distance to the input
+beams, are computed in one vectorised pass over all pipelines.
+'''
+
+import numpy
+import ephem
+
+from .angles import Angle
+from .utilities import lofar_sidereal_times, elevation_rad
+from .observationspecificationbase import walk_tree
+from .pipelines import AveragingPipeline
+
+
+A_TEAM = [['CasA'  , (23, 23, 24.00), ('+', 58, 48, 54.0)],
+          ['CygA'  , (19, 59, 28.36), ('+', 40, 44,  2.1)],
+          ['TauA'  , ( 5, 34, 31.94), ('+', 22,  0, 52.2)],
+          ['HydraA', ( 9, 18,  5.65), ('-', 12,  5, 43.9)],
+          ['VirA'  , (12, 30, 49.42), ('+', 12, 23, 28.0)],
+          ['HerA'  , (16, 51,  8.15), ('+',  4, 59, 33.3)]]
+
+A_TEAM_NAMES   = [name for name, _, _ in A_TEAM]
+A_TEAM_RA_RAD  = numpy.array([Angle(hms=ra).as_rad() for _, ra, _ in A_TEAM])
+A_TEAM_DEC_RAD = numpy.array([Angle(sdms=dec).as_rad() for _, _, dec in A_TEAM])
+
+
+
+def angular_distance_rad(ra_1, dec_1, ra_2, dec_2):
+    r'''
+    Great circle distance between directions, using the haversine
+    formula. The arguments broadcast against each other.
+
+    **Examples**
+
+    >>> '%.4f' % numpy.degrees(angular_distance_rad(0.0, 0.0, numpy.pi/2, 0.0))
+    '90.0000'
+    >>> '%.4f' % numpy.degrees(angular_distance_rad(1.0, numpy.pi/2, 2.0, numpy.pi/4))
+    '45.0000'
+    '''
+    sin_ddec = numpy.sin((dec_2 - dec_1)/2.0)
+    sin_dra  = numpy.sin((ra_2 - ra_1)/2.0)
+    hav = sin_ddec**2 + numpy.cos(dec_1)*numpy.cos(dec_2)*sin_dra**2
+    return 2*numpy.arcsin(numpy.sqrt(numpy.clip(hav, 0.0, 1.0)))
+
+
+
+class DemixAdvice(object):
+    r'''
+    Proposed demixing settings for one AveragingPipeline.
+
+    **Parameters**
+
+    pipeline : AveragingPipeline
+        The pipeline the advice applies to.
+
+    demix_always : list of strings
+        A-team sources to always demix.
+
+    demix_if_needed : list of strings
+        A-team sources to demix if needed.
+
+    max_elevation_deg : dict
+        Highest elevation of each A-team source during the input
+        observation.
+
+    min_distance_deg : dict
+        Smallest distance of each A-team source to any input beam.
+    '''
+    def __init__(self, pipeline, demix_always, demix_if_needed,
+                 max_elevation_deg, min_distance_deg):
+        self.pipeline          = pipeline
+        self.demix_always      = demix_always
+        self.demix_if_needed   = demix_if_needed
+        self.max_elevation_deg = max_elevation_deg
+        self.min_distance_deg  = min_distance_deg
+
+
+    def __repr__(self):
+        return ('DemixAdvice(%r, demix_always = %r, demix_if_needed = %r)' %
+                (self.pipeline.name, self.demix_always, self.demix_if_needed))
+
+
+    def apply(self):
+        r'''
+        Give the pipeline NDPPP settings with the proposed demix
+        lists. NDPPP instances are immutable and shared, so the
+        pipeline gets the instance for the modified settings.
+        '''
+        self.pipeline.ndppp = self.pipeline.ndppp.replace(
+            demix_always    = self.demix_always or None,
+            demix_if_needed = self.demix_if_needed or None)
+        return self.pipeline
+
+
+
+def advise_demixing(items,
+                    in_field_radius_deg     = 3.0,
+                    always_elevation_deg    = 30.0,
+                    if_needed_elevation_deg = 0.0,
+                    num_samples             = 7):
+    r'''
+    Propose demix lists for every AveragingPipeline in the trees
+    rooted at ``items``.
+
+    An A-team source within ``in_field_radius_deg`` of an input beam
+    is the target, or in the field of view, and is never demixed. Other
+    sources are demixed always if they rise above
+    ``always_elevation_deg`` during the observation, and if needed if
+    they rise above ``if_needed_elevation_deg``.
+
+    **Parameters**
+
+    items : list of ObservationSpecificationBase
+        Root nodes of the project, e.g. Folders.
+
+    num_samples : int
+        Number of equally spaced times, including start and end, at
+        which elevations are evaluated for each observation.
+
+    **Returns**
+
+    A list of DemixAdvice instances, in tree order.
+
+    **Examples**
+
+    >>> from lofarobsxml             import TargetSource, Angle, Folder
+    >>> from lofarobsxml.backend     import BackendProcessing
+    >>> from lofarobsxml.observation import Observation
+    >>> from lofarobsxml.beam        import Beam
+    >>> from lofarobsxml.pipelines   import NDPPP
+    >>> def observe(target, start_date):
+    ...     obs = Observation('HBA_DUAL', 'HBA_LOW', start_date,
+    ...                       duration_seconds = 3600, name = target.name,
+    ...                       stations  = ['CS001', 'CS002'], clock_mhz = 200,
+    ...                       bit_mode  = 8,
+    ...                       beam_list = [Beam(0, target, '77..324')],
+    ...                       backend   = BackendProcessing())
+    ...     obs.append_child(AveragingPipeline(name = 'avg', ndppp = NDPPP(),
+    ...                                        input_data = obs.children[:1]))
+    ...     return obs
+    >>> cyg_a = TargetSource('Cyg A', Angle(hms = (19, 59, 28.36)),
+    ...                      Angle(sdms = ('+', 40, 44, 2.1)))
+    >>> three_c_196 = TargetSource('3C 196', Angle(hms = (8, 13, 36.0)),
+    ...                            Angle(sdms = ('+', 48, 13, 3.0)))
+    >>> folder = Folder('Obs', children = [
+    ...     observe(cyg_a, (2013, 10, 20, 18, 0, 0)),
+    ...     observe(three_c_196, (2013, 10, 21, 4, 0, 0))])
+    >>> advice = advise_demixing([folder])
+    >>> advice[0].demix_always, advice[0].demix_if_needed
+    (['CasA'], ['HerA'])
+    >>> advice[1].demix_always, advice[1].demix_if_needed
+    (['CasA', 'TauA'], ['CygA', 'HydraA', 'VirA'])
+    >>> int(round(advice[0].min_distance_deg['CygA']))
+    0
+    >>> advice[1].apply().ndppp.demix_always
+    ('CasA', 'TauA')
+    '''
+    pipelines = [node for node in walk_tree(items)
+                 if isinstance(node, AveragingPipeline) and node.input_data]
+    if len(pipelines) == 0:
+        return []
+
+    # Sample times of every pipeline's input observation: (P, S)
+    observations = [pipeline.input_data[0].parent for pipeline in pipelines]
+    start_days   = numpy.array([float(ephem.Date(obs.start_date))
+                                for obs in observations])
+    duration_days = numpy.array([obs.duration_seconds
+                                 for obs in observations])*ephem.second
+    fractions  = numpy.linspace(0.0, 1.0, max(num_samples, 1))
+    sample_days = (start_days[:, numpy.newaxis] +
+                   duration_days[:, numpy.newaxis]*fractions[numpy.newaxis, :])
+
+    # Elevations: (P, S, A) -> highest per pipeline and source: (P, A)
+    lsts = lofar_sidereal_times(sample_days)
+    elevations_deg = numpy.degrees(elevation_rad(
+        A_TEAM_RA_RAD, A_TEAM_DEC_RAD, lsts[:, :, numpy.newaxis]))
+    max_elevation_deg = elevations_deg.max(axis=1)
+
+    # Distances from every input beam to the A-team: (B, A), reduced
+    # per pipeline to (P, A)
+    beam_pipeline = []
+    beam_ra, beam_dec = [], []
+    for pipeline_id, pipeline in enumerate(pipelines):
+        for beam in pipeline.input_data:
+            ra_rad, dec_rad = beam.target_source.ra_dec_rad()
+            beam_pipeline.append(pipeline_id)
+            beam_ra.append(ra_rad)
+            beam_dec.append(dec_rad)
+    distances_deg = numpy.degrees(angular_distance_rad(
+        numpy.array(beam_ra)[:, numpy.newaxis],
+        numpy.array(beam_dec)[:, numpy.newaxis],
+        A_TEAM_RA_RAD[numpy.newaxis, :], A_TEAM_DEC_RAD[numpy.newaxis, :]))
+    first_beam = numpy.searchsorted(beam_pipeline, numpy.arange(len(pipelines)))
+    min_distance_deg = numpy.minimum.reduceat(distances_deg, first_beam, axis=0)
+
+    outside_field = min_distance_deg > in_field_radius_deg
+    always    = outside_field & (max_elevation_deg > always_elevation_deg)
+    if_needed = (outside_field & ~always &
+                 (max_elevation_deg > if_needed_elevation_deg))
+
+    advice = []
+    for pipeline_id, pipeline in enumerate(pipelines):
+        advice.append(DemixAdvice(
+            pipeline,
+            demix_always    = [name for name, flag
+                               in zip(A_TEAM_NAMES, always[pipeline_id]) if flag],
+            demix_if_needed = [name for name, flag
+                               in zip(A_TEAM_NAMES, if_needed[pipeline_id]) if flag],
+            max_elevation_deg = dict(zip(A_TEAM_NAMES,
+                                         max_elevation_deg[pipeline_id].tolist())),
+            min_distance_deg  = dict(zip(A_TEAM_NAMES,
+                                         min_distance_deg[pipeline_id].tolist()))))
+    return advice
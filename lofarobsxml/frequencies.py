@@ -0,0 +1,219 @@
+r'''
+Mapping between subbands and sky frequencies. A station samples at
+the clock frequency and splits each Nyquist zone into 512 subbands,
+so subband ``sb`` observed through a frequency_range filter in Nyquist
+zone ``n`` is centred at ``(n - 1)*clock/2 + sb*clock/1024`` MHz.
+'''
+
+import numpy
+
+from .momformats import mom_frequency_range
+from .observationspecificationbase import walk_tree
+from .subbands import SubbandSet
+
+
+SUBBANDS_PER_NYQUIST_ZONE = 512
+
+NYQUIST_ZONES = {'LBA_LOW' : 1,
+                 'LBA_HIGH': 1,
+                 'HBA_LOW' : 2,
+                 'HBA_MID' : 3,
+                 'HBA_HIGH': 3}
+
+VALID_CLOCKS_MHZ = [160, 200]
+
+
+
+def filter_band_mhz(frequency_range, clock_mhz):
+    r'''
+    Return the (low, high) edges in MHz of the analogue filter for
+    ``frequency_range`` at ``clock_mhz``, as given by
+    ``mom_frequency_range()``.
+
+    **Raises**
+
+    KeyError
+        If the combination does not exist.
+
+    **Examples**
+
+    >>> filter_band_mhz('HBA_LOW', 200)
+    (110.0, 190.0)
+    >>> filter_band_mhz('LBA_HIGH', 160)
+    (30.0, 70.0)
+    '''
+    low, high = mom_frequency_range(frequency_range, clock_mhz).split()[0].split('-')
+    return (float(low), float(high))
+
+
+FILTER_BANDS_MHZ = {}
+for _clock_mhz in VALID_CLOCKS_MHZ:
+    for _frequency_range in NYQUIST_ZONES:
+        try:
+            FILTER_BANDS_MHZ[(_clock_mhz, _frequency_range)] = filter_band_mhz(
+                _frequency_range, _clock_mhz)
+        except KeyError:
+            pass
+
+
+
+def subband_width_mhz(clock_mhz):
+    r'''
+    Width of one subband in MHz. Works on arrays too.
+
+    **Examples**
+
+    >>> subband_width_mhz(200)
+    0.1953125
+    '''
+    return clock_mhz/1024.0
+
+
+
+def subband_frequencies_mhz(subbands, clock_mhz, frequency_range):
+    r'''
+    Centre frequencies in MHz of ``subbands``.
+
+    **Parameters**
+
+    subbands : int, array of ints, or SubbandSet
+        Subband numbers.
+
+    clock_mhz : int or array of ints
+        Clock frequency, 160 or 200. Broadcasts against ``subbands``.
+
+    frequency_range : string
+        One of the keys of ``NYQUIST_ZONES``.
+
+    **Returns**
+
+    A float or array of floats.
+
+    **Examples**
+
+    >>> subband_frequencies_mhz([77, 324], 200, 'HBA_LOW').tolist()
+    [115.0390625, 163.28125]
+    >>> subband_frequencies_mhz(numpy.array([[100], [300]]), [160, 200],
+    ...                         'LBA_LOW').tolist()
+    [[15.625, 19.53125], [46.875, 58.59375]]
+    >>> float(subband_frequencies_mhz(256, 160, 'HBA_MID'))
+    200.0
+    '''
+    if isinstance(subbands, SubbandSet):
+        subbands = subbands.subbands()
+    clock_mhz = numpy.asarray(clock_mhz, dtype=numpy.float64)
+    zone_offset_mhz = (NYQUIST_ZONES[frequency_range] - 1)*clock_mhz/2.0
+    return (zone_offset_mhz +
+            numpy.asarray(subbands, dtype=numpy.float64)*subband_width_mhz(clock_mhz))
+
+
+
+def bandwidth_mhz(subband_set, clock_mhz):
+    r'''
+    Total bandwidth in MHz of a SubbandSet, counting multiplicity.
+
+    **Examples**
+
+    >>> bandwidth_mhz(SubbandSet.from_spec('77..324'), 200)
+    48.4375
+    '''
+    return len(subband_set)*subband_width_mhz(clock_mhz)
+
+
+
+def central_frequency_mhz(subband_set, clock_mhz, frequency_range):
+    r'''
+    Frequency in MHz of the mean subband of a SubbandSet.
+
+    **Examples**
+
+    >>> '%.4f' % central_frequency_mhz(SubbandSet.from_spec('77..324'),
+    ...                                200, 'HBA_LOW')
+    '139.1602'
+    '''
+    return float(subband_frequencies_mhz(subband_set.mean(), clock_mhz,
+                                         frequency_range))
+
+
+
+def subbands_outside_filter_band(subbands, clock_mhz, frequency_range):
+    r'''
+    Return the subbands, as an array, whose centre frequency lies
+    outside the filter band of ``frequency_range`` at ``clock_mhz``
+    or outside the Nyquist zone.
+
+    **Examples**
+
+    >>> subbands_outside_filter_band(numpy.arange(0, 512, 50), 200,
+    ...                              'LBA_LOW').tolist()
+    [0, 50, 500]
+    >>> subbands_outside_filter_band(SubbandSet.from_spec('77..324'),
+    ...                              200, 'HBA_LOW').tolist()
+    []
+    '''
+    if isinstance(subbands, SubbandSet):
+        subbands = subbands.subbands()
+    subbands = numpy.asarray(subbands, dtype=numpy.int64)
+    low_mhz, high_mhz = FILTER_BANDS_MHZ[(clock_mhz, frequency_range)]
+    frequencies_mhz = subband_frequencies_mhz(subbands, clock_mhz, frequency_range)
+    outside = ((frequencies_mhz < low_mhz) | (frequencies_mhz > high_mhz) |
+               (subbands < 0) | (subbands >= SUBBANDS_PER_NYQUIST_ZONE))
+    return subbands[outside]
+
+
+
+def beams_outside_filter_band(items):
+    r'''
+    Find all Beams in the trees rooted at ``items`` with subbands
+    outside their observation's filter band or Nyquist zone. Only the
+    lowest and highest subband of every beam are evaluated, in one
+    vectorised pass per frequency_range.
+
+    **Returns**
+
+    A list of (beam, low_mhz, high_mhz) tuples with the frequency
+    extent of every offending beam.
+
+    **Examples**
+
+    >>> from lofarobsxml             import TargetSource, Angle, Folder
+    >>> from lofarobsxml.backend     import BackendProcessing
+    >>> from lofarobsxml.observation import Observation
+    >>> from lofarobsxml.beam        import Beam
+    >>> target = TargetSource('3C 196', Angle(hms = (8, 13, 36.0)),
+    ...                       Angle(sdms = ('+', 48, 13, 3.0)))
+    >>> def observe(frequency_range, subbands):
+    ...     return Observation('HBA_DUAL', frequency_range,
+    ...                        (2013, 10, 20, 18, 0, 0), 3600,
+    ...                        stations = ['CS001'], clock_mhz = 200, bit_mode = 8,
+    ...                        beam_list = [Beam(0, target, subbands)],
+    ...                        backend = BackendProcessing())
+    >>> folder = Folder('Obs', children = [observe('HBA_LOW', '77..324'),
+    ...                                    observe('HBA_LOW', '12..499'),
+    ...                                    observe('HBA_HIGH', '60..250')])
+    >>> [(beam.parent.frequency_range, '%.1f' % low, '%.1f' % high)
+    ...  for beam, low, high in beams_outside_filter_band([folder])]
+    [('HBA_LOW', '102.3', '197.5')]
+    '''
+    from .beam import Beam
+    by_range = {}
+    for node in walk_tree(items):
+        if isinstance(node, Beam):
+            by_range.setdefault(node.parent.frequency_range, []).append(node)
+
+    offending = []
+    for frequency_range, beams in sorted(by_range.items()):
+        subband_sets = [SubbandSet.from_spec(beam.subband_spec) for beam in beams]
+        clocks_mhz = numpy.array([beam.parent.clock_mhz for beam in beams])
+        first = numpy.array([subband_set.min() for subband_set in subband_sets])
+        last  = numpy.array([subband_set.max() for subband_set in subband_sets])
+        bands = numpy.array([FILTER_BANDS_MHZ[(int(clock), frequency_range)]
+                             for clock in clocks_mhz])
+        low_mhz  = subband_frequencies_mhz(first, clocks_mhz, frequency_range)
+        high_mhz = subband_frequencies_mhz(last, clocks_mhz, frequency_range)
+        outside = ((low_mhz < bands[:, 0]) | (high_mhz > bands[:, 1]) |
+                   (first < 0) | (last >= SUBBANDS_PER_NYQUIST_ZONE))
+        for index in numpy.flatnonzero(outside):
+            offending.append((beams[index], float(low_mhz[index]),
+                              float(high_mhz[index])))
+    return offending
@@ -1,5 +1,5 @@
 import copy
-from lofarobsxml.utilities  import parse_subband_list
+from lofarobsxml.subbands   import SubbandSet
 from lofarobsxml.momformats import mom_antenna_name_from_mac_name as mom_antenna_name
 from lofarobsxml.momformats import mom_frequency_range
 
@@ -224,7 +224,7 @@ class Beam(object):
         self.ra = ra
         self.dec = dec
         self.subband_spec = subband_spec
-        self.number_of_subbands = len(parse_subband_list(subband_spec))
+        self.number_of_subbands = len(SubbandSet.from_spec(subband_spec))
         self.pipeline = pipeline
 
 
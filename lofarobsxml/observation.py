@@ -1,10 +1,77 @@
 from lofarobsxml.observationspecificationbase import ObservationSpecificationBase
-from lofarobsxml.momformats   import mom_duration, mom_timestamp, mom_frequency_range
+from lofarobsxml.momformats   import mom_duration, mom_frequency_range
 from lofarobsxml.momformats   import mom_antenna_name_from_mac_name, check_mom_topology
 from lofarobsxml.targetsource import TargetSource
-from lofarobsxml.utilities    import validate_enumeration, indent
+from lofarobsxml.utilities    import validate_enumeration, indent, cache_setdefault
+from lofarobsxml.beam         import Beam
+from lofarobsxml.subbands     import SubbandSet
+from lofarobsxml.observationspecificationbase import walk_tree, TopologyIndex
+from lofarobsxml.timeline     import RenderSession, active_render_session
 from math import ceil
-import ephem
+
+
+# Number of beamlets available per bit mode
+BEAMLETS_PER_BIT_MODE = {16: 244, 8: 488, 4: 976}
+
+
+class BeamletBudgetError(ValueError):
+    r'''
+    Raised if the Beams of an Observation use more subbands than the
+    number of beamlets available in its bit mode.
+    '''
+
+
+
+# Interned station tuples, so that observations with the same
+# stations share one tuple.
+SHARED_STATION_TUPLES = {}
+
+# Rendered <stations> blocks, keyed by station tuple
+STATIONS_XML_CACHE = {}
+
+
+def shared_station_tuple(stations):
+    r'''
+    Return ``stations`` as a tuple. Equal station sequences yield the
+    same tuple object, as long as it remains in SHARED_STATION_TUPLES.
+
+    **Examples**
+
+    >>> from lofarobsxml.utilities import station_list
+    >>> nl = shared_station_tuple(station_list('nl'))
+    >>> shared_station_tuple(station_list('nl')) is nl
+    True
+    >>> shared_station_tuple(nl) is nl
+    True
+    >>> shared_station_tuple(['CS001', 'RS106'])
+    ('CS001', 'RS106')
+    '''
+    stations = tuple(stations)
+    return cache_setdefault(SHARED_STATION_TUPLES, stations, stations)
+
+
+def stations_xml(stations):
+    r'''
+    Return the ``<stations>`` block for a station tuple, indented for
+    inclusion in an observation's ``<userSpecification>``. The text is
+    rendered once per distinct tuple.
+
+    **Examples**
+
+    >>> print(stations_xml(('CS001', 'RS106')))
+          <stations>
+            <station name="CS001" />
+            <station name="RS106" />
+          </stations>
+    '''
+    try:
+        return STATIONS_XML_CACHE[stations]
+    except KeyError:
+        pass
+    block = ('      <stations>\n' +
+             ''.join(['        <station name=\"'+n+'\" />\n' for n in stations]) +
+             '      </stations>')
+    return cache_setdefault(STATIONS_XML_CACHE, stations, block)
 
 
 
@@ -24,11 +91,15 @@ class Observation(ObservationSpecificationBase):
         *duration_seconds*       : Observation duration in seconds
         *stations*               : List of stations, e.g. ['CS001', 'RS205', 'DE601']. An
                                    easy way to generate such a list is through the
-                                   utilities.station_list() function.
+                                   utilities.station_list() function. Stored as a
+                                   tuple that is shared with other Observations
+                                   using the same stations.
         *clock_mhz*              : An integer value of 200 or 160.
         *beam_list*              : A list of Beam objects, which contain source/subband
                                    specifications. Provide at least one beam.
-        *backend*                : BackendProcessing instance with correlator settings
+        *backend*                : BackendProcessing instance with correlator settings.
+                                   It becomes immutable, and may be shared by
+                                   many Observations.
         *name*                   : Name of the observation. Defaults to name of first target plus antenna set.
         *bit_mode*               : number of bits per sample. Either 4, 8, or 16.
         *initial_status*         : status when first imported into MoM. Either 'opened' or 'approved'
@@ -48,13 +119,14 @@ class Observation(ObservationSpecificationBase):
         self.antenna_set              = antenna_set
         self.frequency_range          = frequency_range
         self.duration_seconds         = duration_seconds
-        self.stations                 = stations
+        self.stations                 = shared_station_tuple(stations)
         self.clock_mhz                = int(clock_mhz)
         self.start_date               = start_date
         self.bit_mode                 = bit_mode
         self.allow_aartfaac           = allow_aartfaac
         self.allow_tbb                = allow_tbb
         self.backend                  = backend
+        self.backend.freeze()
         for beam in beam_list:
             self.append_child(beam)
         self.validate()
@@ -79,22 +151,32 @@ class Observation(ObservationSpecificationBase):
 
         if type(self.start_date) != type(tuple([])) or len(self.start_date) != 6:
             raise ValueError('Observation start_date must be a tuple of length 6; you provided %s'%(self.start_date,))
+        used, available = self.beamlet_usage()
+        if used > available:
+            raise BeamletBudgetError(beamlet_budget_message(self, used, available))
         pass
 
 
 
+    def beamlet_usage(self):
+        r'''
+        Return a tuple (used, available) with the number of subbands in
+        all child Beams, and the number of beamlets available in this
+        observation's bit mode.
+        '''
+        used = sum([len(SubbandSet.from_spec(child.subband_spec))
+                    for child in self.children if isinstance(child, Beam)])
+        return used, BEAMLETS_PER_BIT_MODE[self.bit_mode]
+
+
+
     def xml_prefix(self, project_name):
         obs_name = self.children[0].target_source.name+' '+self.antenna_set
         if self.name:
             obs_name = self.name
 
-        now = ephem.Observer().date
-
-        start_date = self.start_date
-        end_date = ephem.Date(ephem.Date(self.start_date) + ephem.second*(self.duration_seconds)).tuple()
-        rounded_start_date = start_date[:-1]+(int(round(start_date[-1])),)
-        rounded_end_date   = end_date[:-1]+(int(round(end_date[-1])),)
-        now = now.tuple()[:-1] + (int(round(now.tuple()[-1])),)
+        start_time, end_time = active_render_session().interval(
+            self.start_date, self.duration_seconds)
         topology = self.label()
         check_mom_topology(topology)
         
@@ -116,13 +198,11 @@ class Observation(ObservationSpecificationBase):
       <antenna>'''+mom_antenna_name_from_mac_name(self.antenna_set)+'''</antenna>
       <clock mode=\"'''+str(self.clock_mhz)+''' MHz\"/>
       <instrumentFilter>'''+mom_frequency_range(self.frequency_range, self.clock_mhz)+'''</instrumentFilter>
-'''+indent(self.backend.xml(), 6)+'''      <stationSet>Custom</stationSet>
-      <stations>
-        '''+'\n        '.join(['<station name=\"'+n+'\" />' for n in self.stations])+'''
-      </stations>
+'''+self.backend.xml_fragment(6)+'''      <stationSet>Custom</stationSet>
+'''+stations_xml(self.stations)+'''
       <timeFrame>UT</timeFrame>
-      <startTime>'''+mom_timestamp(*rounded_start_date)+'''</startTime>
-      <endTime>'''+mom_timestamp(*rounded_end_date)+'''</endTime>
+      <startTime>'''+start_time+'''</startTime>
+      <endTime>'''+end_time+'''</endTime>
       <duration>'''+mom_duration(seconds = self.duration_seconds)+'''</duration>
       <numberOfBitsPerSample>'''+str(self.bit_mode)+'''</numberOfBitsPerSample>
     </userSpecification>
@@ -138,11 +218,88 @@ class Observation(ObservationSpecificationBase):
 
 
 
+def beamlet_budget_message(observation, used, available):
+    r'''
+    Describe a beamlet budget violation.
+    '''
+    return ('Observation %r uses %d subbands in its beams, but only %d '
+            'beamlets are available in %d bit mode' %
+            (observation.name or observation.label(), used, available,
+             observation.bit_mode))
+
+
+
+def validate_beamlet_budgets(items):
+    r'''
+    Check the beamlet budget of every Observation in the trees rooted
+    at ``items``, for instance after beams were added to observations
+    after construction. ``xml()`` calls it before rendering.
+
+    **Returns**
+
+    True if all observations fit their budget.
+
+    **Raises**
+
+    BeamletBudgetError
+        Listing every observation that exceeds its budget.
+
+    **Examples**
+
+    >>> from lofarobsxml import TargetSource, Angle, Folder
+    >>> from lofarobsxml.backend import BackendProcessing
+    >>> target = TargetSource('3C 196', Angle(hms = (8, 13, 36.0)),
+    ...                       Angle(sdms = ('+', 48, 13, 3.0)))
+    >>> def observe(name, bit_mode, subband_specs):
+    ...     return Observation('HBA_DUAL', 'HBA_LOW', (2013, 10, 20, 18, 0, 0),
+    ...                        3600, stations = ['CS001'], clock_mhz = 200,
+    ...                        beam_list = [Beam(sap_id, target, spec)
+    ...                                     for sap_id, spec
+    ...                                     in enumerate(subband_specs)],
+    ...                        backend = BackendProcessing(), name = name,
+    ...                        bit_mode = bit_mode)
+    >>> observe('too wide', 16, ['77..320', '400'])
+    Traceback (most recent call last):
+    ...
+    lofarobsxml.observation.BeamletBudgetError: Observation 'too wide' uses 245 subbands in its beams, but only 244 beamlets are available in 16 bit mode
+    >>> folder = Folder('Obs', children = [observe('multi', 8, ['12..255', '256..499']),
+    ...                                    observe('single', 16, ['77..320'])])
+    >>> validate_beamlet_budgets([folder])
+    True
+    >>> folder.children[1].append_child(Beam(1, target, '10*400'))
+    >>> validate_beamlet_budgets([folder])
+    Traceback (most recent call last):
+    ...
+    lofarobsxml.observation.BeamletBudgetError: Observation 'single' uses 254 subbands in its beams, but only 244 beamlets are available in 16 bit mode
+    >>> xml([folder])
+    Traceback (most recent call last):
+    ...
+    lofarobsxml.observation.BeamletBudgetError: Observation 'single' uses 254 subbands in its beams, but only 244 beamlets are available in 16 bit mode
+    '''
+    problems = []
+    for node in walk_tree(items):
+        if isinstance(node, Observation):
+            used, available = node.beamlet_usage()
+            if used > available:
+                problems.append(beamlet_budget_message(node, used, available))
+    if problems:
+        raise BeamletBudgetError('\n'.join(problems))
+    return True
+
+
+
 def xml(items, project='2015LOFAROBS_new', description=None):
     """
     Format a list of *items* as an XML string that can be
-    uploaded to a MoM project with name *project*.
+    uploaded to a MoM project with name *project*. Topology labels are
+    indexed once for all items before rendering, and all items are
+    rendered in one RenderSession. Raises BeamletBudgetError if an
+    observation uses more subbands than it has beamlets.
     """
+    validate_beamlet_budgets(items)
+    with TopologyIndex(items), RenderSession():
+        body = '      </item>\n      <item>'.join([indent(item.xml(project), 8)
+                                                 for item in items])
     return """<?xml version=\"1.0\" encoding=\"UTF-8\"?>
 <lofar:project xmlns:lofar=\"http://www.astron.nl/MoM2-Lofar\"
     xmlns:mom2=\"http://www.astron.nl/MoM2\"
@@ -151,8 +308,7 @@ def xml(items, project='2015LOFAROBS_new', description=None):
     <name>"""+project+"""</name>
     <description>"""+ (description or project) +"""</description>
     <children>
-      <item>\n"""+'      </item>\n      <item>'.join([indent(item.xml(project), 8)
-                                                    for child_id, item in enumerate(items)])+"""
+      <item>\n"""+body+"""
       </item>
     </children>
 </lofar:project>
@@ -7,6 +7,45 @@ from lofarobsxml.utilities import indent
 from lofarobsxml.momformats import check_mom_topology
 
 
+# Stack of TopologyIndex instances that are in use as context managers
+ACTIVE_TOPOLOGY_INDICES = []
+
+
+
+def topology_label(name, parent_label=None, child_id=None, max_name_length=13):
+    r'''
+    Return the label of a node with ``name`` that is child number
+    ``child_id`` of a node labelled ``parent_label``. Without a
+    parent, the label is just the (truncated) name.
+
+    **Examples**
+
+    >>> topology_label('3C 196: main beam', 'Obs', 1)
+    'Obs.1.3C_196_main_'
+    >>> topology_label(None, 'Obs.1.3C_196_main_', 0)
+    'Obs.1.3C_196_main_.0'
+    >>> topology_label(None)
+    'x'
+    '''
+    string = str(name)[:max_name_length]
+    if name is None:
+        string = 'x'
+
+    if parent_label is not None:
+        if name is None:
+            name = ''
+            str_format = '%s.%d%s'
+        else:
+            name = str(name)[:max_name_length]
+            str_format = '%s.%d.%s'
+        string = str_format % (parent_label, child_id, name)
+    forbidden = '\'\";:?,\\<>$@#%^&*!()'
+    string = ''.join([ch for ch in string if ch not in forbidden])
+    result = string.replace(' ', '_')
+    check_mom_topology(result)
+    return result
+
+
 
 class ObservationSpecificationBase(object):
     r'''
@@ -118,27 +157,20 @@ class ObservationSpecificationBase(object):
     def label(self, max_name_length=13):
         r'''
         Returns an ascii label that reflects the full path of the
-        current instance in the observation set specification.
+        current instance in the observation set specification. While
+        a TopologyIndex containing this node is active, the label is
+        looked up instead of computed.
         '''
-        string = str(self.name)[:max_name_length]
-        if self.name is None:
-            string = 'x'
-
+        if ACTIVE_TOPOLOGY_INDICES:
+            index = ACTIVE_TOPOLOGY_INDICES[-1]
+            if index.max_name_length == max_name_length and self in index.labels:
+                return index.labels[self]
         if self.parent:
-            if self.name is None:
-                name = ''
-                str_format = '%s.%d%s'
-            else:
-                name = str(self.name)[:max_name_length]
-                str_format = '%s.%d.%s'
-            string = str_format % (self.parent.label(max_name_length),
-                                   self.parent.child_id(self),
-                                   name)
-        forbidden = '\'\";:?,\\<>$@#%^&*!()'
-        string = ''.join([ch for ch in string if ch not in forbidden])
-        result = string.replace(' ', '_')
-        check_mom_topology(result)
-        return result
+            return topology_label(self.name,
+                                  self.parent.label(max_name_length),
+                                  self.parent.child_id(self),
+                                  max_name_length)
+        return topology_label(self.name, max_name_length=max_name_length)
 
 
 
@@ -205,6 +237,130 @@ class ObservationSpecificationBase(object):
 
 
 
+    def walk(self):
+        r'''
+        Yield this node and all its descendants, depth first, in the
+        order in which they appear in the XML.
+        '''
+        yield self
+        for child in self.children or []:
+            for node in child.walk():
+                yield node
+
+
+
+
+def walk_tree(items):
+    r'''
+    Yield all nodes in the trees rooted at ``items``, depth first.
+
+    **Parameters**
+
+    items : list of ObservationSpecificationBase
+        Root nodes, for example the list passed to ``observation.xml()``.
+
+    **Examples**
+
+    >>> root = ObservationSpecificationBase('root')
+    >>> root.append_child(ObservationSpecificationBase('a'))
+    >>> root.children[0].append_child(ObservationSpecificationBase('b'))
+    >>> root.append_child(ObservationSpecificationBase('c'))
+    >>> [node.name for node in walk_tree([root])]
+    ['root', 'a', 'b', 'c']
+    '''
+    for item in items:
+        for node in item.walk():
+            yield node
+
+
+
+
+class TopologyIndex(object):
+    r'''
+    Labels of all nodes in the trees rooted at ``items``, computed
+    in one top-down pass. Use an instance as a context manager around
+    rendering: while it is active, ``label()`` of every indexed node,
+    and therefore every data product topology and pipeline
+    predecessor, is a dictionary lookup instead of a walk to the
+    root of the tree. ``lofarobsxml.xml()`` does this automatically.
+
+    The index does not follow changes to the trees. Create a new one
+    after adding, removing, or renaming nodes.
+
+    **Parameters**
+
+    items : list of ObservationSpecificationBase
+        Root nodes, for example the list passed to ``observation.xml()``.
+
+    max_name_length : int
+        As in ``label()``.
+
+    **Examples**
+
+    >>> root = ObservationSpecificationBase('Root folder')
+    >>> root.append_child(ObservationSpecificationBase('a'))
+    >>> root.children[0].append_child(ObservationSpecificationBase(None))
+    >>> index = TopologyIndex([root])
+    >>> [index.labels[node] for node in walk_tree([root])]
+    ['Root_folder', 'Root_folder.0.a', 'Root_folder.0.a.0']
+    >>> with index:
+    ...     root.children[0].children[0].label()
+    'Root_folder.0.a.0'
+    '''
+    def __init__(self, items, max_name_length=13):
+        self.max_name_length = max_name_length
+        self.labels          = {}
+        self.predecessors    = {}
+        for item in items:
+            parent_label, child_id = None, None
+            if item.parent:
+                parent_label = item.parent.label(max_name_length)
+                child_id     = item.parent.child_id(item)
+            pending = [(item, parent_label, child_id)]
+            while pending:
+                node, parent_label, child_id = pending.pop()
+                label = topology_label(node.name, parent_label, child_id,
+                                       max_name_length)
+                self.labels[node] = label
+                pending += [(child, label, index)
+                            for index, child in enumerate(node.children or [])]
+
+
+    def input_observation_labels(self, pipeline):
+        r'''
+        Return the unique labels of the observations that produce the
+        ``input_data`` of ``pipeline``, in order of first appearance.
+        The result is computed once per pipeline.
+        '''
+        try:
+            return self.predecessors[pipeline]
+        except KeyError:
+            labels = []
+            for data_set in pipeline.input_data or []:
+                if data_set.parent is not None:
+                    label = self.labels.get(data_set.parent)
+                    if label is None:
+                        label = data_set.parent.label(self.max_name_length)
+                    if label not in labels:
+                        labels.append(label)
+            return self.predecessors.setdefault(pipeline, labels)
 
 
+    def __enter__(self):
+        ACTIVE_TOPOLOGY_INDICES.append(self)
+        return self
 
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        ACTIVE_TOPOLOGY_INDICES.remove(self)
+        return False
+
+
+
+def active_topology_index():
+    r'''
+    Return the innermost active TopologyIndex, or None.
+    '''
+    if ACTIVE_TOPOLOGY_INDICES:
+        return ACTIVE_TOPOLOGY_INDICES[-1]
+    return None
@@ -6,14 +6,18 @@ imaging settings.
 '''
 
 from lofarobsxml.observationspecificationbase import ObservationSpecificationBase
+from lofarobsxml.observationspecificationbase import active_topology_index
 from lofarobsxml.utilities import AutoReprBaseClass, typecheck, lower_case, unique, indent
-from lofarobsxml.momformats import mom_duration, mom_timestamp, check_mom_topology
-import ephem
+from lofarobsxml.utilities import InternedConfig, interned_config, cached_rendering
+from lofarobsxml.momformats import mom_duration, check_mom_topology
+from lofarobsxml.resources import estimate_pipeline_resources
+from lofarobsxml.timeline import active_render_session
 
         
-class NDPPP(AutoReprBaseClass):
+class NDPPP(InternedConfig):
     r'''
-    The demixing- and averaging parameters for NDPPP.
+    The demixing- and averaging parameters for NDPPP. Instances are
+    immutable, and equal settings share one instance.
 
     **Parameters**
 
@@ -31,9 +35,12 @@ class NDPPP(AutoReprBaseClass):
         Length (in time slots) of the demixing window. This must be a
         multiple of ``avg_time_step``.
 
-    demix_always : None or list of strings
+    demix_always : None, string, or sequence of strings
         Sources to always demix. Valid source names are: ['CasA',
-        'CygA', 'TauA', 'HydraA', 'VirA', 'HerA'].
+        'CygA', 'TauA', 'HydraA', 'VirA', 'HerA']. Stored as a tuple.
+
+    demix_if_needed : None, string, or sequence of strings
+        Sources to demix if needed. Stored as a tuple.
 
     ignore_target : None or bool
         See imagoing cookbook documentation. None implies observatory
@@ -46,7 +53,7 @@ class NDPPP(AutoReprBaseClass):
     >>> dmx
     NDPPP(avg_freq_step   = 16,
           avg_time_step   = 2,
-          demix_always    = ['CygA', 'CasA'],
+          demix_always    = ('CygA', 'CasA'),
           demix_freq_step = 64,
           demix_if_needed = None,
           demix_time_step = 10,
@@ -75,24 +82,34 @@ class NDPPP(AutoReprBaseClass):
     ...
     TypeError: type(NDPPP.avg_time_step)(2.5) not in ['int']
 
+    Use replace() to obtain modified settings:
+
+    >>> dmx.replace(demix_always = 'CasA') is NDPPP(16, 2, 64, 10, ['CasA'])
+    True
+
     '''
-    def __init__(self,
-                 avg_freq_step = 64, avg_time_step = 1,
-                 demix_freq_step = 64, demix_time_step = 10,
-                 demix_always = None, demix_if_needed = None,
-                 ignore_target = None):
-        self.avg_freq_step   = avg_freq_step
-        self.avg_time_step   = avg_time_step
-        self.demix_freq_step = demix_freq_step
-        self.demix_time_step = demix_time_step
-        self.demix_always    = demix_always
-        if type(self.demix_always) is str:
-            self.demix_always = [self.demix_always]
-        self.demix_if_needed = demix_if_needed
-        if type(self.demix_if_needed) is str:
-            self.demix_if_needed = [self.demix_if_needed]
-        self.ignore_target = ignore_target
-        self.validate()
+    __slots__ = ('avg_freq_step', 'avg_time_step',
+                 'demix_freq_step', 'demix_time_step',
+                 'demix_always', 'demix_if_needed',
+                 'ignore_target')
+
+    def __new__(cls,
+                avg_freq_step = 64, avg_time_step = 1,
+                demix_freq_step = 64, demix_time_step = 10,
+                demix_always = None, demix_if_needed = None,
+                ignore_target = None):
+        if type(demix_always) is str:
+            demix_always = [demix_always]
+        if demix_always is not None:
+            demix_always = tuple(demix_always)
+        if type(demix_if_needed) is str:
+            demix_if_needed = [demix_if_needed]
+        if demix_if_needed is not None:
+            demix_if_needed = tuple(demix_if_needed)
+        return interned_config(cls, (avg_freq_step, avg_time_step,
+                                     demix_freq_step, demix_time_step,
+                                     demix_always, demix_if_needed,
+                                     ignore_target))
 
 
 
@@ -105,9 +122,9 @@ class NDPPP(AutoReprBaseClass):
         typecheck(self.avg_time_step, int, 'NDPPP.avg_time_step')
         typecheck(self.demix_freq_step, int, 'NDPPP.demix_freq_step')
         typecheck(self.demix_time_step, int, 'NDPPP.demix_time_step')
-        typecheck(self.demix_always, [list, type(None)],
+        typecheck(self.demix_always, [tuple, type(None)],
                   'NDPPP.demix_always')
-        typecheck(self.demix_if_needed, [list, type(None)],
+        typecheck(self.demix_if_needed, [tuple, type(None)],
                   'NDPPP.demix_if_needed')
         if self.demix_freq_step % self.avg_freq_step != 0:
             raise ValueError('NDPPP.demix_freq_step(%r) is not a multiple of NDPPP.avg_freq_step(%r)' %
@@ -120,6 +137,7 @@ class NDPPP(AutoReprBaseClass):
         typecheck(self.ignore_target, [type(None), type(True)],
                   'NDPPP.ignore_target')
 
+    @cached_rendering
     def xml(self):
         r'''
         Produce an xml representation of demixing settings.
@@ -157,7 +175,12 @@ class AveragingPipeline(ObservationSpecificationBase):
     r'''
     **Parameters**
     
-    processing_nr_tasks should be roughly nr of subbands divided by 3.
+    processing_nr_tasks : None or int
+        Number of NDPPP tasks. None sizes the tasks from the expected
+        CPU cost of the input data, see ``lofarobsxml.resources``.
+
+    processing_nr_cores : None or int
+        Cores per task. None derives it like processing_nr_tasks.
 
     flagging_strategy: 'LBAdefault', 'HBAdefault', or None
         NDPPP flagging strategy.
@@ -180,7 +203,7 @@ class AveragingPipeline(ObservationSpecificationBase):
     >>> obs = Observation('HBA_DUAL_INNER', 'LBA_LOW', (2013, 10, 20, 18, 5, 0),
     ...                   duration_seconds = 600, name = 'Main observation',
     ...                   stations  = ['CS001', 'RS106', 'DE601'],
-    ...                   clock_mhz = 200, beam_list = [bm],
+    ...                   clock_mhz = 200, beam_list = [bm], bit_mode = 8,
     ...                   backend   = BackendProcessing())
 
     >>> avg = AveragingPipeline(name = 'Avg Pipeline', ndppp = NDPPP())
@@ -217,8 +240,8 @@ class AveragingPipeline(ObservationSpecificationBase):
                                                    ignore_target   = None),
                       predecessor_label    = None,
                       processing_cluster   = 'CEP4',
-                      processing_nr_cores  = 2,
-                      processing_nr_tasks  = 163,
+                      processing_nr_cores  = None,
+                      processing_nr_tasks  = None,
                       processing_partition = 'cpu',
                       start_date           = None,
                       storage_cluster      = 'CEP4',
@@ -234,8 +257,8 @@ class AveragingPipeline(ObservationSpecificationBase):
       <processingCluster>
         <name>CEP4</name>
         <partition>cpu</partition>
-        <numberOfTasks>163</numberOfTasks>
-        <numberOfCoresPerTask>2</numberOfCoresPerTask>
+        <numberOfTasks>1</numberOfTasks>
+        <numberOfCoresPerTask>1</numberOfCoresPerTask>
       </processingCluster>
       <currentStatus>
         <mom2:openedStatus/>
@@ -287,8 +310,8 @@ class AveragingPipeline(ObservationSpecificationBase):
                  initial_status='opened',
                  processing_cluster='CEP4',
                  processing_partition=None,
-                 processing_nr_tasks = 163,  #This is a sensible default for CEP4 NDPPP pipelines, not for all pipelines
-                 processing_nr_cores = 2): #This is a sensible default for CEP4 NDPPP pipelines, not for all pipelines
+                 processing_nr_tasks = None,
+                 processing_nr_cores = None):
         super(AveragingPipeline, self).__init__(name=name,
                                                 parent=parent,
                                                 children=children,
@@ -342,14 +365,21 @@ class AveragingPipeline(ObservationSpecificationBase):
 
     def predecessor(self):
         r'''
+        Return the label of the observation that produces the input
+        data, or ``predecessor_label`` if set. Uses the active
+        TopologyIndex, if any.
         '''
         if self.predecessor_label is not None:
             return self.predecessor_label
 
-        predecessor_observations = unique(
-            [data_set.parent.label()
-             for data_set in self.input_data
-             if data_set.parent is not None])
+        index = active_topology_index()
+        if index is not None:
+            predecessor_observations = index.input_observation_labels(self)
+        else:
+            predecessor_observations = unique(
+                [data_set.parent.label()
+                 for data_set in self.input_data
+                 if data_set.parent is not None])
         if len(predecessor_observations) != 1:
             raise ValueError('AveragingPipeline: more than one predecessor (%r)' %
                              predecessor_observations)
@@ -357,6 +387,14 @@ class AveragingPipeline(ObservationSpecificationBase):
         
         
 
+    def resources(self):
+        r'''
+        Return a PipelineResources estimate for this pipeline.
+        '''
+        return estimate_pipeline_resources(self)
+
+
+
     def xml_prefix(self, project_name = None):
         template ='''<lofar:pipeline xsi:type="lofar:AveragingPipelineType">
   <topology>%(label)s</topology>
@@ -421,11 +459,13 @@ class AveragingPipeline(ObservationSpecificationBase):
         if self.duration_s is not None:
             args['duration'] = mom_duration(seconds = self.duration_s)
         if self.start_date is not None:
-            start_date = ephem.Date(self.start_date).tuple()
-            rounded_start_date = start_date[:-1]+(int(round(start_date[-1])),)
-            args['start_time'] = mom_timestamp(*rounded_start_date)
+            args['start_time'] = active_render_session().timestamp(self.start_date)
         if self.input_data is None:
             raise ValueError('AveragingPipeline.input_data is None!')
+        if self.processing_nr_tasks is None or self.processing_nr_cores is None:
+            resources = self.resources()
+            args['processing_nr_tasks'] = resources.nr_tasks
+            args['processing_nr_cores'] = resources.nr_cores_per_task
         if self.flagging_strategy is None:
             args['flagging_strategy'] = self.input_data[0].parent.antenna_set[0:3].upper()+'default'
         elif self.flagging_strategy in ['HBAdefault', 'LBAdefault']:
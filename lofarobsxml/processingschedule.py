@@ -0,0 +1,349 @@
+r'''
+Dependencies between observations and processing pipelines, and a
+discrete-event simulation of a processing cluster with a limited
+number of pipeline slots. Observations run at their fixed start
+dates; a pipeline becomes ready once all observations (or pipelines)
+it depends on have finished, and starts as soon as a slot is free.
+'''
+
+import heapq
+import ephem
+
+from .observationspecificationbase import walk_tree, TopologyIndex
+from .observation import Observation
+from .pipelines import AveragingPipeline
+
+
+SECONDS_PER_DAY = 24*3600.0
+
+
+
+def date_seconds(date):
+    r'''
+    Convert a 6-tuple or ephem.Date to seconds since the ephem epoch.
+
+    **Examples**
+
+    >>> date_seconds((2013, 10, 20, 18, 0, 0)) - date_seconds((2013, 10, 20, 17, 0, 0))
+    3600.0
+    '''
+    return round(float(ephem.Date(date))*SECONDS_PER_DAY, 3)
+
+
+
+def seconds_date(seconds):
+    r'''
+    Convert seconds since the ephem epoch to a 6-tuple with whole
+    seconds.
+
+    **Examples**
+
+    >>> seconds_date(date_seconds((2013, 10, 20, 18, 0, 0)) + 301.2)
+    (2013, 10, 20, 18, 5, 1)
+    '''
+    date = ephem.Date(ephem.Date(round(seconds)/SECONDS_PER_DAY) + 0.1*ephem.second)
+    return date.tuple()[:-1] + (int(date.tuple()[-1]),)
+
+
+
+class ProcessingDAG(object):
+    r'''
+    Directed acyclic graph of the Observations and AveragingPipelines
+    in the trees rooted at ``items``. A pipeline depends on the
+    observations that produce its ``input_data``, and on the node
+    whose label is its ``predecessor_label``, if set.
+
+    **Attributes**
+
+    nodes : list
+        Observations and pipelines in topological order; ties keep
+        tree order.
+
+    predecessors : dict
+        For every node, the list of nodes it depends on.
+
+    successors : dict
+        For every node, the list of nodes that depend on it.
+
+    **Raises**
+
+    ValueError
+        If a predecessor_label is unknown, or the dependencies contain
+        a cycle.
+    '''
+    def __init__(self, items):
+        index = TopologyIndex(items)
+        by_label = dict([(label, node) for node, label in index.labels.items()])
+        tree_order = [node for node in walk_tree(items)
+                      if isinstance(node, (Observation, AveragingPipeline))]
+
+        self.predecessors = dict([(node, []) for node in tree_order])
+        for node in tree_order:
+            if not isinstance(node, AveragingPipeline):
+                continue
+            depends_on = []
+            if node.predecessor_label is not None:
+                if node.predecessor_label not in by_label:
+                    raise ValueError('%s: unknown predecessor_label %r' %
+                                     (node.name, node.predecessor_label))
+                depends_on.append(by_label[node.predecessor_label])
+            for beam in node.input_data or []:
+                if beam.parent is not None:
+                    depends_on.append(beam.parent)
+            for predecessor in depends_on:
+                if predecessor not in self.predecessors:
+                    # Inputs from outside the trees
+                    self.predecessors[predecessor] = []
+                    tree_order.append(predecessor)
+                if predecessor not in self.predecessors[node]:
+                    self.predecessors[node].append(predecessor)
+
+        self.successors = dict([(node, []) for node in tree_order])
+        for node in tree_order:
+            for predecessor in self.predecessors[node]:
+                self.successors[predecessor].append(node)
+
+        # Kahn's algorithm, taking ready nodes in tree order
+        position = dict([(node, order) for order, node in enumerate(tree_order)])
+        remaining = dict([(node, len(self.predecessors[node])) for node in tree_order])
+        ready = [(position[node], node) for node in tree_order if remaining[node] == 0]
+        heapq.heapify(ready)
+        self.nodes = []
+        while ready:
+            _, node = heapq.heappop(ready)
+            self.nodes.append(node)
+            for successor in self.successors[node]:
+                remaining[successor] -= 1
+                if remaining[successor] == 0:
+                    heapq.heappush(ready, (position[successor], successor))
+        if len(self.nodes) != len(tree_order):
+            raise ValueError('Cycle in pipeline dependencies between %r' %
+                             [node.name for node in tree_order
+                              if node not in self.nodes])
+
+
+    def pipelines(self):
+        r'''
+        All pipelines, in topological order.
+        '''
+        return [node for node in self.nodes if isinstance(node, AveragingPipeline)]
+
+
+
+class ScheduleSimulation(object):
+    r'''
+    Outcome of ``simulate_processing()``. Times are in seconds since
+    the ephem epoch; use ``seconds_date()`` to convert them.
+
+    **Attributes**
+
+    dag : ProcessingDAG
+        The dependency graph.
+
+    slots : int
+        Number of pipelines that can run concurrently.
+
+    release_s, start_s, end_s : dicts
+        For every node, the time at which all its predecessors had
+        finished, at which it started, and at which it ended.
+
+    critical_path : list
+        The chain of nodes that determines the end of the last node.
+        Every node in the chain started when its predecessor in the
+        chain ended, either because it needed its data or because it
+        waited for its slot.
+
+    backlog : list of (float, int)
+        Number of ready pipelines waiting for a slot, after every
+        event.
+    '''
+    def __init__(self, dag, slots, release_s, start_s, end_s,
+                 critical_path, backlog):
+        self.dag           = dag
+        self.slots         = slots
+        self.release_s     = release_s
+        self.start_s       = start_s
+        self.end_s         = end_s
+        self.critical_path = critical_path
+        self.backlog       = backlog
+
+
+    def wait_s(self, node):
+        r'''
+        Time that ``node`` waited for a slot after becoming ready.
+        '''
+        return self.start_s[node] - self.release_s[node]
+
+
+    def total_wait_s(self):
+        return sum([self.wait_s(node) for node in self.dag.pipelines()])
+
+
+    def max_backlog(self):
+        return max([count for _, count in self.backlog] or [0])
+
+
+    def makespan_s(self):
+        r'''
+        Time between the first start and the last end.
+        '''
+        return max(self.end_s.values()) - min(self.start_s.values())
+
+
+    def start_date(self, node):
+        r'''
+        Simulated start of ``node`` as a 6-tuple.
+        '''
+        return seconds_date(self.start_s[node])
+
+
+    def apply(self):
+        r'''
+        Set start_date, and duration_s where it is not set, of all
+        pipelines to the simulated values.
+        '''
+        for pipeline in self.dag.pipelines():
+            pipeline.start_date = self.start_date(pipeline)
+            if pipeline.duration_s is None:
+                pipeline.duration_s = int(round(self.end_s[pipeline] -
+                                                self.start_s[pipeline]))
+
+
+
+def pipeline_duration_s(pipeline, cores_per_slot=None):
+    r'''
+    The pipeline's duration_s if set, otherwise its expected wall
+    clock time from ``lofarobsxml.resources``.
+    '''
+    if pipeline.duration_s is not None:
+        return float(pipeline.duration_s)
+    return pipeline.resources().wall_clock_s(cores_per_slot)
+
+
+
+def simulate_processing(items, slots, cores_per_slot=None):
+    r'''
+    Simulate processing all pipelines in the trees rooted at
+    ``items`` with ``slots`` pipelines at a time, first come, first
+    served. Observations occupy no slots and run at their start
+    dates; the start dates of pipelines are ignored.
+
+    **Parameters**
+
+    items : list of ObservationSpecificationBase
+        Root nodes of the campaign.
+
+    slots : int
+        Number of concurrent pipelines.
+
+    cores_per_slot : None or int
+        Passed to the resource model to estimate durations of
+        pipelines without duration_s.
+
+    **Returns**
+
+    A ScheduleSimulation.
+
+    **Examples**
+
+    >>> from lofarobsxml             import TargetSource, Angle, Folder
+    >>> from lofarobsxml.backend     import BackendProcessing
+    >>> from lofarobsxml.beam        import Beam
+    >>> from lofarobsxml.pipelines   import NDPPP
+    >>> target = TargetSource('3C 196', Angle(hms = (8, 13, 36.0)),
+    ...                       Angle(sdms = ('+', 48, 13, 3.0)))
+    >>> def observe(name, start_hour):
+    ...     obs = Observation('HBA_DUAL_INNER', 'HBA_LOW',
+    ...                       (2013, 10, 20, start_hour, 0, 0), 3600, name = name,
+    ...                       stations = ['CS001'], clock_mhz = 200, bit_mode = 8,
+    ...                       backend = BackendProcessing(),
+    ...                       beam_list = [Beam(0, target, '77..320')])
+    ...     obs.append_child(AveragingPipeline(name + ' avg', NDPPP(),
+    ...                                        input_data = obs.children[:1],
+    ...                                        duration_s = 3*3600))
+    ...     return obs
+    >>> night = Folder('Night', children = [observe('A', 18), observe('B', 19),
+    ...                                     observe('C', 20)])
+    >>> simulation = simulate_processing([night], slots = 2)
+    >>> for pipeline in simulation.dag.pipelines():
+    ...     print(pipeline.name, simulation.start_date(pipeline),
+    ...           int(simulation.wait_s(pipeline)))
+    A avg (2013, 10, 20, 19, 0, 0) 0
+    B avg (2013, 10, 20, 20, 0, 0) 0
+    C avg (2013, 10, 20, 22, 0, 0) 3600
+    >>> [node.name for node in simulation.critical_path]
+    ['A', 'A avg', 'C avg']
+    >>> simulation.max_backlog(), simulation.makespan_s()/3600
+    (1, 7.0)
+    >>> simulation.apply()
+    >>> night.children[2].children[1].start_date
+    (2013, 10, 20, 22, 0, 0)
+    '''
+    if slots < 1:
+        raise ValueError('simulate_processing(): slots(%r) must be >= 1' % slots)
+    dag = ProcessingDAG(items)
+    position = dict([(node, order) for order, node in enumerate(dag.nodes)])
+    release_s, start_s, end_s, binding = {}, {}, {}, {}
+    remaining = dict([(node, len(dag.predecessors[node])) for node in dag.nodes])
+
+    completions = []  # (end_s, position, node)
+    scheduled   = []  # (release_s, position, pipeline) without inputs
+    ready       = []  # (release_s, position, pipeline) waiting for a slot
+    for node in dag.nodes:
+        if isinstance(node, Observation):
+            release_s[node] = start_s[node] = date_seconds(node.start_date)
+            end_s[node] = start_s[node] + node.duration_seconds
+            heapq.heappush(completions, (end_s[node], position[node], node))
+        elif remaining[node] == 0:
+            # Pipelines without inputs are released at their start date
+            if node.start_date is None:
+                raise ValueError('%s has neither input data nor a start date' %
+                                 node.name)
+            release_s[node] = date_seconds(node.start_date)
+            heapq.heappush(scheduled, (release_s[node], position[node], node))
+
+    free_slots = slots
+    freed_by   = None
+    backlog    = []
+    while completions or scheduled:
+        now = min([entry[0] for entry in completions[:1] + scheduled[:1]])
+        while scheduled and scheduled[0][0] <= now:
+            heapq.heappush(ready, heapq.heappop(scheduled))
+
+        # Completions at this time free slots and release successors
+        while completions and completions[0][0] <= now:
+            _, _, node = heapq.heappop(completions)
+            if isinstance(node, AveragingPipeline):
+                free_slots += 1
+                freed_by = node
+            for successor in dag.successors[node]:
+                remaining[successor] -= 1
+                if remaining[successor] == 0:
+                    latest = max(dag.predecessors[successor],
+                                 key=lambda predecessor: end_s[predecessor])
+                    release_s[successor] = end_s[latest]
+                    binding[successor] = latest
+                    heapq.heappush(ready, (release_s[successor],
+                                           position[successor], successor))
+
+        # Start ready pipelines, first come first served, while slots
+        # are free
+        while free_slots > 0 and ready:
+            _, _, pipeline = heapq.heappop(ready)
+            start_s[pipeline] = now
+            end_s[pipeline]   = now + pipeline_duration_s(pipeline, cores_per_slot)
+            if now > release_s[pipeline] and freed_by is not None:
+                binding[pipeline] = freed_by
+            free_slots -= 1
+            heapq.heappush(completions, (end_s[pipeline], position[pipeline], pipeline))
+        backlog.append((now, len(ready)))
+
+    critical_path = []
+    if end_s:
+        node = max(dag.nodes, key=lambda node: (end_s[node], -position[node]))
+        while node is not None:
+            critical_path.append(node)
+            node = binding.get(node)
+    critical_path.reverse()
+    return ScheduleSimulation(dag, slots, release_s, start_s, end_s,
+                              critical_path, backlog)
@@ -0,0 +1,467 @@
+r'''
+A simple resource model for NDPPP averaging pipelines. The number of
+tasks, cores per task, runtime and output size of an
+AveragingPipeline are derived from its input Beams and NDPPP settings,
+and summed per processing cluster for a whole project.
+
+The CPU cost of a pipeline is estimated from its input visibilities
+and demix settings. Tasks and cores per task are then sized so that
+every task takes about TARGET_TASK_RUNTIME_S: subbands are grouped
+into tasks as long as a task stays within the target, and a subband
+that alone would exceed it gets more cores, up to
+MAX_CORES_PER_TASK. The throughput and demixing cost constants are
+order of magnitude assumptions, not measurements, so the model is
+meant for comparing and balancing pipelines, not for predicting
+exact runtimes. All constants can be overridden per call of
+``estimate_pipeline_resources()`` and ``cluster_load()``.
+'''
+
+from math import ceil
+import numpy
+import ephem
+
+from .observationspecificationbase import walk_tree
+from .subbands import SubbandSet
+from .stationpositions import num_baselines
+from .datarates import UV_BYTES_PER_VISIBILITY
+
+
+# Intended runtime of one task. Long enough that the start-up cost of
+# a task is small, short enough that a failed task is cheap to rerun
+# and that tasks of several pipelines interleave on the cluster.
+TARGET_TASK_RUNTIME_S = 3600.0
+
+# A task runs on one node. Four cores is a sixth of a CEP4 node, which
+# leaves room for the tasks of other pipelines.
+MAX_CORES_PER_TASK = 4
+
+# Input visibilities flagged and averaged per core per second. An
+# assumed order of magnitude; replace it with a value measured on
+# the target cluster when runtimes matter.
+NDPPP_VISIBILITIES_PER_CORE_SECOND = 1.0e5
+
+# Extra cost, relative to flagging and averaging, of every source in
+# demix_always. Sources in demix_if_needed are counted with a weight.
+# Both are assumptions: demixing subtracts one predicted source model
+# per source, and sources that are only demixed if needed are
+# expected to be dropped about half of the time.
+DEMIX_COST_PER_SOURCE    = 2.0
+DEMIX_IF_NEEDED_WEIGHT   = 0.5
+
+# Cores available per (processing_cluster, processing_partition):
+# the nominal CEP4 size of 50 compute nodes with 24 cores each.
+CLUSTER_CORES = {('CEP4', 'cpu'): 50*24}
+
+
+
+class PipelineResources(object):
+    r'''
+    Resource estimate for one AveragingPipeline.
+
+    **Attributes**
+
+    num_subbands : int
+        Total number of input subbands.
+
+    nr_tasks : int
+        Number of NDPPP tasks.
+
+    nr_cores_per_task : int
+        Cores requested per task.
+
+    task_runtime_s : float
+        Expected runtime of one task.
+
+    core_seconds : float
+        Total CPU cost of the pipeline.
+
+    input_bytes : float
+        Size of the input visibilities.
+
+    output_bytes : float
+        Size of the averaged output visibilities.
+    '''
+    def __init__(self, num_subbands, nr_tasks, nr_cores_per_task,
+                 task_runtime_s, core_seconds, input_bytes, output_bytes):
+        self.num_subbands      = num_subbands
+        self.nr_tasks          = nr_tasks
+        self.nr_cores_per_task = nr_cores_per_task
+        self.task_runtime_s    = task_runtime_s
+        self.core_seconds      = core_seconds
+        self.input_bytes       = input_bytes
+        self.output_bytes      = output_bytes
+
+
+    def __repr__(self):
+        return ('PipelineResources(num_subbands = %d, nr_tasks = %d, '
+                'nr_cores_per_task = %d, task_runtime_s = %.0f)' %
+                (self.num_subbands, self.nr_tasks, self.nr_cores_per_task,
+                 self.task_runtime_s))
+
+
+    def cores(self):
+        r'''
+        Number of cores used while all tasks run concurrently.
+        '''
+        return self.nr_tasks*self.nr_cores_per_task
+
+
+    def wall_clock_s(self, available_cores=None):
+        r'''
+        Expected wall clock time of the pipeline. If fewer than
+        ``cores()`` cores are available, tasks run in consecutive
+        waves.
+        '''
+        if available_cores is None or self.cores() <= available_cores:
+            return self.task_runtime_s
+        tasks_per_wave = max(available_cores//self.nr_cores_per_task, 1)
+        return self.task_runtime_s*int(ceil(self.nr_tasks/float(tasks_per_wave)))
+
+
+
+def demix_weight(ndppp, if_needed_weight=None):
+    r'''
+    Effective number of demixed sources of an NDPPP instance. Sources
+    in demix_if_needed count ``if_needed_weight`` each. Default:
+    DEMIX_IF_NEEDED_WEIGHT.
+
+    **Examples**
+
+    >>> from lofarobsxml.pipelines import NDPPP
+    >>> ndppp = NDPPP(demix_always = ['CasA', 'CygA'], demix_if_needed = 'TauA')
+    >>> demix_weight(ndppp)
+    2.5
+    >>> demix_weight(ndppp, if_needed_weight = 1.0)
+    3.0
+    '''
+    if if_needed_weight is None:
+        if_needed_weight = DEMIX_IF_NEEDED_WEIGHT
+    return (len(ndppp.demix_always or ()) +
+            if_needed_weight*len(ndppp.demix_if_needed or ()))
+
+
+
+def task_layout(core_seconds, num_subbands, target_task_runtime_s,
+                max_cores_per_task, nr_tasks=None, nr_cores=None):
+    r'''
+    Number of tasks and cores per task such that every task takes
+    about ``target_task_runtime_s``. A task processes one or more
+    whole subbands. Cores are added, up to ``max_cores_per_task``,
+    only if one subband on one core would exceed the target. Given
+    ``nr_tasks`` or ``nr_cores`` are kept.
+
+    **Returns**
+
+    A tuple (nr_tasks, nr_cores).
+
+    **Examples**
+
+    >>> task_layout(1000*900.0, 1000, 3600, 4)
+    (250, 1)
+    >>> task_layout(1000*9000.0, 1000, 3600, 4)
+    (1000, 3)
+    >>> task_layout(1000*9000.0, 1000, 3600, 4, nr_cores = 8)
+    (334, 8)
+    >>> task_layout(1000*9000.0, 1000, 3600, 4, nr_tasks = 100)
+    (100, 4)
+    '''
+    subband_core_s = core_seconds/max(num_subbands, 1)
+    if nr_cores is None:
+        if nr_tasks is None:
+            needed = subband_core_s/target_task_runtime_s
+        else:
+            needed = core_seconds/(nr_tasks*target_task_runtime_s)
+        nr_cores = min(max(int(ceil(needed)), 1), max_cores_per_task)
+    if nr_tasks is None:
+        subbands_per_task = max(int(target_task_runtime_s*nr_cores//
+                                    max(subband_core_s, 1e-9)), 1)
+        nr_tasks = max(int(ceil(num_subbands/float(subbands_per_task))), 1)
+    return nr_tasks, nr_cores
+
+
+
+def estimate_pipeline_resources(pipeline, target_task_runtime_s=None,
+                                max_cores_per_task=None,
+                                visibilities_per_core_second=None,
+                                demix_cost_per_source=None,
+                                demix_if_needed_weight=None):
+    r'''
+    Estimate the resources of an AveragingPipeline from its input
+    Beams, their observations' stations and backend settings, and
+    the NDPPP averaging and demixing settings. Explicitly set
+    ``processing_nr_tasks`` and ``processing_nr_cores`` are used as
+    given; if they are None, they are sized from the expected CPU cost,
+    see the module documentation.
+
+    **Parameters**
+
+    pipeline : AveragingPipeline
+        The pipeline to estimate.
+
+    target_task_runtime_s : None or float
+        Default: TARGET_TASK_RUNTIME_S.
+
+    max_cores_per_task : None or int
+        Default: MAX_CORES_PER_TASK.
+
+    visibilities_per_core_second : None or float
+        Default: NDPPP_VISIBILITIES_PER_CORE_SECOND.
+
+    demix_cost_per_source : None or float
+        Default: DEMIX_COST_PER_SOURCE.
+
+    demix_if_needed_weight : None or float
+        Default: DEMIX_IF_NEEDED_WEIGHT.
+
+    **Raises**
+
+    ValueError
+        If the pipeline has no input data.
+
+    **Examples**
+
+    >>> from lofarobsxml             import TargetSource, Angle, station_list
+    >>> from lofarobsxml.backend     import BackendProcessing
+    >>> from lofarobsxml.observation import Observation
+    >>> from lofarobsxml.beam        import Beam
+    >>> from lofarobsxml.pipelines   import AveragingPipeline, NDPPP
+    >>> target = TargetSource('3C 196', Angle(hms = (8, 13, 36.0)),
+    ...                       Angle(sdms = ('+', 48, 13, 3.0)))
+    >>> obs = Observation('HBA_DUAL_INNER', 'HBA_LOW', (2013, 10, 20, 18, 0, 0),
+    ...                   3600, stations = station_list('nl'), clock_mhz = 200,
+    ...                   bit_mode = 8, backend = BackendProcessing(),
+    ...                   beam_list = [Beam(0, target, '77..320'),
+    ...                                Beam(1, target, '77..320')])
+    >>> averaging = AveragingPipeline('avg', NDPPP(16, 2),
+    ...                               input_data = obs.children[:1])
+    >>> demixing = AveragingPipeline('dmx', NDPPP(16, 2, demix_always = ['CasA']),
+    ...                              input_data = obs.children)
+    >>> obs.append_child(averaging)
+    >>> obs.append_child(demixing)
+    >>> estimate_pipeline_resources(averaging)
+    PipelineResources(num_subbands = 244, nr_tasks = 61, nr_cores_per_task = 1, task_runtime_s = 3415)
+    >>> estimate_pipeline_resources(demixing)
+    PipelineResources(num_subbands = 488, nr_tasks = 488, nr_cores_per_task = 1, task_runtime_s = 2561)
+    >>> estimate_pipeline_resources(demixing, target_task_runtime_s = 1200)
+    PipelineResources(num_subbands = 488, nr_tasks = 488, nr_cores_per_task = 3, task_runtime_s = 854)
+    >>> estimate_pipeline_resources(demixing, visibilities_per_core_second = 4e5)
+    PipelineResources(num_subbands = 488, nr_tasks = 98, nr_cores_per_task = 1, task_runtime_s = 3188)
+    >>> resources = estimate_pipeline_resources(averaging)
+    >>> round(resources.input_bytes/1e12, 2), round(resources.output_bytes/1e12, 3)
+    (0.67, 0.021)
+    >>> int(resources.wall_clock_s(available_cores = 40))
+    6829
+    '''
+    if target_task_runtime_s is None:
+        target_task_runtime_s = TARGET_TASK_RUNTIME_S
+    if max_cores_per_task is None:
+        max_cores_per_task = MAX_CORES_PER_TASK
+    if visibilities_per_core_second is None:
+        visibilities_per_core_second = NDPPP_VISIBILITIES_PER_CORE_SECOND
+    if demix_cost_per_source is None:
+        demix_cost_per_source = DEMIX_COST_PER_SOURCE
+    if not pipeline.input_data:
+        raise ValueError('%s: no input data to estimate resources from' %
+                         pipeline.name)
+    ndppp = pipeline.ndppp
+    num_subbands, visibilities, output_visibilities = 0, 0.0, 0.0
+    for beam in pipeline.input_data:
+        observation = beam.parent
+        backend     = observation.backend
+        subbands    = len(SubbandSet.from_spec(beam.subband_spec))
+        duration_s  = (observation.duration_seconds if beam.duration_s is None
+                       else beam.duration_s)
+        baselines   = num_baselines(len(observation.stations), autocorrelations=True)
+        channels    = backend.channels_per_subband
+        time_slots  = int(ceil(duration_s/float(backend.integration_time_seconds)))
+        num_subbands += subbands
+        visibilities += float(subbands)*baselines*channels*time_slots
+        output_visibilities += (float(subbands)*baselines*
+                                ceil(channels/float(ndppp.avg_freq_step))*
+                                ceil(time_slots/float(ndppp.avg_time_step)))
+
+    demixed_sources = demix_weight(ndppp, demix_if_needed_weight)
+    core_seconds = (visibilities*(1.0 + demix_cost_per_source*demixed_sources)/
+                    visibilities_per_core_second)
+    nr_tasks, nr_cores = task_layout(
+        core_seconds, num_subbands, target_task_runtime_s, max_cores_per_task,
+        pipeline.processing_nr_tasks, pipeline.processing_nr_cores)
+    return PipelineResources(
+        num_subbands      = num_subbands,
+        nr_tasks          = nr_tasks,
+        nr_cores_per_task = nr_cores,
+        task_runtime_s    = core_seconds/(nr_tasks*nr_cores),
+        core_seconds      = core_seconds,
+        input_bytes       = visibilities*UV_BYTES_PER_VISIBILITY,
+        output_bytes      = output_visibilities*UV_BYTES_PER_VISIBILITY)
+
+
+
+class ClusterLoad(object):
+    r'''
+    Summed resource requests of all pipelines on one processing
+    cluster partition.
+
+    **Attributes**
+
+    cluster : (string, string)
+        (processing_cluster, processing_partition)
+
+    pipelines : list of AveragingPipeline
+        The pipelines, in tree order.
+
+    resources : list of PipelineResources
+        Their estimates, in the same order.
+
+    available_cores : None or int
+        Capacity of the partition, if known.
+
+    peak_cores : int
+        Highest number of cores requested at the same time by
+        pipelines with a start date. Pipelines without a start date
+        are not included.
+
+    utilisation : None or float
+        Total core seconds divided by the available core seconds
+        between the first start and the last end of the scheduled
+        pipelines.
+    '''
+    def __init__(self, cluster, pipelines, resources, available_cores,
+                 peak_cores, utilisation):
+        self.cluster         = cluster
+        self.pipelines       = pipelines
+        self.resources       = resources
+        self.available_cores = available_cores
+        self.peak_cores      = peak_cores
+        self.utilisation     = utilisation
+
+
+    def __repr__(self):
+        return ('ClusterLoad(%r, pipelines = %d, peak_cores = %d, '
+                'available_cores = %r)' %
+                (self.cluster, len(self.pipelines), self.peak_cores,
+                 self.available_cores))
+
+
+    def total_tasks(self):
+        return sum([resources.nr_tasks for resources in self.resources])
+
+
+    def total_core_seconds(self):
+        return sum([resources.core_seconds for resources in self.resources])
+
+
+    def total_output_bytes(self):
+        return sum([resources.output_bytes for resources in self.resources])
+
+
+    def oversubscribed(self):
+        r'''
+        True if the peak request exceeds the available cores.
+        '''
+        return (self.available_cores is not None and
+                self.peak_cores > self.available_cores)
+
+
+
+def pipeline_interval_s(pipeline, resources, available_cores):
+    r'''
+    Return the (start, end) in seconds since the ephem epoch of a
+    pipeline with a start date, or None. The duration is duration_s
+    if given, otherwise the expected wall clock time.
+    '''
+    if pipeline.start_date is None:
+        return None
+    start_s = float(ephem.Date(pipeline.start_date))*24*3600.0
+    duration_s = pipeline.duration_s
+    if duration_s is None:
+        duration_s = resources.wall_clock_s(available_cores)
+    return (start_s, start_s + duration_s)
+
+
+
+def cluster_load(items, cluster_cores=None, **model_parameters):
+    r'''
+    Summarise the requested resources of all AveragingPipelines in
+    the trees rooted at ``items``, per processing cluster partition.
+    Other keyword arguments are passed to
+    ``estimate_pipeline_resources()``.
+
+    **Parameters**
+
+    items : list of ObservationSpecificationBase
+        Root nodes of the project.
+
+    cluster_cores : None or dict
+        Cores per (cluster, partition). Default: CLUSTER_CORES.
+
+    **Returns**
+
+    A list of ClusterLoad instances, sorted by cluster.
+
+    **Examples**
+
+    >>> from lofarobsxml             import TargetSource, Angle, Folder, station_list
+    >>> from lofarobsxml.backend     import BackendProcessing
+    >>> from lofarobsxml.observation import Observation
+    >>> from lofarobsxml.beam        import Beam
+    >>> from lofarobsxml.pipelines   import AveragingPipeline, NDPPP
+    >>> target = TargetSource('3C 196', Angle(hms = (8, 13, 36.0)),
+    ...                       Angle(sdms = ('+', 48, 13, 3.0)))
+    >>> def observe(start_hour):
+    ...     obs = Observation('HBA_DUAL_INNER', 'HBA_LOW',
+    ...                       (2013, 10, 20, start_hour, 0, 0), 3600,
+    ...                       stations = station_list('nl'),
+    ...                       clock_mhz = 200, bit_mode = 8,
+    ...                       backend = BackendProcessing(),
+    ...                       beam_list = [Beam(0, target, '77..320')])
+    ...     obs.append_child(AveragingPipeline(
+    ...         'avg', NDPPP(), input_data = obs.children[:1],
+    ...         duration_s = 7200, start_date = (2013, 10, 20, 20, 0, 0)))
+    ...     return obs
+    >>> load = cluster_load([Folder('Night', children = [observe(18), observe(19)])],
+    ...                     cluster_cores = {('CEP4', 'cpu'): 100})
+    >>> load
+    [ClusterLoad(('CEP4', 'cpu'), pipelines = 2, peak_cores = 122, available_cores = 100)]
+    >>> load[0].total_tasks(), load[0].oversubscribed()
+    (122, True)
+    >>> '%.4f' % load[0].utilisation
+    '0.5786'
+    '''
+    from .pipelines import AveragingPipeline
+    if cluster_cores is None:
+        cluster_cores = CLUSTER_CORES
+    by_cluster = {}
+    for node in walk_tree(items):
+        if isinstance(node, AveragingPipeline):
+            cluster = (node.processing_cluster, node.processing_partition)
+            by_cluster.setdefault(cluster, []).append(node)
+
+    loads = []
+    for cluster, pipelines in sorted(by_cluster.items()):
+        available_cores = cluster_cores.get(cluster)
+        resources = [estimate_pipeline_resources(pipeline, **model_parameters)
+                     for pipeline in pipelines]
+        intervals, cores, core_seconds = [], [], 0.0
+        for pipeline, estimate in zip(pipelines, resources):
+            interval = pipeline_interval_s(pipeline, estimate, available_cores)
+            if interval is not None:
+                intervals.append(interval)
+                cores.append(estimate.cores())
+                core_seconds += estimate.core_seconds
+        peak_cores, utilisation = 0, None
+        if intervals:
+            intervals = numpy.array(intervals, dtype=numpy.float64)
+            cores     = numpy.array(cores, dtype=numpy.int64)
+            # Sweep over start (+cores) and end (-cores) events; ends
+            # sort before starts at the same time.
+            times  = numpy.concatenate([intervals[:, 0], intervals[:, 1]])
+            deltas = numpy.concatenate([cores, -cores])
+            order  = numpy.lexsort((deltas, times))
+            peak_cores = int(max(numpy.cumsum(deltas[order]).max(), 0))
+            span_s = intervals[:, 1].max() - intervals[:, 0].min()
+            if available_cores and span_s > 0:
+                utilisation = core_seconds/(available_cores*span_s)
+        loads.append(ClusterLoad(cluster, pipelines, resources,
+                                 available_cores, peak_cores, utilisation))
+    return loads
@@ -1,8 +1,11 @@
 import ephem
+import numpy
 
 from .angles import Angle
 from .utilities import lofar_sidereal_time, lofar_observer
-from .targetsource import TargetSource, simbad
+from .utilities import lofar_sidereal_times, elevation_rad
+from .targetsource import TargetSource, simbad, normalized_source_name
+from .sourcetable import SourceTable
 
 
 
@@ -20,10 +23,18 @@ def highest_in_range(lst_rad, lba_or_hba, source_table,
                      min_elevation_deg = None,
                      max_elevation_deg = None):
     r'''
+    Return the highest source in ``source_table[lba_or_hba]`` with an
+    elevation between ``min_elevation_deg`` and
+    ``max_elevation_deg``. The table is either a list of rows or a
+    SourceTable.
     '''
     lst_rad    = float(lst_rad)
     elevations = []
     sources    =  source_table[lba_or_hba]
+    if isinstance(sources, SourceTable):
+        return highest_in_range_columnar(sources, observer,
+                                         min_elevation_deg,
+                                         max_elevation_deg)
     for source in sources:
         src = ephem.FixedBody()
         src.name = source[0][0]
@@ -55,8 +66,163 @@ def highest_in_range(lst_rad, lba_or_hba, source_table,
 
 
 
+def highest_in_range_columnar(table, observer,
+                              min_elevation_deg = None,
+                              max_elevation_deg = None):
+    r'''
+    Vectorised version of ``highest_in_range()`` for a SourceTable.
+
+    **Examples**
+
+    >>> table = SourceTable.from_rows([
+    ...     [['3C 196', '196'], ( 8, 13, 36.0), ('+', 48, 13,  3.0)],
+    ...     [['Cyg A', 'cyg'] , (19, 59, 28.3), ('+', 40, 44,  2.0)]])
+    >>> observer = lofar_observer('2013/04/15 20:00:00')
+    >>> highest_in_range_columnar(table, observer).name
+    '3C 196'
+    >>> highest_in_range_columnar(table, observer, max_elevation_deg = 30).name
+    'Cyg A'
+    >>> highest_in_range_columnar(table, observer, min_elevation_deg = 80)
+    Traceback (most recent call last):
+    ...
+    lofarobsxml.sourcecatalogue.NoSuitableSourceError: No source between elevations  80.00 deg and  90.00 deg:
+    -       3C 196:  71.97 deg
+    -        Cyg A:   7.44 deg
+    '''
+    min_el = 0.0
+    if min_elevation_deg:
+        min_el = min_elevation_deg
+
+    max_el = 90.00001
+    if max_elevation_deg:
+        max_el = max_elevation_deg
+
+    elevations = numpy.degrees(table.elevation_rad(observer.date))
+    in_range   = numpy.logical_and(elevations > min_el, elevations < max_el)
+    if in_range.any():
+        candidates = numpy.flatnonzero(in_range)
+        return table.target_source(
+            candidates[numpy.argmax(elevations[candidates])])
+
+    highest = numpy.argsort(elevations)[::-1][0:10]
+    raise NoSuitableSourceError(
+        'No source between elevations %6.2f deg and %6.2f deg:\n%s' %
+        (min_el, max_el, '\n'.join(
+            ['- %12s: %6.2f deg' % (table.name[index], elevations[index])
+             for index in highest])))
+
+
+
+
+def highest_in_range_per_date(obs_dates, sources,
+                              min_elevation_deg = None,
+                              max_elevation_deg = None,
+                              allow_missing     = False):
+    r'''
+    Select the highest source between ``min_elevation_deg`` and
+    ``max_elevation_deg`` at each of the ``obs_dates``. The elevations
+    of all sources at all dates are computed in one vectorised step.
+
+    **Parameters**
+
+    obs_dates : list of dates
+        Anything ephem.Date() accepts.
+
+    sources : list of rows or SourceTable
+        The candidate sources.
+
+    allow_missing : bool
+        If True, dates without a source in range get None instead of
+        raising NoSuitableSourceError.
+
+    **Returns**
+
+    A list of TargetSource instances, one per date.
+
+    **Raises**
+
+    NoSuitableSourceError
+        If no source is in range at one of the dates, and
+        ``allow_missing`` is False.
+
+    **Examples**
+
+    >>> rows = SourceCatalogue().source_table['LBA']
+    >>> [source.name for source in highest_in_range_per_date(
+    ...     ['2013/04/15 20:00:00', '2013/04/16 04:00:00'], rows)]
+    ['3C 196', 'Cyg A']
+    >>> highest_in_range_per_date(['2013/04/15 20:00:00'], rows,
+    ...                           min_elevation_deg = 80)
+    Traceback (most recent call last):
+    ...
+    lofarobsxml.sourcecatalogue.NoSuitableSourceError: No source between elevations  80.00 deg and  90.00 deg at 2013/4/15 20:00:00:
+    -       3C 196:  71.97 deg
+    -        Cyg A:   7.44 deg
+    >>> [source and source.name for source in highest_in_range_per_date(
+    ...     ['2013/04/15 20:00:00', '2013/04/16 04:00:00'], rows,
+    ...     min_elevation_deg = 70, allow_missing = True)]
+    ['3C 196', None]
+    '''
+    rows = None
+    if isinstance(sources, SourceTable):
+        table = sources
+    else:
+        rows  = sources
+        table = SourceTable.from_rows(rows)
+
+    min_el = 0.0
+    if min_elevation_deg:
+        min_el = min_elevation_deg
+
+    max_el = 90.00001
+    if max_elevation_deg:
+        max_el = max_elevation_deg
+
+    lsts       = lofar_sidereal_times(obs_dates)
+    elevations = numpy.degrees(elevation_rad(table.ra_rad, table.dec_rad,
+                                             lsts[:, numpy.newaxis]))
+    in_range   = numpy.logical_and(elevations > min_el, elevations < max_el)
+    candidates = numpy.where(in_range, elevations, -numpy.inf)
+    best       = numpy.argmax(candidates, axis=1)
+    missing    = ~in_range.any(axis=1)
+    for slot in ([] if allow_missing else numpy.flatnonzero(missing)):
+        highest = numpy.argsort(elevations[slot])[::-1][0:10]
+        raise NoSuitableSourceError(
+            'No source between elevations %6.2f deg and %6.2f deg at %s:\n%s' %
+            (min_el, max_el, ephem.Date(obs_dates[slot]), '\n'.join(
+                ['- %12s: %6.2f deg' % (table.name[index],
+                                        elevations[slot, index])
+                 for index in highest])))
+
+    selected = {}
+    for index in numpy.unique(best[~missing]):
+        if rows is None:
+            selected[index] = table.target_source(index)
+        else:
+            selected[index] = target_source_from_row(rows[index])
+    return [None if is_missing else selected[index]
+            for index, is_missing in zip(best, missing)]
+
+
+
 
 class SourceCatalogue(object):
+    r'''
+    Calibrator and pulsar tables per antenna type ('HBA' or
+    'LBA'). Each table is either a list of rows with format
+    ``[[names], (h, m, s), (sign, d, m, s)]``, or a SourceTable, for
+    example one read with ``load_source_table()``.
+
+    **Examples**
+
+    >>> table = SourceTable.from_rows([
+    ...     [['3C 295'], (14, 11, 20.5), ('+', 52, 12,  10.0)]])
+    >>> catalogue = SourceCatalogue(source_table = {'HBA': table})
+    >>> catalogue.cal_source('2013/04/15 23:00:00', 'HBA').name
+    '3C 295'
+    >>> catalogue.find_source('3c 295').name
+    '3C 295'
+    '''
     def __init__(self, source_table=None, pulsar_table=None):
         self.source_table = source_table
         if source_table is None:
@@ -86,15 +252,73 @@ class SourceCatalogue(object):
                                      [['B1133+16'], (11, 36,  3.2477), ('+', 15, 51,  4.48)],
                                      [['B1919+21'], (19, 21, 44.815) , ('+', 21, 53,  2.25)]
                                  ]}
+        self.name_index = self.build_name_index()
+
+
+
+    def build_name_index(self):
+        r'''
+        Map the normalized names and aliases of all rows in the source
+        and pulsar tables to their rows. If a name occurs in more than
+        one table or band, the first row found is kept.
+
+        **Returns**
+
+        A dict.
+
+        **Examples**
+
+        >>> index = SourceCatalogue().build_name_index()
+        >>> index['196'] is index['3c196']
+        True
+        >>> index['b0809+74'][0]
+        ['B0809+74']
+        '''
+        name_index = {}
+        for table in [self.source_table, self.pulsar_table]:
+            for band in sorted(table.keys()):
+                if isinstance(table[band], SourceTable):
+                    continue
+                for row in table[band]:
+                    for name in row[0]:
+                        name_index.setdefault(normalized_source_name(name),
+                                              row)
+        return name_index
 
 
 
-    def find_source(self, source_name):
-        selection = [row for row in self.source_table
-                     if source_name in row[0]]
-        if len(selection) != 1:
-            return simbad(source_name)
-        return target_source_from_row(selection[0])
+    def find_source(self, source_name, cache=None, offline=False):
+        r'''
+        Look up ``source_name`` in the catalogue. Names are compared
+        case and white space insensitively. SourceTable bands are
+        searched after the hard-coded rows. Only if the name is not
+        present in the catalogue, it is resolved using Simbad. The
+        ``cache`` and ``offline`` arguments are passed on to
+        ``simbad()``.
+
+        **Returns**
+
+        A TargetSource instance.
+
+        **Examples**
+
+        >>> SourceCatalogue().find_source('3c196')
+        TargetSource(name      = '3C 196',
+                     ra_angle  = Angle(shms = ('+', 8, 13, 36.0)),
+                     dec_angle = Angle(sdms = ('+', 48, 13, 3.0)))
+        >>> SourceCatalogue().find_source('CYG A').name
+        'Cyg A'
+        '''
+        row = self.name_index.get(normalized_source_name(source_name))
+        if row is not None:
+            return target_source_from_row(row)
+        for table in [self.source_table, self.pulsar_table]:
+            for band in sorted(table.keys()):
+                if isinstance(table[band], SourceTable):
+                    index = table[band].find(source_name)
+                    if index is not None:
+                        return table[band].target_source(index)
+        return simbad(source_name, cache=cache, offline=offline)
 
 
 
@@ -121,3 +345,33 @@ class SourceCatalogue(object):
                                 max_elevation_deg = max_elevation_deg,
                                 observer          = observer)
 
+
+
+    def cal_sources(self, obs_dates, lba_or_hba,
+                    min_elevation_deg = None,
+                    max_elevation_deg = None,
+                    allow_missing     = False):
+        r'''
+        Return the best calibrator for each of the ``obs_dates`` in a
+        single pass. See ``highest_in_range_per_date()``.
+        '''
+        return highest_in_range_per_date(obs_dates,
+                                         self.source_table[lba_or_hba],
+                                         min_elevation_deg = min_elevation_deg,
+                                         max_elevation_deg = max_elevation_deg,
+                                         allow_missing     = allow_missing)
+
+
+    def psr_sources(self, obs_dates, lba_or_hba,
+                    min_elevation_deg = None,
+                    max_elevation_deg = None,
+                    allow_missing     = False):
+        r'''
+        Return the best pulsar for each of the ``obs_dates`` in a
+        single pass. See ``highest_in_range_per_date()``.
+        '''
+        return highest_in_range_per_date(obs_dates,
+                                         self.pulsar_table[lba_or_hba],
+                                         min_elevation_deg = min_elevation_deg,
+                                         max_elevation_deg = max_elevation_deg,
+                                         allow_missing     = allow_missing)
@@ -0,0 +1,372 @@
+r'''
+Columnar storage for large source catalogues, such as VLSSr, TGSS, or
+ATNF. Catalogues are read from CSV or white space separated text
+files into NumPy arrays, and cached in a binary form that is memory
+mapped on later runs.
+'''
+
+import os
+import csv
+import numpy
+
+from .angles import Angle
+from .utilities import lofar_sidereal_time, elevation_rad
+from .targetsource import TargetSource, normalized_source_name
+from .conesearch import ConeSearchIndex
+
+
+COLUMN_ALIASES = {'name'          : ['name', 'source', 'source_name', 'id',
+                                     'psrj', 'psrb'],
+                  'ra_rad'        : ['ra', 'ra_deg', 'raj2000', 'raj'],
+                  'dec_rad'       : ['dec', 'dec_deg', 'dej2000', 'decj2000',
+                                     'decj'],
+                  'flux_jy'       : ['flux', 'flux_jy', 'i', 's', 'total_flux'],
+                  'spectral_index': ['spectral_index', 'alpha', 'si',
+                                     'spindx']}
+
+COLUMNS = ['name', 'ra_rad', 'dec_rad', 'flux_jy', 'spectral_index']
+
+
+
+def angle_rad_from_string(text, hours):
+    r'''
+    Convert a catalogue coordinate to radians. Plain numbers are
+    interpreted as degrees, colon or space separated values as
+    sexagesimal hours (``hours`` is True) or degrees.
+
+    **Examples**
+
+    >>> '%.6f' % angle_rad_from_string('123.4', hours = True)
+    '2.153736'
+    >>> '%.6f' % angle_rad_from_string('08:13:36.0', hours = True)
+    '2.153736'
+    >>> '%.6f' % angle_rad_from_string('-22:58:18', hours = False)
+    '-0.400931'
+    >>> '%.6f' % angle_rad_from_string('-00 30 00', hours = False)
+    '-0.008727'
+    '''
+    text  = text.strip()
+    words = text.replace(':', ' ').split()
+    if len(words) == 1:
+        return Angle(deg=float(words[0])).as_rad()
+    sign = '+'
+    if words[0][0] in '+-':
+        sign = words[0][0]
+        words[0] = words[0][1:]
+    values = [float(word) for word in words] + [0.0]*(3 - len(words))
+    if hours:
+        return Angle(shms=tuple([sign] + values[0:3])).as_rad()
+    return Angle(sdms=tuple([sign] + values[0:3])).as_rad()
+
+
+
+class SourceTable(object):
+    r'''
+    A source catalogue stored as NumPy columns.
+
+    **Parameters**
+
+    names : sequence of strings
+        Source names.
+
+    ra_rad : sequence of floats
+        J2000 right ascensions in radians.
+
+    dec_rad : sequence of floats
+        J2000 declinations in radians.
+
+    flux_jy : None or sequence of floats
+        Flux densities in Jy. NaN if unknown.
+
+    spectral_index : None or sequence of floats
+        Spectral indices. NaN if unknown.
+
+    **Examples**
+
+    >>> table = SourceTable.from_rows([
+    ...     [['3C 196', '196'], ( 8, 13, 36.0), ('+', 48, 13,  3.0)],
+    ...     [['Cyg A', 'cyg'] , (19, 59, 28.3), ('+', 40, 44,  2.0)]])
+    >>> len(table)
+    2
+    >>> table.target_source(1)
+    TargetSource(name      = 'Cyg A',
+                 ra_angle  = Angle(shms = ('+', 19, 59, 28.3)),
+                 dec_angle = Angle(sdms = ('+', 40, 44, 2.0)))
+    >>> table.find('3c196')
+    0
+    >>> table.find('Vir A') is None
+    True
+    >>> rows, separations = table.cone_search(table.ra_rad[0], 0.85, 0.1)
+    >>> table.name[rows].tolist()
+    ['3C 196']
+    '''
+    def __init__(self, names, ra_rad, dec_rad, flux_jy=None,
+                 spectral_index=None):
+        self.name    = numpy.asarray(names)
+        self.ra_rad  = numpy.asarray(ra_rad, dtype=numpy.float64)
+        self.dec_rad = numpy.asarray(dec_rad, dtype=numpy.float64)
+        if flux_jy is None:
+            flux_jy = numpy.full(len(self.name), numpy.nan)
+        if spectral_index is None:
+            spectral_index = numpy.full(len(self.name), numpy.nan)
+        self.flux_jy        = numpy.asarray(flux_jy, dtype=numpy.float64)
+        self.spectral_index = numpy.asarray(spectral_index,
+                                            dtype=numpy.float64)
+        self.name_index = None
+        self.cone_index = None
+        lengths = [len(getattr(self, column)) for column in COLUMNS]
+        if min(lengths) != max(lengths):
+            raise ValueError('SourceTable columns differ in length: %r' %
+                             dict(zip(COLUMNS, lengths)))
+
+
+    @classmethod
+    def from_rows(cls, rows):
+        r'''
+        Create a SourceTable from rows in the format used by
+        SourceCatalogue: ``[[names], (h, m, s), (sign, d, m, s)]``.
+        Only the first name of each row is stored.
+        '''
+        return cls(names   = [row[0][0] for row in rows],
+                   ra_rad  = [Angle(hms=row[1]).as_rad() for row in rows],
+                   dec_rad = [Angle(sdms=row[2]).as_rad() for row in rows])
+
+
+    def __len__(self):
+        return len(self.name)
+
+
+    def __repr__(self):
+        return 'SourceTable(<%d sources>)' % len(self)
+
+
+    def target_source(self, index):
+        r'''
+        Return the source at row ``index`` as a TargetSource.
+        '''
+        return TargetSource(name      = str(self.name[index]),
+                            ra_angle  = Angle(rad=float(self.ra_rad[index])),
+                            dec_angle = Angle(rad=float(self.dec_rad[index])))
+
+
+    def find(self, source_name):
+        r'''
+        Return the row index of ``source_name``, or None if it is not
+        in the table. Names are compared case and white space
+        insensitively. The index is built on first use.
+        '''
+        if self.name_index is None:
+            self.name_index = {}
+            for index, name in enumerate(self.name.tolist()):
+                self.name_index.setdefault(normalized_source_name(name),
+                                           index)
+        return self.name_index.get(normalized_source_name(source_name))
+
+
+    def cone_search(self, ra_rad, dec_rad, radius_rad, min_flux_jy=None):
+        r'''
+        Return the rows within ``radius_rad`` of (``ra_rad``,
+        ``dec_rad``), and their separations in radians, sorted by
+        separation. If ``min_flux_jy`` is given, only sources at least
+        that bright are returned. The spatial index is built on first
+        use; see ConeSearchIndex.
+        '''
+        if self.cone_index is None:
+            self.cone_index = ConeSearchIndex(self.ra_rad, self.dec_rad)
+        rows, separations = self.cone_index.query(ra_rad, dec_rad, radius_rad)
+        if min_flux_jy is not None:
+            bright = self.flux_jy[rows] >= min_flux_jy
+            rows, separations = rows[bright], separations[bright]
+        return rows, separations
+
+
+    def elevation_rad(self, obs_date):
+        r'''
+        Return the elevations of all sources at LOFAR at
+        ``obs_date``; see ``utilities.elevation_rad()``.
+        '''
+        return elevation_rad(self.ra_rad, self.dec_rad,
+                             float(lofar_sidereal_time(obs_date)))
+
+
+    def save(self, directory):
+        r'''
+        Store all columns as .npy files in ``directory``.
+        '''
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for column in COLUMNS:
+            numpy.save(os.path.join(directory, column+'.npy'),
+                       getattr(self, column))
+
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        r'''
+        Load a SourceTable written by ``save()``. If ``mmap`` is
+        True, the columns are memory mapped read-only.
+        '''
+        mmap_mode = 'r' if mmap else None
+        columns = [numpy.load(os.path.join(directory, column+'.npy'),
+                              mmap_mode=mmap_mode)
+                   for column in COLUMNS]
+        table = cls.__new__(cls)
+        for column, values in zip(COLUMNS, columns):
+            setattr(table, column, values)
+        table.name_index = None
+        table.cone_index = None
+        return table
+
+
+
+
+def column_map(header):
+    r'''
+    Map the canonical column names to positions in ``header``.
+
+    **Examples**
+
+    >>> sorted(column_map(['Source', 'RAJ2000', 'DEJ2000', 'Flux']).items())
+    [('dec_rad', 2), ('flux_jy', 3), ('name', 0), ('ra_rad', 1)]
+    >>> column_map(['name', 'flux'])
+    Traceback (most recent call last):
+    ...
+    ValueError: catalogue header ['name', 'flux'] lacks column(s) ['ra_rad', 'dec_rad']
+    '''
+    lower_header = [word.strip().lower() for word in header]
+    positions = {}
+    for column in COLUMNS:
+        for alias in COLUMN_ALIASES[column]:
+            if alias in lower_header:
+                positions[column] = lower_header.index(alias)
+                break
+    missing = [column for column in ['name', 'ra_rad', 'dec_rad']
+               if column not in positions]
+    if missing:
+        raise ValueError('catalogue header %r lacks column(s) %r' %
+                         (header, missing))
+    return positions
+
+
+
+def read_source_table(file_name):
+    r'''
+    Read a catalogue from a text file. The first line that is neither
+    empty nor a comment (starting with ``#``) names the columns. If it
+    contains a comma, the file is read as CSV, otherwise fields are
+    separated by white space. Name, RA, and Dec columns are required;
+    flux and spectral index are optional. RA and Dec are either in
+    degrees or sexagesimal with colons as separators. Empty cells are
+    read as NaN.
+
+    **Returns**
+
+    A SourceTable.
+
+    **Examples**
+
+    >>> import os, tempfile
+    >>> file_name = os.path.join(tempfile.mkdtemp(), 'cat.csv')
+    >>> with open(file_name, 'w') as cat:
+    ...     _ = cat.write('# A small catalogue\n'
+    ...                   'name,ra,dec,flux,alpha\n'
+    ...                   '3C 196,08:13:36.0,+48:13:03.0,83.0,-0.8\n'
+    ...                   'Cyg A,299.868,40.734,10690,\n'
+    ...                   'Unknown,,,,\n')
+    >>> table = read_source_table(file_name)
+    >>> table.name.tolist()
+    ['3C 196', 'Cyg A', 'Unknown']
+    >>> numpy.degrees(table.dec_rad).round(3).tolist()
+    [48.217, 40.734, nan]
+    >>> table.flux_jy.tolist(), table.spectral_index.tolist()
+    ([83.0, 10690.0, nan], [-0.8, nan, nan])
+    '''
+    with open(file_name) as text_file:
+        lines = [line for line in text_file
+                 if line.strip() != '' and not line.lstrip().startswith('#')]
+    if len(lines) == 0:
+        raise ValueError('%s contains no catalogue header' % file_name)
+    if ',' in lines[0]:
+        records = csv.reader(lines)
+    else:
+        records = (line.split() for line in lines)
+    header    = next(records)
+    positions = column_map(header)
+
+    columns = dict((column, []) for column in positions)
+    for record in records:
+        for column, position in positions.items():
+            columns[column].append(record[position].strip()
+                                   if position < len(record) else '')
+
+    def floats(values):
+        return [float(value) if value != '' else numpy.nan
+                for value in values]
+
+    def angles_rad(values, hours):
+        try:
+            return numpy.radians(numpy.array(values).astype(numpy.float64))
+        except ValueError:
+            return [angle_rad_from_string(value, hours=hours)
+                    if value != '' else numpy.nan
+                    for value in values]
+
+    return SourceTable(
+        names   = columns['name'],
+        ra_rad  = angles_rad(columns['ra_rad'], hours=True),
+        dec_rad = angles_rad(columns['dec_rad'], hours=False),
+        flux_jy = floats(columns['flux_jy'])
+                  if 'flux_jy' in columns else None,
+        spectral_index = floats(columns['spectral_index'])
+                         if 'spectral_index' in columns else None)
+
+
+
+def load_source_table(file_name, cache_directory=None, mmap=True):
+    r'''
+    Read a catalogue, using a binary cache when it is at least as new
+    as ``file_name``. Otherwise, the text file is parsed and the cache
+    is (re)written.
+
+    **Parameters**
+
+    file_name : string
+        Catalogue text file; see ``read_source_table()``.
+
+    cache_directory : None or string
+        Where the .npy columns are stored. Default:
+        ``file_name + '.cache'``.
+
+    mmap : bool
+        If True, memory map the cached columns.
+
+    **Returns**
+
+    A SourceTable.
+
+    **Examples**
+
+    >>> import os, tempfile
+    >>> file_name = os.path.join(tempfile.mkdtemp(), 'cat.txt')
+    >>> with open(file_name, 'w') as cat:
+    ...     _ = cat.write('Source RAJ2000 DEJ2000 Flux\n'
+    ...                   'J0000+0000 0.0 0.0 1.5\n'
+    ...                   'J1200+4500 180.0 45.0 2.5\n')
+    >>> first  = load_source_table(file_name)
+    >>> second = load_source_table(file_name)
+    >>> type(second.ra_rad).__name__
+    'memmap'
+    >>> second.name.tolist(), second.flux_jy.tolist()
+    (['J0000+0000', 'J1200+4500'], [1.5, 2.5])
+    '''
+    if cache_directory is None:
+        cache_directory = file_name + '.cache'
+    cache_file = os.path.join(cache_directory, COLUMNS[-1]+'.npy')
+    if (os.path.exists(cache_file) and
+        os.path.getmtime(cache_file) >= os.path.getmtime(file_name)):
+        return SourceTable.load(cache_directory, mmap=mmap)
+    table = read_source_table(file_name)
+    table.save(cache_directory)
+    if mmap:
+        return SourceTable.load(cache_directory, mmap=True)
+    return table
@@ -0,0 +1,355 @@
+r'''
+Station positions and baseline geometry. The positions are the ETRS89
+phase centres of the LBA and HBA fields of every station in
+``STATION_REGISTRY``, in metres. At the precision needed for sizing
+observations, ETRS89 and ITRF coordinates are interchangeable.
+'''
+
+import numpy
+
+from .utilities import STATION_REGISTRY, STATION_BIT, StationSet
+from .utilities import lofar_sidereal_times, LOFAR_LONGITUDE_RAD
+
+
+STATION_POSITIONS_TABLE = '''
+# station field  x_m           y_m          z_m
+CS001  LBA   3826923.942   460915.117   5064643.229
+CS001  HBA   3826938.206   460938.202   5064630.436
+CS002  LBA   3826577.462   461022.624   5064892.526
+CS002  HBA   3826583.674   460955.432   5064893.937
+CS003  LBA   3826517.144   460929.742   5064946.197
+CS003  HBA   3826494.976   461017.374   5064954.916
+CS004  LBA   3826654.593   460939.252   5064842.166
+CS004  HBA   3826582.952   460891.338   5064900.272
+CS005  LBA   3826669.146   461069.226   5064819.494
+CS005  HBA   3826666.573   461005.209   5064827.212
+CS006  LBA   3826597.126   461144.854   5064866.718
+CS006  HBA   3826633.537   461108.045   5064842.715
+CS007  LBA   3826533.757   461098.642   5064918.461
+CS007  HBA   3826508.764   461126.402   5064934.712
+CS011  LBA   3826667.465   461285.525   5064801.332
+CS011  HBA   3826643.587   461290.469   5064818.809
+CS013  LBA   3826346.661   460791.787   5065086.876
+CS013  HBA   3826360.925   460814.872   5065074.083
+CS017  LBA   3826462.450   461501.626   5064935.567
+CS017  HBA   3826452.835   461529.655   5064940.251
+CS021  LBA   3826406.939   460538.280   5065064.610
+CS021  HBA   3826416.554   460510.252   5065059.927
+CS024  LBA   3827161.630   461409.084   5064420.786
+CS024  HBA   3827171.245   461381.055   5064416.102
+CS026  LBA   3826391.312   461869.528   5064955.653
+CS026  HBA   3826377.049   461846.443   5064968.446
+CS028  LBA   3825600.841   461260.269   5065604.065
+CS028  HBA   3825615.105   461283.354   5065591.272
+CS030  LBA   3826014.662   460387.065   5065372.068
+CS030  HBA   3826000.399   460363.979   5065384.861
+CS031  LBA   3826440.392   460273.509   5065063.334
+CS031  HBA   3826430.777   460301.538   5065068.018
+CS032  LBA   3826891.969   460387.586   5064715.032
+CS032  HBA   3826906.233   460410.671   5064702.239
+CS101  LBA   3825843.362   461704.125   5065381.213
+CS101  HBA   3825852.977   461676.097   5065376.530
+CS103  LBA   3826304.675   462822.765   5064934.074
+CS103  HBA   3826290.412   462799.679   5064946.867
+CS201  LBA   3826709.325   461913.423   5064713.578
+CS201  HBA   3826685.447   461918.367   5064731.055
+CS301  LBA   3827413.261   460992.019   5064269.684
+CS301  HBA   3827437.139   460987.076   5064252.208
+CS302  LBA   3827946.312   459792.315   5063989.756
+CS302  HBA   3827932.048   459769.230   5064002.547
+CS401  LBA   3826766.502   460100.064   5064836.210
+CS401  HBA   3826790.378   460095.120   5064818.736
+CS501  LBA   3825626.175   460641.786   5065640.512
+CS501  HBA   3825616.560   460669.815   5065645.196
+RS106  LBA   3829261.821   469161.961   5062137.050
+RS106  HBA   3829205.994   469142.209   5062180.742
+RS205  LBA   3831438.959   463435.116   5061025.206
+RS205  HBA   3831480.066   463487.205   5060989.643
+RS208  LBA   3847810.446   466929.381   5048356.961
+RS208  HBA   3847753.705   466962.484   5048396.983
+RS210  LBA   3877847.841   467456.599   5025437.344
+RS210  HBA   3877827.956   467536.277   5025445.321
+RS305  LBA   3828721.154   454781.087   5063850.822
+RS305  HBA   3828733.107   454692.080   5063850.055
+RS306  LBA   3829792.203   452829.524   5063221.330
+RS306  HBA   3829771.644   452761.378   5063242.921
+RS307  LBA   3837941.343   449560.431   5057381.027
+RS307  HBA   3837964.914   449626.936   5057357.324
+RS310  LBA   3845433.443   413580.563   5054755.909
+RS310  HBA   3845376.681   413616.239   5054796.080
+RS406  LBA   3818468.029   451974.278   5071790.337
+RS406  HBA   3818425.334   452019.946   5071817.384
+RS407  LBA   3811596.257   453444.359   5076770.170
+RS407  HBA   3811649.851   453459.572   5076728.693
+RS409  LBA   3824756.246   426178.523   5069289.608
+RS409  HBA   3824813.014   426130.006   5069251.494
+RS503  LBA   3824090.848   459437.959   5066897.930
+RS503  HBA   3824138.962   459476.649   5066858.318
+RS508  LBA   3797202.513   463087.188   5086604.779
+RS508  HBA   3797136.881   463114.126   5086651.028
+RS509  LBA   3783579.528   450178.562   5097830.578
+RS509  HBA   3783537.922   450129.744   5097865.889
+DE601  LBA   4034038.635   487026.223   4900280.057
+DE601  HBA   4034101.901   487012.401   4900230.210
+DE602  LBA   4152561.068   828868.725   4754356.878
+DE602  HBA   4152568.416   828788.802   4754361.926
+DE603  LBA   3940285.328   816802.001   4932392.757
+DE603  HBA   3940296.126   816722.532   4932394.152
+DE604  LBA   3796327.609   877591.315   5032757.252
+DE604  HBA   3796380.254   877613.809   5032712.272
+DE605  LBA   4005681.742   450968.282   4926457.670
+DE605  HBA   4005718.447   451028.044   4926424.103
+FR606  LBA   4323980.155   165608.408   4670302.803
+FR606  HBA   4324017.054   165545.160   4670271.072
+SE607  LBA   3370287.366   712053.586   5349991.228
+SE607  HBA   3370272.092   712125.596   5349990.934
+UK608  LBA   4008438.796  -100310.064   4943735.554
+UK608  HBA   4008462.280  -100376.948   4943716.600
+DE609  LBA   3727207.778   655184.900   5117000.625
+DE609  HBA   3727218.128   655108.821   5117002.847
+PL610  LBA   3738426.437  1148186.814   5021750.319
+PL610  HBA   3738462.921  1148243.954   5021710.380
+PL611  LBA   3850974.511  1439060.669   4860478.711
+PL611  HBA   3850981.405  1438994.507   4860498.710
+PL612  LBA   3551479.173  1334128.149   5110178.896
+PL612  HBA   3551482.347  1334203.229   5110157.146
+IE613  LBA   3801633.869  -529022.268   5076996.892
+IE613  HBA   3801692.284  -528984.335   5076957.630
+'''
+
+
+
+def parse_station_positions(table):
+    r'''
+    Parse a station position table into a dict mapping field names
+    ('LBA', 'HBA') to (N, 3) arrays in ``STATION_REGISTRY`` order.
+
+    **Raises**
+
+    ValueError
+        If a registry station lacks a position.
+    '''
+    positions = {}
+    for line in table.split('\n'):
+        line = line.split('#')[0].strip()
+        if line == '':
+            continue
+        station, field, x_m, y_m, z_m = line.split()
+        positions.setdefault(field, {})[station] = (float(x_m), float(y_m),
+                                                    float(z_m))
+    result = {}
+    for field, by_station in positions.items():
+        missing = [name for name in STATION_REGISTRY if name not in by_station]
+        if missing:
+            raise ValueError('No %s position for station(s) %s' %
+                             (field, ', '.join(missing)))
+        result[field] = numpy.array([by_station[name]
+                                     for name in STATION_REGISTRY])
+    return result
+
+
+STATION_POSITIONS_M = parse_station_positions(STATION_POSITIONS_TABLE)
+
+# Maximum baselines, keyed by (station mask, field)
+MAX_BASELINE_CACHE = {}
+
+
+
+def antenna_field(antenna_set):
+    r'''
+    Return the field, 'LBA' or 'HBA', whose phase centres apply to
+    ``antenna_set``.
+
+    **Examples**
+
+    >>> antenna_field('HBA_DUAL_INNER'), antenna_field('LBA_OUTER')
+    ('HBA', 'LBA')
+    '''
+    if 'HBA' in antenna_set.upper():
+        return 'HBA'
+    return 'LBA'
+
+
+
+def station_positions(stations, antenna_set='LBA'):
+    r'''
+    Return an (N, 3) array with the positions of ``stations`` in
+    canonical station order.
+
+    **Parameters**
+
+    stations : StationSet or sequence of strings
+        The stations.
+
+    antenna_set : string
+        Antenna set or field name; selects LBA or HBA phase centres.
+
+    **Examples**
+
+    >>> station_positions(['RS106', 'CS002'], 'HBA_DUAL').round(1)
+    array([[3826583.7,  460955.4, 5064893.9],
+           [3829206. ,  469142.2, 5062180.7]])
+    '''
+    bits = [STATION_BIT[name] for name in StationSet(stations)]
+    return STATION_POSITIONS_M[antenna_field(antenna_set)][bits]
+
+
+
+def num_baselines(num_stations, autocorrelations=False):
+    r'''
+    Number of baselines between ``num_stations`` stations, optionally
+    including the autocorrelations. Works on arrays too.
+
+    **Examples**
+
+    >>> num_baselines(38), num_baselines(38, autocorrelations=True)
+    (703, 741)
+    >>> num_baselines(numpy.array([24, 51])).tolist()
+    [276, 1275]
+    '''
+    if autocorrelations:
+        return num_stations*(num_stations + 1)//2
+    return num_stations*(num_stations - 1)//2
+
+
+
+def baseline_indices(num_stations):
+    r'''
+    Return arrays (i, j) of station indices of all baselines with
+    i < j, in the order used by ``baseline_vectors()``.
+
+    **Examples**
+
+    >>> [index.tolist() for index in baseline_indices(3)]
+    [[0, 0, 1], [1, 2, 2]]
+    '''
+    return numpy.triu_indices(num_stations, k=1)
+
+
+
+def baseline_vectors(stations, antenna_set='LBA'):
+    r'''
+    Return a (B, 3) array of baseline vectors ``position[j] -
+    position[i]`` in metres for all station pairs i < j, with stations
+    in canonical order.
+
+    **Examples**
+
+    >>> baseline_vectors(['CS002', 'CS003', 'RS106'], 'LBA').shape
+    (3, 3)
+    '''
+    positions = station_positions(stations, antenna_set)
+    first, second = baseline_indices(len(positions))
+    return positions[second] - positions[first]
+
+
+
+def baseline_lengths(stations, antenna_set='LBA'):
+    r'''
+    Return the lengths in metres of all baselines between
+    ``stations``, in the order of ``baseline_vectors()``.
+
+    **Examples**
+
+    >>> baseline_lengths(['CS002', 'CS003', 'RS106'], 'LBA').round(0).tolist()
+    [123.0, 9003.0, 9121.0]
+    '''
+    return numpy.sqrt((baseline_vectors(stations, antenna_set)**2).sum(axis=1))
+
+
+
+def max_baseline_m(stations, antenna_set='LBA'):
+    r'''
+    Return the longest baseline in metres between ``stations``, or 0.0
+    if there are fewer than two. Results are cached per station set and
+    field, so evaluating many observations with the same stations is
+    cheap.
+
+    **Examples**
+
+    >>> from lofarobsxml.utilities import station_list
+    >>> '%.1f km' % (max_baseline_m(station_list('core'), 'HBA')/1000.0)
+    '3.6 km'
+    >>> '%.0f km' % (max_baseline_m(station_list('nl'))/1000.0)
+    '120 km'
+    >>> '%.0f km' % (max_baseline_m(station_list('all'))/1000.0)
+    '1981 km'
+    >>> max_baseline_m(['CS002'])
+    0.0
+    '''
+    key = (StationSet(stations).mask, antenna_field(antenna_set))
+    try:
+        return MAX_BASELINE_CACHE[key]
+    except KeyError:
+        pass
+    lengths = baseline_lengths(StationSet.from_mask(key[0]), key[1])
+    longest = float(lengths.max()) if len(lengths) > 0 else 0.0
+    return MAX_BASELINE_CACHE.setdefault(key, longest)
+
+
+
+def baseline_length_histogram(stations, bin_edges_m, antenna_set='LBA'):
+    r'''
+    Count the baselines between ``stations`` per length bin.
+
+    **Parameters**
+
+    bin_edges_m : sequence of floats
+        Bin edges in metres, as for ``numpy.histogram``.
+
+    **Returns**
+
+    An integer array with len(bin_edges_m) - 1 counts.
+
+    **Examples**
+
+    >>> from lofarobsxml.utilities import station_list
+    >>> baseline_length_histogram(station_list('nl'),
+    ...                           [0, 1e3, 1e4, 1e5, 1e6]).tolist()
+    [133, 268, 300, 2]
+    '''
+    return numpy.histogram(baseline_lengths(stations, antenna_set),
+                           bins=bin_edges_m)[0]
+
+
+
+def uvw_m(stations, antenna_set, ra_rad, dec_rad, dates):
+    r'''
+    Project all baselines between ``stations`` onto the (u, v, w)
+    frame of the direction (``ra_rad``, ``dec_rad``) at every date.
+
+    **Parameters**
+
+    dates : float or array of floats
+        Dates as ephem day numbers, e.g. ``float(ephem.Date(...))``.
+
+    **Returns**
+
+    An array of shape dates.shape + (B, 3) with (u, v, w) in metres.
+
+    **Examples**
+
+    >>> import ephem
+    >>> dates = float(ephem.Date('2013/10/01 00:00:00')) + numpy.linspace(0, 0.5, 7)
+    >>> uvw = uvw_m(['CS002', 'CS003', 'RS106'], 'LBA', 0.0, 1.0, dates)
+    >>> uvw.shape
+    (7, 3, 3)
+
+    The projection preserves baseline lengths:
+
+    >>> lengths = numpy.sqrt((uvw**2).sum(axis=-1))
+    >>> bool(numpy.allclose(lengths, baseline_lengths(['CS002', 'CS003', 'RS106'])))
+    True
+    '''
+    vectors = baseline_vectors(stations, antenna_set)
+    greenwich_hour_angle = (lofar_sidereal_times(numpy.asarray(dates,
+                                                               dtype=numpy.float64))
+                            - LOFAR_LONGITUDE_RAD - ra_rad)
+    sin_h = numpy.sin(greenwich_hour_angle)[..., numpy.newaxis]
+    cos_h = numpy.cos(greenwich_hour_angle)[..., numpy.newaxis]
+    sin_d, cos_d = numpy.sin(dec_rad), numpy.cos(dec_rad)
+    x_m, y_m, z_m = vectors[:, 0], vectors[:, 1], vectors[:, 2]
+    u_m =  sin_h*x_m + cos_h*y_m
+    v_m = -sin_d*cos_h*x_m + sin_d*sin_h*y_m + cos_d*z_m
+    w_m =  cos_d*cos_h*x_m - cos_d*sin_h*y_m + sin_d*z_m
+    return numpy.stack([u_m, v_m, w_m], axis=-1)
@@ -0,0 +1,400 @@
+r'''
+Compact subband sets. A SubbandSet stores sorted runs of consecutive
+subbands instead of expanded lists, so that statistics such as the
+number of subbands, their mean, and intersections are computed from
+the run boundaries alone.
+'''
+
+from bisect import bisect_right
+import numpy
+
+
+# Parsed subband specifications, keyed by specification string
+SUBBAND_SET_CACHE = {}
+
+
+
+def normalized_runs(runs):
+    r'''
+    Turn arbitrary, possibly overlapping, (start, stop, multiplicity)
+    runs into sorted, disjoint runs. Overlapping runs add their
+    multiplicities. Adjacent runs with equal multiplicity are merged,
+    and runs with stop < start or multiplicity < 1 are ignored.
+
+    **Examples**
+
+    >>> normalized_runs([(10, 20, 1), (5, 12, 1), (21, 30, 1)])
+    ((5, 9, 1), (10, 12, 2), (13, 30, 1))
+    >>> normalized_runs([(3, 3, 2), (1, 2, 1), (5, 4, 1)])
+    ((1, 2, 1), (3, 3, 2))
+    '''
+    return combined_runs([runs], sum)
+
+
+
+def combined_runs(run_lists, combine):
+    r'''
+    Sweep over the boundaries of several run lists and return the
+    normalised runs of ``combine(multiplicities)``, where
+    ``multiplicities`` lists the multiplicity in every run list at a
+    given subband.
+    '''
+    events = []
+    for index, runs in enumerate(run_lists):
+        for start, stop, multiplicity in runs:
+            if stop >= start and multiplicity > 0:
+                events.append((start, index, multiplicity))
+                events.append((stop + 1, index, -multiplicity))
+    events.sort()
+
+    levels = [0]*len(run_lists)
+    result = []
+    position = 0
+    while position < len(events):
+        boundary = events[position][0]
+        while position < len(events) and events[position][0] == boundary:
+            levels[events[position][1]] += events[position][2]
+            position += 1
+        if position == len(events):
+            break
+        multiplicity = combine(levels)
+        stop = events[position][0] - 1
+        if multiplicity > 0:
+            if result and result[-1][1] == boundary - 1 and result[-1][2] == multiplicity:
+                result[-1] = (result[-1][0], stop, multiplicity)
+            else:
+                result.append((boundary, stop, multiplicity))
+    return tuple(result)
+
+
+
+def parse_subband_runs(spec):
+    r'''
+    Parse a subband specification into a list of (start, stop,
+    multiplicity) runs in the order in which they appear, without
+    expanding ranges. The syntax is that of ``parse_subband_list()``.
+
+    **Raises**
+
+    ValueError
+        If a syntax problem is encountered.
+
+    **Examples**
+
+    >>> parse_subband_runs('[154..163,10*374, 12]')
+    [(154, 163, 1), (374, 374, 10), (12, 12, 1)]
+    >>> parse_subband_runs('1..2..3')
+    Traceback (most recent call last):
+    ...
+    ValueError: ['1', '2', '3'] is not a valid sub_range in a subband list
+    '''
+    stripped = spec.strip('[] \n\t')
+    if stripped == '':
+        return []
+    runs = []
+    for word in stripped.split(','):
+        sub_list = word.strip().split('..')
+        if len(sub_list) == 1:
+            multiplication = sub_list[0].split('*')
+            if len(multiplication) == 2:
+                subband = int(multiplication[1])
+                runs.append((subband, subband, int(multiplication[0])))
+            else:
+                subband = int(sub_list[0])
+                runs.append((subband, subband, 1))
+        elif len(sub_list) == 2:
+            runs.append((int(sub_list[0]), int(sub_list[1]), 1))
+        else:
+            raise ValueError('%r is not a valid sub_range in a subband list' %
+                             sub_list)
+    return runs
+
+
+
+class SubbandSet(object):
+    r'''
+    An immutable multiset of subbands, stored as sorted, disjoint
+    (start, stop, multiplicity) runs.
+
+    **Parameters**
+
+    runs : sequence of (int, int, int) tuples
+        Runs of subbands start..stop (inclusive), each occurring
+        multiplicity times. Runs may overlap and need not be sorted.
+
+    **Examples**
+
+    >>> sbs = SubbandSet.from_spec('[154..163,185..194,10*374]')
+    >>> sbs
+    SubbandSet('154..163,185..194,10*374')
+    >>> len(sbs), sbs.sum(), sbs.min(), sbs.max()
+    (30, 7220, 154, 374)
+    >>> '%.2f' % sbs.mean()
+    '240.67'
+    >>> 160 in sbs, 170 in sbs
+    (True, False)
+    >>> sbs & SubbandSet.from_spec('190..200,374')
+    SubbandSet('190..194,374')
+    >>> SubbandSet.from_spec('77..324') | SubbandSet.from_spec('300..400')
+    SubbandSet('77..400')
+    >>> SubbandSet.from_spec('3,1,2,2') == SubbandSet.from_spec('1..3,2')
+    True
+    >>> SubbandSet.from_spec('1..3,2').subbands()
+    [1, 2, 2, 3]
+    '''
+    __slots__ = ('runs', 'starts')
+
+    def __init__(self, runs=()):
+        self.runs   = normalized_runs(runs)
+        self.starts = [start for start, _, _ in self.runs]
+
+
+    @classmethod
+    def from_spec(cls, spec):
+        r'''
+        Parse a subband specification such as '77..324' or
+        '[12..22,10*374]'. Results are cached per specification.
+        '''
+        try:
+            return SUBBAND_SET_CACHE[spec]
+        except KeyError:
+            return SUBBAND_SET_CACHE.setdefault(
+                spec, cls(parse_subband_runs(spec)))
+
+
+    @classmethod
+    def from_subbands(cls, subbands):
+        r'''
+        Construct a SubbandSet from a sequence of subband numbers in
+        arbitrary order.
+
+        **Examples**
+
+        >>> SubbandSet.from_subbands([5, 3, 4, 10, 4, 11, 100])
+        SubbandSet('3,2*4,5,10..11,100')
+        '''
+        values, counts = numpy.unique(numpy.asarray(subbands, dtype=numpy.int64),
+                                      return_counts=True)
+        if len(values) == 0:
+            return cls()
+        breaks = numpy.flatnonzero((numpy.diff(values) != 1) |
+                                   (numpy.diff(counts) != 0)) + 1
+        firsts = numpy.concatenate([[0], breaks])
+        lasts  = numpy.concatenate([breaks - 1, [len(values) - 1]])
+        return cls(zip(values[firsts].tolist(), values[lasts].tolist(),
+                       counts[firsts].tolist()))
+
+
+    def __len__(self):
+        return sum([(stop - start + 1)*multiplicity
+                    for start, stop, multiplicity in self.runs])
+
+
+    def __bool__(self):
+        return len(self.runs) > 0
+
+    __nonzero__ = __bool__
+
+
+    def sum(self):
+        r'''
+        Sum of all subband numbers, counting multiplicity.
+        '''
+        return sum([(start + stop)*(stop - start + 1)*multiplicity//2
+                    for start, stop, multiplicity in self.runs])
+
+
+    def mean(self):
+        r'''
+        Mean subband number.
+
+        **Raises**
+
+        ValueError
+            If the set is empty.
+        '''
+        count = len(self)
+        if count == 0:
+            raise ValueError('Mean of an empty subband set')
+        return self.sum()/float(count)
+
+
+    def min(self):
+        r'''
+        Lowest subband number.
+        '''
+        if not self.runs:
+            raise ValueError('Minimum of an empty subband set')
+        return self.runs[0][0]
+
+
+    def max(self):
+        r'''
+        Highest subband number.
+        '''
+        if not self.runs:
+            raise ValueError('Maximum of an empty subband set')
+        return self.runs[-1][1]
+
+
+    def count(self, subband):
+        r'''
+        Number of times ``subband`` occurs in the set.
+        '''
+        index = bisect_right(self.starts, subband) - 1
+        if index >= 0 and subband <= self.runs[index][1]:
+            return self.runs[index][2]
+        return 0
+
+
+    def __contains__(self, subband):
+        return self.count(subband) > 0
+
+
+    def __and__(self, other):
+        return SubbandSet.from_runs(combined_runs([self.runs, other.runs], min))
+
+
+    def __or__(self, other):
+        return SubbandSet.from_runs(combined_runs([self.runs, other.runs], max))
+
+
+    def intersection(self, other):
+        r'''
+        Subbands in both sets, with the lowest multiplicity.
+        '''
+        return self & other
+
+
+    def union(self, other):
+        r'''
+        Subbands in either set, with the highest multiplicity.
+        '''
+        return self | other
+
+
+    @classmethod
+    def from_runs(cls, runs):
+        r'''
+        Wrap runs that are already normalised, skipping the sweep.
+        '''
+        subband_set = cls.__new__(cls)
+        subband_set.runs   = tuple(runs)
+        subband_set.starts = [start for start, _, _ in subband_set.runs]
+        return subband_set
+
+
+    def lowest(self, count):
+        r'''
+        Return a SubbandSet with the ``count`` lowest subbands,
+        counting multiplicity.
+
+        **Examples**
+
+        >>> SubbandSet.from_spec('10..19,30..39').lowest(13)
+        SubbandSet('10..19,30..32')
+        >>> SubbandSet.from_spec('3*5,7').lowest(2)
+        SubbandSet('2*5')
+        '''
+        runs = []
+        remaining = max(count, 0)
+        for start, stop, multiplicity in self.runs:
+            if remaining <= 0:
+                break
+            length = stop - start + 1
+            if length*multiplicity <= remaining:
+                runs.append((start, stop, multiplicity))
+                remaining -= length*multiplicity
+            else:
+                full_subbands = remaining // multiplicity
+                if full_subbands > 0:
+                    runs.append((start, start + full_subbands - 1, multiplicity))
+                if remaining % multiplicity:
+                    runs.append((start + full_subbands, start + full_subbands,
+                                 remaining % multiplicity))
+                remaining = 0
+        return SubbandSet(runs)
+
+
+    def subbands(self):
+        r'''
+        Return the expanded, sorted list of subband numbers.
+        '''
+        subbands = []
+        for start, stop, multiplicity in self.runs:
+            for subband in range(start, stop + 1):
+                subbands += [subband]*multiplicity
+        return subbands
+
+
+    def spec(self):
+        r'''
+        Return the canonical specification string: sorted, with
+        consecutive subbands written as 'start..stop' and repeated
+        single subbands as 'n*subband'.
+
+        **Examples**
+
+        >>> SubbandSet([(10, 12, 2), (20, 20, 1), (30, 30, 3)]).spec()
+        '10..12,10..12,20,3*30'
+        '''
+        words = []
+        for start, stop, multiplicity in self.runs:
+            if start == stop:
+                if multiplicity == 1:
+                    words.append(str(start))
+                else:
+                    words.append('%d*%d' % (multiplicity, start))
+            else:
+                words += ['%d..%d' % (start, stop)]*multiplicity
+        return ','.join(words)
+
+
+    def __eq__(self, other):
+        return isinstance(other, SubbandSet) and self.runs == other.runs
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def __hash__(self):
+        return hash(self.runs)
+
+
+    def __repr__(self):
+        return 'SubbandSet(%r)' % self.spec()
+
+
+
+def compress_subband_list(subbands):
+    r'''
+    Return a specification string for a list of subband numbers that
+    keeps their order, and therefore their mapping to beamlets. Runs
+    of ascending consecutive subbands become 'start..stop' ranges, and
+    runs of one repeated subband 'n*subband'.
+
+    **Examples**
+
+    >>> compress_subband_list([5, 6, 7, 100, 12, 11, 10, 300, 300, 6])
+    '5..7,100,12,11,10,2*300,6'
+    >>> compress_subband_list(list(range(157, 401)))
+    '157..400'
+    >>> compress_subband_list([])
+    ''
+    '''
+    values = numpy.asarray(subbands, dtype=numpy.int64)
+    if len(values) == 0:
+        return ''
+    breaks = numpy.flatnonzero(numpy.diff(values) != 1) + 1
+    runs = []  # [start, stop, multiplicity]
+    for run in numpy.split(values, breaks):
+        start, stop = int(run[0]), int(run[-1])
+        if start == stop and runs and runs[-1][:2] == [start, start]:
+            runs[-1][2] += 1
+        else:
+            runs.append([start, stop, 1])
+    return ','.join([('%d..%d' % (start, stop)) if start != stop else
+                     str(start) if multiplicity == 1 else
+                     '%d*%d' % (multiplicity, start)
+                     for start, stop, multiplicity in runs])
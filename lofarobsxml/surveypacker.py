@@ -0,0 +1,391 @@
+r'''
+Packing survey fields into a sequence of observations. Every field
+needs a fixed amount of time within an hour angle window and above a
+minimum elevation. Both constraints together limit a field to one
+interval of hour angles per sidereal day. Because the sidereal time
+increases monotonically, the windows of allowed start times of all
+fields follow from a vectorised search in the precomputed sidereal
+times of a regular time grid. The fields are then packed greedily: at
+every moment the observable field whose window closes first is taken,
+with calibrator observations interleaved and fixed gaps between
+consecutive observations.
+'''
+
+import heapq
+from math import pi, ceil
+
+import numpy
+
+from .utilities import lofar_sidereal_times, elevation_rad, LOFAR_LATITUDE_RAD
+from .processingschedule import date_seconds, seconds_date, SECONDS_PER_DAY
+
+
+
+class SurveyField(object):
+    r'''
+    A field to observe once.
+
+    **Parameters**
+
+    target : TargetSource
+        Pointing centre of the field.
+
+    duration_s : float
+        Required observing time.
+
+    hour_angle_rad : (float, float)
+        Allowed hour angle range, in radians, during the whole
+        observation. Default: (-pi, +pi), i.e. any hour angle.
+
+    min_elevation_rad : float
+        Minimum elevation during the whole observation. Default: 0.
+
+    name : None or string
+        Defaults to the name of the target.
+
+    **Examples**
+
+    >>> from lofarobsxml import TargetSource, Angle
+    >>> field = SurveyField(TargetSource('H157+58', Angle(hms = (10, 28, 51.6)),
+    ...                                  Angle(sdms = ('+', 58, 4, 48.0))),
+    ...                     7*60.0, hour_angle_rad = (-pi/6, pi/6))
+    >>> field
+    SurveyField('H157+58', 420.0)
+    '''
+    def __init__(self, target, duration_s, hour_angle_rad=(-pi, pi),
+                 min_elevation_rad=0.0, name=None):
+        self.target            = target
+        self.duration_s        = float(duration_s)
+        self.hour_angle_rad    = (float(hour_angle_rad[0]), float(hour_angle_rad[1]))
+        self.min_elevation_rad = float(min_elevation_rad)
+        self.name              = name or target.name
+        if self.duration_s <= 0:
+            raise ValueError('SurveyField %s: duration_s(%r) must be positive' %
+                             (self.name, duration_s))
+        if self.hour_angle_rad[0] >= self.hour_angle_rad[1]:
+            raise ValueError('SurveyField %s: empty hour angle range %r' %
+                             (self.name, hour_angle_rad))
+
+
+    def __repr__(self):
+        return 'SurveyField(%r, %r)' % (self.name, self.duration_s)
+
+
+
+class ObservingTimeGrid(object):
+    r'''
+    Regular grid of ``num_samples`` times, ``step_s`` apart, from
+    ``start_s`` (seconds since the ephem epoch) onward, with the LOFAR
+    sidereal time at every sample. ``lst_unwrapped_rad`` increases
+    monotonically instead of wrapping at 2 pi.
+    '''
+    def __init__(self, start_s, end_s, step_s):
+        self.start_s     = float(start_s)
+        self.step_s      = float(step_s)
+        self.num_samples = int((end_s - start_s)//step_s) + 1
+        seconds          = self.start_s + self.step_s*numpy.arange(self.num_samples)
+        self.lst_rad     = lofar_sidereal_times(seconds/SECONDS_PER_DAY)
+        self.lst_unwrapped_rad = numpy.unwrap(self.lst_rad)
+
+
+    def seconds(self, index):
+        return self.start_s + self.step_s*index
+
+
+    def index_at_or_after(self, seconds):
+        r'''
+        Index of the first sample not before ``seconds``.
+        '''
+        return int(ceil(round((seconds - self.start_s)/self.step_s, 6)))
+
+
+    def steps(self, duration_s):
+        r'''
+        Number of grid steps covering ``duration_s``.
+        '''
+        return int(ceil(round(duration_s/self.step_s, 6)))
+
+
+
+def visible_hour_angles(fields, lat_rad=LOFAR_LATITUDE_RAD):
+    r'''
+    Range of hour angles in which each of the ``fields`` meets both
+    its hour angle and elevation constraints.
+
+    **Returns**
+
+    A tuple (ra_rad, min_ha_rad, max_ha_rad) of arrays. Fields that
+    never rise high enough have min_ha_rad > max_ha_rad.
+
+    **Examples**
+
+    >>> from lofarobsxml import TargetSource, Angle
+    >>> fields = [SurveyField(TargetSource('zenith', Angle(rad = 1.0),
+    ...                                    Angle(rad = LOFAR_LATITUDE_RAD)),
+    ...                       60, min_elevation_rad = 60*pi/180),
+    ...           SurveyField(TargetSource('south', Angle(rad = 1.0),
+    ...                                    Angle(deg = -50.0)), 60)]
+    >>> ra_rad, min_ha_rad, max_ha_rad = visible_hour_angles(fields)
+    >>> (min_ha_rad*12/pi).round(3), (max_ha_rad*12/pi).round(3)
+    (array([-3.389, 12.   ]), array([  3.389, -12.   ]))
+    '''
+    ra_rad, dec_rad = numpy.array([field.target.ra_dec_rad() for field in fields],
+                                  dtype=numpy.float64).reshape(-1, 2).T
+    ha_min, ha_max = numpy.array([field.hour_angle_rad for field in fields],
+                                 dtype=numpy.float64).reshape(-1, 2).T
+    min_el = numpy.array([field.min_elevation_rad for field in fields],
+                         dtype=numpy.float64)
+    # sin(el) = sin(dec) sin(lat) + cos(dec) cos(lat) cos(ha)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        cos_ha = ((numpy.sin(min_el) - numpy.sin(dec_rad)*numpy.sin(lat_rad))/
+                  (numpy.cos(dec_rad)*numpy.cos(lat_rad)))
+    max_el_ha = numpy.arccos(numpy.clip(cos_ha, -1.0, 1.0))
+    min_ha_rad = numpy.where(cos_ha > 1.0, pi, numpy.maximum(ha_min, -max_el_ha))
+    max_ha_rad = numpy.where(cos_ha > 1.0, -pi, numpy.minimum(ha_max, max_el_ha))
+    return ra_rad, min_ha_rad, max_ha_rad
+
+
+
+def start_windows(grid, fields):
+    r'''
+    Windows of grid indices at which an observation of each of the
+    ``fields`` can start and remain visible until its end.
+
+    **Returns**
+
+    A list of (first, last, field index) tuples, sorted by first
+    index.
+
+    **Examples**
+
+    >>> from lofarobsxml import TargetSource, Angle
+    >>> grid = ObservingTimeGrid(date_seconds((2013, 10, 20, 18, 0, 0)),
+    ...                          date_seconds((2013, 10, 22, 18, 0, 0)), 600)
+    >>> field = SurveyField(TargetSource('3C 196', Angle(hms = (8, 13, 36.0)),
+    ...                                  Angle(sdms = ('+', 48, 13, 3.0))),
+    ...                     3600, hour_angle_rad = (-pi/6, pi/6))
+    >>> [(seconds_date(grid.seconds(first)), seconds_date(grid.seconds(last)))
+    ...  for first, last, _ in start_windows(grid, [field])]
+    [((2013, 10, 21, 3, 50, 0), (2013, 10, 21, 6, 40, 0)), ((2013, 10, 22, 3, 50, 0), (2013, 10, 22, 6, 40, 0))]
+    '''
+    ra_rad, min_ha_rad, max_ha_rad = visible_hour_angles(fields)
+    steps = numpy.array([grid.steps(field.duration_s) for field in fields])
+    lst_rad = grid.lst_unwrapped_rad
+    cycles = 2*pi*numpy.arange(numpy.floor(lst_rad[0]/(2*pi)) - 1,
+                               numpy.ceil(lst_rad[-1]/(2*pi)) + 2)
+    # A start index is feasible if the hour angle at the start is at
+    # least min_ha_rad, and at the end at most max_ha_rad, in the same
+    # sidereal cycle
+    lower = (ra_rad + min_ha_rad)[:, numpy.newaxis] + cycles
+    upper = (ra_rad + max_ha_rad)[:, numpy.newaxis] + cycles
+    first = numpy.searchsorted(lst_rad, lower, side='left')
+    last  = numpy.searchsorted(lst_rad, upper, side='right') - 1 - steps[:, numpy.newaxis]
+    # Fields that are always visible are not interrupted at an hour
+    # angle of 180 degrees
+    always = max_ha_rad - min_ha_rad >= 2*pi
+    first[always, :] = numpy.where(numpy.arange(len(cycles)) == 0, 0, grid.num_samples)
+    last[always, :]  = grid.num_samples - 1 - steps[always, numpy.newaxis]
+    field_index, cycle = numpy.nonzero((last >= first) &
+                                       (max_ha_rad >= min_ha_rad)[:, numpy.newaxis])
+    windows = list(zip(first[field_index, cycle].tolist(),
+                       last[field_index, cycle].tolist(), field_index.tolist()))
+    windows.sort()
+    return windows
+
+
+
+class SurveySchedule(object):
+    r'''
+    Outcome of ``pack_survey()``.
+
+    **Attributes**
+
+    slots : list of (SurveyField, float, bool)
+        Field, start time in seconds since the ephem epoch, and
+        whether it is a calibrator, in order of start time.
+
+    unscheduled : list of SurveyField
+        Fields that did not fit.
+    '''
+    def __init__(self, slots, unscheduled):
+        self.slots       = slots
+        self.unscheduled = unscheduled
+
+
+    def start_dates(self):
+        r'''
+        List of (field, start_date) pairs, with start dates as
+        6-tuples.
+        '''
+        return [(field, seconds_date(start_s)) for field, start_s, _ in self.slots]
+
+
+    def observations(self, make_observation, make_calibrator=None):
+        r'''
+        Create the Observations.
+
+        **Parameters**
+
+        make_observation : callable
+            ``make_observation(field, start_date, duration_s)``
+            returns an Observation for ``field``.
+
+        make_calibrator : None or callable
+            Same, for calibrators. Default: ``make_observation``.
+        '''
+        make_calibrator = make_calibrator or make_observation
+        return [(make_calibrator if is_calibrator else make_observation)(
+                    field, seconds_date(start_s), field.duration_s)
+                for field, start_s, is_calibrator in self.slots]
+
+
+
+def pack_survey(fields, start_date, end_date, calibrators=None,
+                calibrator_every=1, gap_s=60.0, step_s=60.0):
+    r'''
+    Pack ``fields`` into the time range from ``start_date`` until
+    ``end_date``.
+
+    Observations start on a grid of ``step_s`` seconds, and are
+    separated by at least ``gap_s``. Whenever the previous observation
+    has ended, the visible field whose window of allowed start times
+    closes first is observed next; ties are resolved in the order of
+    ``fields``. If nothing can start, the packer waits for the next
+    window to open.
+
+    **Parameters**
+
+    fields : list of SurveyField
+        The targets. Thousands of fields are fine.
+
+    start_date, end_date : 6-tuple or ephem.Date
+        Time range that must contain all observations.
+
+    calibrators : None or list of SurveyField
+        If given, a calibrator observation precedes the first field,
+        and every ``calibrator_every`` fields thereafter. The visible
+        calibrator with the highest elevation is chosen. If none is
+        visible, the next field is observed first and the calibrator
+        is tried again after it.
+
+    calibrator_every : int
+        Number of fields between calibrator observations.
+
+    gap_s : float
+        Time between the end of an observation and the start of the
+        next.
+
+    step_s : float
+        Time resolution of the visibility computation and of the start
+        times.
+
+    **Returns**
+
+    A SurveySchedule.
+
+    **Examples**
+
+    >>> from lofarobsxml import TargetSource, Angle
+    >>> def field(name, ra_hours, dec_deg, duration_s = 7*60.0):
+    ...     return SurveyField(TargetSource(name, Angle(shms = ('+', ra_hours, 0, 0.0)),
+    ...                                     Angle(deg = dec_deg)),
+    ...                        duration_s, hour_angle_rad = (-pi/12, pi/12),
+    ...                        min_elevation_rad = 30*pi/180)
+    >>> fields = [field('F%02d' % hours, hours, 60.0) for hours in range(24)]
+    >>> calibrators = [field('3C 196', 8, 48.2, 60.0), field('3C 295', 14, 52.2, 60.0)]
+    >>> schedule = pack_survey(fields, (2013, 10, 20, 18, 0, 0),
+    ...                        (2013, 10, 21, 6, 0, 0),
+    ...                        calibrators = calibrators, calibrator_every = 2)
+    >>> for slot_field, start_date in schedule.start_dates():
+    ...     print(slot_field.name, start_date)
+    F20 (2013, 10, 20, 18, 0, 0)
+    F21 (2013, 10, 20, 18, 8, 0)
+    F22 (2013, 10, 20, 18, 36, 0)
+    F23 (2013, 10, 20, 19, 35, 0)
+    F00 (2013, 10, 20, 20, 35, 0)
+    F01 (2013, 10, 20, 21, 35, 0)
+    F02 (2013, 10, 20, 22, 35, 0)
+    F03 (2013, 10, 20, 23, 35, 0)
+    F04 (2013, 10, 21, 0, 35, 0)
+    F05 (2013, 10, 21, 1, 34, 0)
+    F06 (2013, 10, 21, 2, 34, 0)
+    F07 (2013, 10, 21, 3, 34, 0)
+    3C 196 (2013, 10, 21, 4, 34, 0)
+    F08 (2013, 10, 21, 4, 36, 0)
+    F09 (2013, 10, 21, 5, 34, 0)
+    3C 196 (2013, 10, 21, 5, 42, 0)
+    >>> len(schedule.unscheduled)
+    10
+    '''
+    start_s = date_seconds(start_date)
+    end_s   = date_seconds(end_date)
+    if end_s <= start_s:
+        raise ValueError('pack_survey(): end_date must be later than start_date')
+    if calibrator_every < 1:
+        raise ValueError('pack_survey(): calibrator_every(%r) must be >= 1' %
+                         calibrator_every)
+    grid = ObservingTimeGrid(start_s, end_s, step_s)
+
+    windows = start_windows(grid, fields)
+
+    # Elevation of every calibrator at every grid index, -inf where it
+    # cannot start: (num_samples, num_calibrators)
+    calibrators = calibrators or []
+    if calibrators:
+        cal_ra_rad, cal_dec_rad = numpy.array(
+            [cal.target.ra_dec_rad() for cal in calibrators]).T
+        cal_startable = numpy.zeros((grid.num_samples + 1, len(calibrators)),
+                                    dtype=numpy.int32)
+        for first, last, cal in start_windows(grid, calibrators):
+            cal_startable[first, cal] += 1
+            cal_startable[last + 1, cal] -= 1
+        cal_elevation_rad = numpy.where(
+            numpy.cumsum(cal_startable, axis=0)[:-1] > 0,
+            elevation_rad(cal_ra_rad, cal_dec_rad,
+                          grid.lst_rad[:, numpy.newaxis]),
+            -numpy.inf)
+
+    slots       = []
+    scheduled   = set()
+    available   = []  # (last, field index, first)
+    next_window = 0
+    since_calibrator = None
+    now_s = start_s
+    while True:
+        index = grid.index_at_or_after(now_s)
+        if index >= grid.num_samples:
+            break
+        if calibrators and (since_calibrator is None or
+                            since_calibrator >= calibrator_every):
+            elevation = cal_elevation_rad[index]
+            best = int(numpy.argmax(elevation))
+            if numpy.isfinite(elevation[best]):
+                slots.append((calibrators[best], grid.seconds(index), True))
+                now_s = grid.seconds(index) + calibrators[best].duration_s + gap_s
+                since_calibrator = 0
+                continue
+
+        while next_window < len(windows) and windows[next_window][0] <= index:
+            first, last, field_index = windows[next_window]
+            heapq.heappush(available, (last, field_index, first))
+            next_window += 1
+        while available and (available[0][0] < index or
+                             available[0][1] in scheduled):
+            heapq.heappop(available)
+        if not available:
+            if next_window == len(windows):
+                break
+            now_s = max(now_s, grid.seconds(windows[next_window][0]))
+            continue
+
+        _, field_index, _ = heapq.heappop(available)
+        field = fields[field_index]
+        scheduled.add(field_index)
+        slots.append((field, grid.seconds(index), False))
+        now_s = grid.seconds(index) + field.duration_s + gap_s
+        if since_calibrator is not None:
+            since_calibrator += 1
+
+    unscheduled = [field for field_index, field in enumerate(fields)
+                   if field_index not in scheduled]
+    return SurveySchedule(slots, unscheduled)
@@ -3,16 +3,28 @@ Specification of target sources to use in Observation Beams.
 '''
 
 from lofarobsxml.angles import Angle
+import os
 import sys
+import json
+import time
+import threading
 import urllib
 if sys.version_info[0] > 2:
     import urllib.request as request
 
+SIMBAD_URL = 'http://simbad.u-strasbg.fr/simbad/sim-id'
+
 class NoSimbadCoordinatesError(RuntimeError):
     r'''
     Raised if the Simbad response does not contain J2000 coordinates.
     '''
 
+class SimbadOfflineError(NoSimbadCoordinatesError):
+    r'''
+    Raised if a name must be resolved in offline mode, but it is not
+    present in the Simbad cache.
+    '''
+
 class SourceSpecificationError (ValueError):
     r'''
     Raised in case of badly specified TargetSource.
@@ -199,6 +211,162 @@ class TargetSource(object):
 
 
 
+def normalized_source_name(source_name):
+    r'''
+    Return the key under which ``source_name`` is stored in source
+    name indices and caches: lower case, without white space.
+
+    **Examples**
+
+    >>> normalized_source_name('3C 196')
+    '3c196'
+    >>> normalized_source_name(' Cyg  A ') == normalized_source_name('cyga')
+    True
+    '''
+    return ''.join(source_name.lower().split())
+
+
+
+class SimbadCache(object):
+    r'''
+    Persistent cache of Simbad name resolutions. Entries are stored
+    as JSON lines, keyed by the normalized source name, and are
+    appended to ``file_name`` as soon as they are resolved.
+
+    **Parameters**
+
+    file_name : None or string
+        Path of the JSON-lines cache file. It is created when the
+        first entry is stored. If None, the cache only lives in
+        memory.
+
+    ttl_s : None or number
+        Entries older than ``ttl_s`` seconds are ignored. None implies
+        that entries never expire. Default: 30 days.
+
+    **Examples**
+
+    >>> cache = SimbadCache(ttl_s = 3600)
+    >>> ncp = target_source_from_simbad_response(
+    ...     'NCP', open('examples/simbad-ncp.txt').read())
+    >>> cache.put('NCP', ncp, now = 1000.0)
+    >>> cache.get('ncp', now = 4000.0)
+    TargetSource(name      = 'ncp',
+                 ra_angle  = Angle(shms = ('+', 0, 0, 0.0)),
+                 dec_angle = Angle(sdms = ('+', 90, 0, 0.0)))
+    >>> cache.get('NCP', now = 5000.0) is None
+    True
+    >>> cache.get('Cyg A') is None
+    True
+    '''
+    def __init__(self, file_name=None, ttl_s=30*86400.0):
+        self.file_name = file_name
+        self.ttl_s     = ttl_s
+        self.entries   = {}
+        self._lock     = threading.Lock()
+        if file_name is not None and os.path.exists(file_name):
+            self.load()
+
+
+    def load(self):
+        r'''
+        Read all entries from ``self.file_name``. Later lines override
+        earlier lines for the same name; malformed lines are skipped.
+        '''
+        with open(self.file_name) as cache_file:
+            for line in cache_file:
+                try:
+                    entry = json.loads(line)
+                    self.entries[entry['key']] = entry
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+
+    def get(self, source_name, now=None):
+        r'''
+        Return a TargetSource named ``source_name`` if its coordinates
+        are cached and not expired, None otherwise.
+        '''
+        entry = self.entries.get(normalized_source_name(source_name))
+        if entry is None:
+            return None
+        if now is None:
+            now = time.time()
+        if self.ttl_s is not None and now - entry['time'] > self.ttl_s:
+            return None
+        return TargetSource(name      = source_name,
+                            ra_angle  = Angle(rad = entry['ra_rad']),
+                            dec_angle = Angle(rad = entry['dec_rad']))
+
+
+    def put(self, source_name, target_source, now=None):
+        r'''
+        Store the coordinates of ``target_source`` under
+        ``source_name``, and append them to the cache file.
+        '''
+        if now is None:
+            now = time.time()
+        entry = {'key'    : normalized_source_name(source_name),
+                 'name'   : source_name,
+                 'ra_rad' : target_source.ra_angle.as_rad(),
+                 'dec_rad': target_source.dec_angle.as_rad(),
+                 'time'   : now}
+        with self._lock:
+            self.entries[entry['key']] = entry
+            if self.file_name is not None:
+                with open(self.file_name, 'a') as cache_file:
+                    cache_file.write(json.dumps(entry, sort_keys=True)+'\n')
+
+
+
+class RateLimiter(object):
+    r'''
+    Spaces calls to ``wait()`` from any number of threads at least
+    ``1/max_per_second`` seconds apart.
+
+    **Parameters**
+
+    max_per_second : None or number
+        Maximum number of calls per second. None disables limiting.
+
+    clock, sleep : None or callable
+        Functions returning the current time and waiting for a number
+        of seconds. Default: time.time and time.sleep.
+
+    **Examples**
+
+    >>> now = [1000.0]
+    >>> def fake_sleep(seconds):
+    ...     now[0] += seconds
+    >>> limiter = RateLimiter(20.0, clock = lambda: now[0], sleep = fake_sleep)
+    >>> for i in range(5):
+    ...     limiter.wait()
+    >>> round(now[0] - 1000.0, 6)
+    0.2
+    '''
+    def __init__(self, max_per_second=None, clock=None, sleep=None):
+        self.max_per_second = max_per_second
+        self.clock          = clock or time.time
+        self.sleep          = sleep or time.sleep
+        self.next_time      = 0.0
+        self._lock          = threading.Lock()
+
+
+    def wait(self):
+        r'''
+        Block until the next call is allowed.
+        '''
+        if not self.max_per_second:
+            return
+        with self._lock:
+            now = self.clock()
+            scheduled = max(now, self.next_time)
+            self.next_time = scheduled + 1.0/self.max_per_second
+        if scheduled > now:
+            self.sleep(scheduled - now)
+
+
+
 def target_source_from_simbad_response(source_name, simbad_response):
     r'''
 
@@ -246,19 +414,81 @@ def target_source_from_simbad_response(source_name, simbad_response):
 
 
 
-def simbad(source_name, debug = False):
+def simbad(source_name, debug = False, cache = None, offline = False,
+           url = SIMBAD_URL):
     r'''
     Lookup ``source_name`` on simbad and return a TargetSource instance.
 
+    **Parameters**
+
+    source_name : string
+        The name to resolve.
+
+    debug : bool
+        If True, print the raw Simbad response instead of returning
+        a TargetSource.
+
+    cache : None or SimbadCache
+        If provided, cached coordinates are returned without querying
+        Simbad, and fresh results are stored in the cache.
+
+    offline : bool
+        If True, never query Simbad. Names that are not in ``cache``
+        raise a SimbadOfflineError.
+
+    url : string
+        Location of the Simbad sim-id service.
+
+    **Raises**
+
+    NoSimbadCoordinatesError
+        If Simbad does not know ``source_name``.
+
+    SimbadOfflineError
+        If ``offline`` is True and ``source_name`` is not cached.
+
     **Examples**
 
     >>> simbad('3C 196')
     TargetSource(name      = '3C 196',
                  ra_angle  = Angle(shms = ('+', 8, 13, 36.0561)),
                  dec_angle = Angle(sdms = ('+', 48, 13, 2.636)))
+
+    Using a local stand-in for Simbad and a cache file:
+
+    >>> import os, sys, tempfile
+    >>> sys.path.insert(0, 'testdata')
+    >>> from simbadstub import StubSimbadServer
+    >>> cache_name = os.path.join(tempfile.mkdtemp(), 'simbad.jsonl')
+    >>> responses  = {'NGC 891': open('examples/simbad-ngc891.txt').read()}
+    >>> with StubSimbadServer(responses) as server:
+    ...     first  = simbad('NGC 891', cache = SimbadCache(cache_name),
+    ...                     url = server.url)
+    ...     second = simbad('ngc891', cache = SimbadCache(cache_name),
+    ...                     url = server.url)
+    ...     server.request_count
+    1
+    >>> second
+    TargetSource(name      = 'ngc891',
+                 ra_angle  = Angle(shms = ('+', 2, 22, 32.907)),
+                 dec_angle = Angle(sdms = ('+', 42, 20, 53.95)))
+    >>> simbad('NGC 891', cache = SimbadCache(cache_name), offline = True).name
+    'NGC 891'
+    >>> simbad('M 31', cache = SimbadCache(cache_name), offline = True)
+    Traceback (most recent call last):
+    ...
+    lofarobsxml.targetsource.SimbadOfflineError: 'M 31' not in Simbad cache and offline mode is on
     '''
+    if cache is not None and not debug:
+        cached = cache.get(source_name)
+        if cached is not None:
+            return cached
+    if offline:
+        raise SimbadOfflineError('%r not in Simbad cache and offline mode is on' %
+                                 source_name)
+
     query = '&'.join([
-        'http://simbad.u-strasbg.fr/simbad/sim-id?output.format=ASCII',
+        url+'?output.format=ASCII',
         'obj.coo1=on',
         'obj.coo2=off',
         'obj.coo3=off',
@@ -287,5 +517,107 @@ def simbad(source_name, debug = False):
         print(result)
         sys.stdout.flush()
     else:
-        return target_source_from_simbad_response(source_name, result)
+        target_source = target_source_from_simbad_response(source_name, result)
+        if cache is not None:
+            cache.put(source_name, target_source)
+        return target_source
+
+
+
+
+
+def resolve_many(source_names, max_concurrency=8, max_per_second=None,
+                 cache=None, offline=False, url=SIMBAD_URL):
+    r'''
+    Resolve a list of names with concurrent Simbad queries. Names that
+    are identical after normalization are queried only once.
+
+    **Parameters**
 
+    source_names : list of strings
+        The names to resolve.
+
+    max_concurrency : int
+        Maximum number of simultaneous queries.
+
+    max_per_second : None or number
+        Maximum number of queries started per second. None implies no
+        limit.
+
+    cache, offline, url :
+        Passed on to ``simbad()``.
+
+    **Returns**
+
+    A tuple (resolved, errors) of dicts. ``resolved`` maps every
+    successfully resolved name to a TargetSource; ``errors`` maps the
+    other names to the exception raised while resolving them. An
+    error while resolving one name does not affect the others.
+
+    **Examples**
+
+    >>> import sys
+    >>> sys.path.insert(0, 'testdata')
+    >>> from simbadstub import StubSimbadServer
+    >>> responses = {'NCP'    : open('examples/simbad-ncp.txt').read(),
+    ...              'NGC 891': open('examples/simbad-ngc891.txt').read(),
+    ...              'Trifid Nebula': open('examples/simbad-trifid.txt').read()}
+    >>> names = ['NCP', 'ncp', 'NGC 891', 'Trifid Nebula', 'Nonexistent']
+    >>> with StubSimbadServer(responses) as server:
+    ...     resolved, errors = resolve_many(names, url = server.url)
+    ...     server.request_count
+    4
+    >>> [(name, resolved[name].name) for name in sorted(resolved)]
+    [('NCP', 'NCP'), ('NGC 891', 'NGC 891'), ('Trifid Nebula', 'Trifid Nebula'), ('ncp', 'ncp')]
+    >>> errors['Nonexistent'].__class__.__name__
+    'NoSimbadCoordinatesError'
+    >>> resolve_many(['NCP'], url = 'not-a-url')[1]['NCP'].__class__.__name__
+    'ValueError'
+
+    Names already in the cache are not queried:
+
+    >>> cache = SimbadCache()
+    >>> cache.put('NCP', resolved['NCP'])
+    >>> with StubSimbadServer(responses) as server:
+    ...     resolved, errors = resolve_many(['NCP', 'NGC 891'], cache = cache,
+    ...                                     url = server.url)
+    ...     server.requested
+    ['NGC 891']
+    '''
+    queries = {}
+    for name in source_names:
+        queries.setdefault(normalized_source_name(name), name)
+
+    limiter = RateLimiter(max_per_second)
+
+    def resolve(name):
+        if cache is not None:
+            cached = cache.get(name)
+            if cached is not None:
+                return cached
+        if not offline:
+            limiter.wait()
+        return simbad(name, cache=cache, offline=offline, url=url)
+
+    from concurrent.futures import ThreadPoolExecutor
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        futures = dict([(key, pool.submit(resolve, name))
+                        for key, name in queries.items()])
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception:
+                results[key] = sys.exc_info()[1]
+
+    resolved = {}
+    errors   = {}
+    for name in source_names:
+        result = results[normalized_source_name(name)]
+        if isinstance(result, Exception):
+            errors[name] = result
+        else:
+            resolved[name] = TargetSource(name      = name,
+                                          ra_angle  = result.ra_angle,
+                                          dec_angle = result.dec_angle)
+    return resolved, errors
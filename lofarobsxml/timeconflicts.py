@@ -0,0 +1,313 @@
+r'''
+Detection of time conflicts between Observations, within one project
+or across several. Observations occupy the half open interval [start,
+end). Overlaps are found with a sweep over the intervals sorted by
+start time, and gaps between consecutive observations per station
+with a running maximum of end times, in O(n log n) overall plus the
+number of reported conflicts.
+'''
+
+import heapq
+import numpy
+
+from .observationspecificationbase import walk_tree
+from .observation import Observation
+from .utilities import StationSet, station_mask
+from .processingschedule import date_seconds
+
+
+# Minimum time in seconds between the end of one observation and the
+# start of the next on the same station. genvalobs separates
+# observations by 60 s and adds two minutes when the clock switches.
+TRANSITION_GAPS_S = {'same'       : 60.0,
+                     'antenna_set': 60.0,
+                     'clock'      : 180.0}
+
+CONFLICT_KINDS = ['stations', 'gap', 'overlap']
+
+
+
+class ObservationConflictError(ValueError):
+    r'''
+    Raised if observations are double-booked or too close in time.
+    '''
+
+
+
+class TimeConflict(object):
+    r'''
+    A conflict between two observations.
+
+    **Attributes**
+
+    kind : string
+        'stations' if the observations overlap in time and share
+        stations, 'overlap' if they overlap on disjoint stations, and
+        'gap' if they share stations and the second one starts too
+        soon after the first.
+
+    first, second : Observation
+        The observations, ``first`` starting no later than ``second``.
+
+    first_project, second_project : None or string
+        The projects they belong to, if known.
+
+    seconds : float
+        Duration of the overlap, or length of the gap.
+
+    required_s : float
+        For gaps, the required minimum gap.
+
+    stations : StationSet
+        The stations the observations share.
+    '''
+    def __init__(self, kind, first, second, seconds, stations,
+                 required_s=0.0, first_project=None, second_project=None):
+        self.kind           = kind
+        self.first          = first
+        self.second         = second
+        self.seconds        = seconds
+        self.stations       = stations
+        self.required_s     = required_s
+        self.first_project  = first_project
+        self.second_project = second_project
+
+
+    def __repr__(self):
+        return 'TimeConflict(%r, %r, %r, seconds = %r)' % (
+            self.kind, observation_name(self.first, self.first_project),
+            observation_name(self.second, self.second_project), self.seconds)
+
+
+    def message(self):
+        r'''
+        One line description of the conflict.
+        '''
+        first  = observation_name(self.first, self.first_project)
+        second = observation_name(self.second, self.second_project)
+        if self.kind == 'gap':
+            return ('%s starts %.0f s after %s; %.0f s required' %
+                    (second, self.seconds, first, self.required_s))
+        if self.kind == 'stations':
+            return ('%s and %s overlap for %.0f s on %s' %
+                    (first, second, self.seconds, ','.join(self.stations.names())))
+        return ('%s and %s overlap for %.0f s' % (first, second, self.seconds))
+
+
+
+def observation_name(observation, project=None):
+    r'''
+    Name of an observation in messages, prefixed by its project.
+    '''
+    name = observation.name or observation.label()
+    if project is not None:
+        return '%s:%s' % (project, name)
+    return name
+
+
+
+def required_gap_s(previous, following, min_gap_s=None):
+    r'''
+    Minimum time between the end of ``previous`` and the start of
+    ``following`` on a shared station.
+
+    **Parameters**
+
+    min_gap_s : None, dict, or callable
+        A dict with the keys of TRANSITION_GAPS_S, or a function
+        ``f(previous, following)`` returning seconds. Default:
+        TRANSITION_GAPS_S.
+
+    **Examples**
+
+    >>> from collections import namedtuple
+    >>> Obs = namedtuple('Obs', ['clock_mhz', 'antenna_set'])
+    >>> required_gap_s(Obs(200, 'HBA_DUAL'), Obs(200, 'HBA_DUAL'))
+    60.0
+    >>> required_gap_s(Obs(200, 'HBA_DUAL'), Obs(160, 'LBA_OUTER'))
+    180.0
+    >>> required_gap_s(Obs(200, 'HBA_DUAL'), Obs(200, 'LBA_OUTER'),
+    ...                {'same': 0.0, 'antenna_set': 30.0, 'clock': 120.0})
+    30.0
+    '''
+    if min_gap_s is None:
+        min_gap_s = TRANSITION_GAPS_S
+    if callable(min_gap_s):
+        return float(min_gap_s(previous, following))
+    required = min_gap_s['same']
+    if previous.antenna_set != following.antenna_set:
+        required = max(required, min_gap_s['antenna_set'])
+    if previous.clock_mhz != following.clock_mhz:
+        required = max(required, min_gap_s['clock'])
+    return float(required)
+
+
+
+def time_conflicts(observations, projects=None, min_gap_s=None):
+    r'''
+    Find all time conflicts between ``observations``.
+
+    **Parameters**
+
+    observations : list of Observation
+
+    projects : None or list of strings
+        Project name of every observation.
+
+    min_gap_s : None, dict, or callable
+        See ``required_gap_s()``.
+
+    **Returns**
+
+    A list of TimeConflict instances, ordered by the start of the
+    second observation.
+    '''
+    if projects is None:
+        projects = [None]*len(observations)
+    starts = numpy.array([date_seconds(obs.start_date) for obs in observations],
+                         dtype=numpy.float64)
+    ends   = starts + numpy.array([obs.duration_seconds for obs in observations],
+                                  dtype=numpy.float64)
+    # Python ints, which do not overflow when the station registry
+    # grows past 63 stations
+    masks  = [station_mask(obs.stations) for obs in observations]
+    order  = numpy.argsort(starts, kind='stable')
+
+    conflicts = []
+    def add(kind, first, second, seconds, shared, required_s=0.0):
+        conflicts.append((starts[second], first, second, TimeConflict(
+            kind, observations[first], observations[second], float(seconds),
+            StationSet.from_mask(shared), required_s,
+            projects[first], projects[second])))
+
+    # Overlaps: sweep over starts, keeping a heap of active intervals
+    active = []
+    for second in order.tolist():
+        while active and active[0][0] <= starts[second]:
+            heapq.heappop(active)
+        for end, first in active:
+            shared = masks[first] & masks[second]
+            add('stations' if shared else 'overlap', first, second,
+                min(end, ends[second]) - starts[second], shared)
+        heapq.heappush(active, (ends[second], second))
+
+    # Gaps: per station, compare every start with the latest end of
+    # all observations that started before it
+    max_required_s = (max(TRANSITION_GAPS_S.values()) if min_gap_s is None
+                      else None if callable(min_gap_s) else max(min_gap_s.values()))
+    station_members = {}
+    for index in order.tolist():
+        mask, bit = masks[index], 0
+        while mask:
+            if mask & 1:
+                station_members.setdefault(bit, []).append(index)
+            mask >>= 1
+            bit  += 1
+    gap_pairs = set()
+    for members in station_members.values():
+        if len(members) < 2:
+            continue
+        members     = numpy.array(members)
+        member_ends = ends[members]
+        latest_end  = numpy.maximum.accumulate(member_ends)
+        positions   = numpy.arange(len(members))
+        latest      = numpy.maximum.accumulate(
+            numpy.where(member_ends == latest_end, positions, 0))
+        gaps = starts[members[1:]] - latest_end[:-1]
+        candidates = gaps >= 0
+        if max_required_s is not None:
+            candidates &= gaps < max_required_s
+        for index in numpy.flatnonzero(candidates):
+            gap_pairs.add((int(members[latest[index]]), int(members[index + 1])))
+    for first, second in gap_pairs:
+        gap_s = starts[second] - ends[first]
+        required_s = required_gap_s(observations[first], observations[second],
+                                    min_gap_s)
+        if gap_s < required_s:
+            add('gap', first, second, gap_s, masks[first] & masks[second],
+                required_s)
+
+    conflicts.sort(key=lambda conflict: conflict[:3])
+    return [conflict for _, _, _, conflict in conflicts]
+
+
+
+def find_time_conflicts(items, min_gap_s=None):
+    r'''
+    Find time conflicts between all Observations in the trees rooted
+    at ``items``. See ``time_conflicts()``.
+
+    **Examples**
+
+    >>> from lofarobsxml             import TargetSource, Angle, Folder
+    >>> from lofarobsxml.backend     import BackendProcessing
+    >>> from lofarobsxml.beam        import Beam
+    >>> target = TargetSource('3C 196', Angle(hms = (8, 13, 36.0)),
+    ...                       Angle(sdms = ('+', 48, 13, 3.0)))
+    >>> def observe(name, start_date, stations, clock_mhz = 200):
+    ...     return Observation('HBA_DUAL_INNER', 'HBA_LOW', start_date, 600,
+    ...                        name = name, stations = stations,
+    ...                        clock_mhz = clock_mhz, bit_mode = 8,
+    ...                        backend = BackendProcessing(),
+    ...                        beam_list = [Beam(0, target, '77..320')])
+    >>> night = Folder('Night', children = [
+    ...     observe('A', (2013, 10, 20, 18,  0, 0), ['CS001', 'CS002']),
+    ...     observe('B', (2013, 10, 20, 18,  5, 0), ['CS002', 'CS003']),
+    ...     observe('C', (2013, 10, 20, 18,  8, 0), ['RS106']),
+    ...     observe('D', (2013, 10, 20, 18, 17, 0), ['CS003'], clock_mhz = 160)])
+    >>> for conflict in find_time_conflicts([night]):
+    ...     print(conflict.message())
+    A and B overlap for 300 s on CS002
+    A and C overlap for 120 s
+    B and C overlap for 420 s
+    D starts 120 s after B; 180 s required
+    C and D overlap for 60 s
+    '''
+    observations = [node for node in walk_tree(items)
+                    if isinstance(node, Observation)]
+    return time_conflicts(observations, min_gap_s=min_gap_s)
+
+
+
+def find_project_time_conflicts(projects, min_gap_s=None):
+    r'''
+    Find time conflicts between the Observations of several
+    projects.
+
+    **Parameters**
+
+    projects : dict
+        Maps project names to lists of root items.
+
+    **Returns**
+
+    A list of TimeConflict instances with ``first_project`` and
+    ``second_project`` set.
+    '''
+    observations, names = [], []
+    for name, items in sorted(projects.items()):
+        for node in walk_tree(items):
+            if isinstance(node, Observation):
+                observations.append(node)
+                names.append(name)
+    return time_conflicts(observations, names, min_gap_s)
+
+
+
+def validate_observation_times(items, min_gap_s=None, allow_subarrays=True):
+    r'''
+    Raise an ObservationConflictError listing all station
+    double-bookings and insufficient gaps between the Observations in
+    the trees rooted at ``items``. Overlapping observations on
+    disjoint stations are allowed if ``allow_subarrays`` is True.
+
+    **Returns**
+
+    True if there are no conflicts.
+    '''
+    problems = [conflict.message()
+                for conflict in find_time_conflicts(items, min_gap_s)
+                if conflict.kind != 'overlap' or not allow_subarrays]
+    if problems:
+        raise ObservationConflictError('\n'.join(problems))
+    return True
@@ -0,0 +1,374 @@
+r'''
+Start and end times of observations as integer seconds since
+1970-01-01T00:00:00 UTC (numpy.datetime64 with a resolution of one
+second). Sequences of consecutive observations are computed in bulk
+with exact integer arithmetic, so no rounding errors accumulate, and
+are converted to the (year, month, day, hours, minutes, seconds)
+tuples used by Observation, or directly to MoM timestamps.
+'''
+
+import numpy
+import ephem
+
+
+# ephem.Date counts days from 1899/12/31 12:00:00 UTC
+EPHEM_EPOCH_UNIX_DAYS = -25567.5
+SECONDS_PER_DAY = 86400
+
+ACTIVE_RENDER_SESSIONS = []
+
+
+
+def days_from_civil(year, month, day):
+    r'''
+    Number of days from 1970-01-01 to a date in the proleptic
+    Gregorian calendar, using integer arithmetic only.
+
+    **Examples**
+
+    >>> days_from_civil(1970, 1, 1), days_from_civil(2000, 3, 1)
+    (0, 11017)
+    '''
+    year -= month <= 2
+    era   = year//400
+    year_of_era = year - era*400
+    day_of_year = (153*(month + (-3 if month > 2 else 9)) + 2)//5 + day - 1
+    day_of_era  = (year_of_era*365 + year_of_era//4 - year_of_era//100
+                   + day_of_year)
+    return era*146097 + day_of_era - 719468
+
+
+
+def civil_from_days(days):
+    r'''
+    Inverse of ``days_from_civil()``.
+
+    **Examples**
+
+    >>> civil_from_days(0), civil_from_days(11017), civil_from_days(-1)
+    ((1970, 1, 1), (2000, 3, 1), (1969, 12, 31))
+    '''
+    days += 719468
+    era   = days//146097
+    day_of_era  = days - era*146097
+    year_of_era = (day_of_era - day_of_era//1460 + day_of_era//36524
+                   - day_of_era//146096)//365
+    day_of_year = day_of_era - (365*year_of_era + year_of_era//4 - year_of_era//100)
+    month_index = (5*day_of_year + 2)//153
+    day   = day_of_year - (153*month_index + 2)//5 + 1
+    month = month_index + 3 if month_index < 10 else month_index - 9
+    return (year_of_era + era*400 + (month <= 2), month, day)
+
+
+
+def seconds_tuple(seconds):
+    r'''
+    Convert integer seconds since 1970-01-01T00:00:00 UTC to a
+    (year, month, day, hours, minutes, seconds) tuple. Scalar
+    counterpart of ``seconds_tuples()``.
+
+    **Examples**
+
+    >>> seconds_tuple(1382292030)
+    (2013, 10, 20, 18, 0, 30)
+    '''
+    days, rest    = divmod(int(seconds), SECONDS_PER_DAY)
+    hours, rest   = divmod(rest, 3600)
+    minutes, rest = divmod(rest, 60)
+    return civil_from_days(days) + (hours, minutes, rest)
+
+
+
+def minute_seconds(date):
+    r'''
+    Seconds since 1970-01-01T00:00:00 UTC of the start of the minute
+    of a 6-tuple.
+    '''
+    year, month, day, hours, minutes = date[:5]
+    return (days_from_civil(year, month, day)*SECONDS_PER_DAY
+            + hours*3600 + minutes*60)
+
+
+
+def timestamp_seconds(date):
+    r'''
+    Convert a 6-tuple, ephem.Date, or date string to integer seconds
+    since 1970-01-01T00:00:00 UTC. Fractional seconds are rounded in
+    the same way as in Observation.xml().
+
+    **Examples**
+
+    >>> timestamp_seconds((1970, 1, 2, 0, 0, 1))
+    86401
+    >>> timestamp_seconds((2013, 10, 20, 18, 0, 29.6))
+    1382292030
+    >>> timestamp_seconds(ephem.Date('2013/10/20 18:00:30'))
+    1382292030
+    >>> timestamp_seconds('2013/10/20 18:00:30')
+    1382292030
+    '''
+    if isinstance(date, tuple):
+        return minute_seconds(date) + int(round(date[5]))
+    if not isinstance(date, float):
+        date = ephem.Date(date)
+    return int(round((float(date) + EPHEM_EPOCH_UNIX_DAYS)*SECONDS_PER_DAY))
+
+
+
+def tuple_seconds(dates):
+    r'''
+    Convert a sequence of 6-tuples with integer seconds to an int64
+    array of seconds since 1970-01-01T00:00:00 UTC.
+
+    **Examples**
+
+    >>> tuple_seconds([(2013, 10, 20, 18, 0, 0), (2016, 2, 29, 23, 59, 59)])
+    array([1382292000, 1456790399])
+    '''
+    fields = numpy.array(dates, dtype=numpy.int64).reshape(-1, 6)
+    years, months, days, hours, minutes, seconds = fields.T
+    day_numbers = ((years - 1970).astype('datetime64[Y]').astype('datetime64[M]')
+                   + (months - 1)).astype('datetime64[D]') + (days - 1)
+    return (day_numbers.astype(numpy.int64)*SECONDS_PER_DAY
+            + hours*3600 + minutes*60 + seconds)
+
+
+
+def seconds_tuples(seconds):
+    r'''
+    Convert integer seconds since 1970-01-01T00:00:00 UTC to a list of
+    (year, month, day, hours, minutes, seconds) tuples of ints.
+
+    **Examples**
+
+    >>> seconds_tuples([1382292000, 1456790399])
+    [(2013, 10, 20, 18, 0, 0), (2016, 2, 29, 23, 59, 59)]
+    '''
+    instants = numpy.asarray(seconds, dtype=numpy.int64).astype('datetime64[s]')
+    days     = instants.astype('datetime64[D]')
+    months   = instants.astype('datetime64[M]')
+    years    = instants.astype('datetime64[Y]').astype(numpy.int64) + 1970
+    month    = months.astype(numpy.int64) % 12 + 1
+    day      = (days - months).astype(numpy.int64) + 1
+    hours, rest    = numpy.divmod((instants - days).astype(numpy.int64), 3600)
+    minutes, secs  = numpy.divmod(rest, 60)
+    return list(zip(*[column.tolist() for column in
+                      (years, month, day, hours, minutes, secs)]))
+
+
+
+def mom_timestamps(seconds):
+    r'''
+    Convert integer seconds since 1970-01-01T00:00:00 UTC to MoM
+    timestamps, identical to ``momformats.mom_timestamp()``.
+
+    **Examples**
+
+    >>> mom_timestamps([1382292000, 1456790399])
+    ['2013-10-20T18:00:00', '2016-02-29T23:59:59']
+    '''
+    instants = numpy.asarray(seconds, dtype=numpy.int64).astype('datetime64[s]')
+    return numpy.datetime_as_string(instants, unit='s').tolist()
+
+
+
+class Timeline(object):
+    r'''
+    Start and end times of a sequence of time slots, as int64 arrays
+    of seconds since 1970-01-01T00:00:00 UTC.
+
+    **Parameters**
+
+    start_s : sequence of ints
+        Start times.
+
+    duration_s : int or sequence of ints
+        Durations of the slots.
+
+    **Examples**
+
+    >>> timeline = Timeline.consecutive((2013, 10, 20, 18, 0, 0),
+    ...                                 [600, 600, 300], gap_s = 60)
+    >>> timeline.start_dates()
+    [(2013, 10, 20, 18, 0, 0), (2013, 10, 20, 18, 11, 0), (2013, 10, 20, 18, 22, 0)]
+    >>> timeline.end_timestamps()
+    ['2013-10-20T18:10:00', '2013-10-20T18:21:00', '2013-10-20T18:27:00']
+    >>> len(timeline), timeline.total_span_s()
+    (3, 1620)
+    '''
+    def __init__(self, start_s, duration_s):
+        self.start_s    = numpy.asarray(start_s, dtype=numpy.int64).reshape(-1)
+        self.duration_s = numpy.broadcast_to(
+            numpy.asarray(numpy.round(duration_s), dtype=numpy.int64),
+            self.start_s.shape).copy()
+        self.end_s      = self.start_s + self.duration_s
+
+
+    @classmethod
+    def consecutive(cls, start_date, duration_s, gap_s=0):
+        r'''
+        Slots of ``duration_s`` seconds that follow each other after
+        ``gap_s`` seconds, starting at ``start_date``. Both
+        ``duration_s`` and ``gap_s`` may be scalars or sequences; the
+        i-th gap follows the i-th slot. The start times are a single
+        cumulative sum.
+
+        **Examples**
+
+        >>> timeline = Timeline.consecutive('2013/10/20 18:00:00', [600]*10**4,
+        ...                                 gap_s = 60)
+        >>> timeline.start_timestamps()[-1]
+        '2014-01-05T03:09:00'
+        '''
+        duration_s = numpy.asarray(numpy.round(duration_s), dtype=numpy.int64).reshape(-1)
+        gap_s      = numpy.broadcast_to(
+            numpy.asarray(numpy.round(gap_s), dtype=numpy.int64), duration_s.shape)
+        offsets    = numpy.zeros(duration_s.shape, dtype=numpy.int64)
+        numpy.cumsum((duration_s + gap_s)[:-1], out=offsets[1:])
+        return cls(timestamp_seconds(start_date) + offsets, duration_s)
+
+
+    def __len__(self):
+        return len(self.start_s)
+
+
+    def shifted(self, offset_s):
+        r'''
+        A new Timeline with all slots moved by ``offset_s``, a scalar
+        or one offset per slot.
+        '''
+        return Timeline(self.start_s + numpy.asarray(offset_s, dtype=numpy.int64),
+                        self.duration_s)
+
+
+    def total_span_s(self):
+        r'''
+        Seconds from the first start to the last end.
+        '''
+        return int(self.end_s.max() - self.start_s.min())
+
+
+    def start_dates(self):
+        return seconds_tuples(self.start_s)
+
+
+    def end_dates(self):
+        return seconds_tuples(self.end_s)
+
+
+    def start_timestamps(self):
+        return mom_timestamps(self.start_s)
+
+
+    def end_timestamps(self):
+        return mom_timestamps(self.end_s)
+
+
+
+class RenderSession(object):
+    r'''
+    Clock for rendering a project to XML. Start and end times are
+    converted to MoM timestamps with integer arithmetic, so no ephem
+    objects are created while the XML is emitted. Calendar dates are
+    computed once per day. ``lofarobsxml.xml()`` renders inside a
+    session; Observations and pipelines rendered on their own use a
+    temporary one.
+
+    **Examples**
+
+    >>> with RenderSession() as session:
+    ...     print(session is active_render_session())
+    ...     print(session.interval((2013, 10, 20, 23, 59, 29.6), 3600.2))
+    True
+    ('2013-10-20T23:59:30', '2013-10-21T00:59:30')
+    >>> session.timestamp(ephem.Date('2013/10/20 18:00:00'))
+    '2013-10-20T18:00:00'
+    >>> session in ACTIVE_RENDER_SESSIONS
+    False
+    '''
+    def __init__(self):
+        self.day_numbers = {}
+        self.day_strings = {}
+
+
+    def minute_seconds(self, date):
+        r'''
+        Same as ``minute_seconds()``, with cached day numbers.
+        '''
+        year, month, day, hours, minutes = date[:5]
+        try:
+            day_number = self.day_numbers[(year, month, day)]
+        except KeyError:
+            day_number = self.day_numbers.setdefault(
+                (year, month, day), days_from_civil(year, month, day))
+        return day_number*SECONDS_PER_DAY + hours*3600 + minutes*60
+
+
+    def format(self, seconds):
+        r'''
+        MoM timestamp of integer seconds since 1970-01-01T00:00:00 UTC.
+        '''
+        day_number, rest = divmod(seconds, SECONDS_PER_DAY)
+        try:
+            day_string = self.day_strings[day_number]
+        except KeyError:
+            day_string = self.day_strings.setdefault(
+                day_number, '%04d-%02d-%02d' % civil_from_days(day_number))
+        hours, rest = divmod(rest, 3600)
+        minutes, rest = divmod(rest, 60)
+        return '%sT%02d:%02d:%02d' % (day_string, hours, minutes, rest)
+
+
+    def interval_seconds(self, start_date, duration_s=0):
+        r'''
+        Start and end of an interval of ``duration_s`` seconds from
+        ``start_date``, a 6-tuple or ephem.Date, in whole seconds since
+        1970-01-01T00:00:00 UTC. Fractional seconds are added before
+        rounding.
+        '''
+        if isinstance(start_date, tuple):
+            base_s, offset_s = self.minute_seconds(start_date), start_date[5]
+        else:
+            if not isinstance(start_date, float):
+                start_date = ephem.Date(start_date)
+            base_s, offset_s = 0, (float(start_date) +
+                                   EPHEM_EPOCH_UNIX_DAYS)*SECONDS_PER_DAY
+        return (base_s + int(round(offset_s)),
+                base_s + int(round(offset_s + duration_s)))
+
+
+    def timestamp(self, date):
+        r'''
+        MoM timestamp of ``date``, with the seconds rounded.
+        '''
+        return self.format(self.interval_seconds(date)[0])
+
+
+    def interval(self, start_date, duration_s):
+        r'''
+        MoM timestamps of the start and the end of an interval. See
+        ``interval_seconds()``.
+        '''
+        start_s, end_s = self.interval_seconds(start_date, duration_s)
+        return self.format(start_s), self.format(end_s)
+
+
+    def __enter__(self):
+        ACTIVE_RENDER_SESSIONS.append(self)
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        ACTIVE_RENDER_SESSIONS.remove(self)
+        return False
+
+
+
+def active_render_session():
+    r'''
+    Return the innermost active RenderSession, or a new one if none
+    is active.
+    '''
+    if ACTIVE_RENDER_SESSIONS:
+        return ACTIVE_RENDER_SESSIONS[-1]
+    return RenderSession()
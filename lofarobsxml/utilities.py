@@ -3,11 +3,18 @@ Various support functions that did not fit anywhere else.
 '''
 
 import sys
-from numpy import pi, cos, sin, arcsin, sqrt, arctan2
+import weakref
+from numpy import pi, cos, sin, arcsin, sqrt, arctan2, array, clip, mod
+from numpy import ndarray, float64
 import ephem
 
 from .angles import Angle
 
+# CS002 LBA in ITRF2005, epoch 2009.5
+LOFAR_LONGITUDE_RAD = +6.869837540*pi/180
+LOFAR_LATITUDE_RAD  = +52.915122495*pi/180
+LOFAR_ELEVATION_M   = +49.344
+
 class InvalidStationSetError(ValueError):
     r'''
     To be raised if an invalid station set is provided.
@@ -19,12 +26,16 @@ class AutoReprBaseClass(object):
     r'''
     Base class that implements a simplistic __repr__ function. The
     order in which the members are printed is the same as that in
-    which the arguments are set in bthe constructor body.
+    which the arguments are set in bthe constructor body. Members
+    whose names start with an underscore are not printed.
     '''
+    __slots__ = ()
+
     def __repr__(self):
         name = self.__class__.__name__
-        as_dict = self.__dict__
-        members = sorted(as_dict.keys())
+        as_dict = member_dict(self)
+        members = sorted([key for key in as_dict.keys()
+                          if not key.startswith('_')])
         longest_member = sorted([len(s) for s in members])[-1]
         member_strings = [mem.ljust(longest_member)+' = '+repr(as_dict[mem])
                           for mem in members]
@@ -38,6 +49,165 @@ class AutoReprBaseClass(object):
 
 
 
+def member_dict(instance):
+    r'''
+    Return a dict with the members of ``instance``, both those in its
+    ``__dict__`` and those in ``__slots__``.
+    '''
+    as_dict = dict(getattr(instance, '__dict__', {}))
+    for cls in type(instance).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            if name not in ('__dict__', '__weakref__') and hasattr(instance, name):
+                as_dict[name] = getattr(instance, name)
+    return as_dict
+
+
+
+# Interned InternedConfig instances, keyed by class and typed values.
+# Instances that are no longer used elsewhere are dropped.
+INTERNED_CONFIGS = weakref.WeakValueDictionary()
+
+
+def interned_config(cls, values):
+    r'''
+    Return the shared instance of ``cls`` with members ``values``,
+    given in the order of ``cls.__slots__``. A new instance is created
+    and validated only if no equal one exists yet.
+    '''
+    # Types are part of the key: 512 and 512.0 compare equal, but
+    # only one of them may pass validation.
+    key = (cls,) + tuple([(type(value), value) for value in values])
+    try:
+        return INTERNED_CONFIGS[key]
+    except KeyError:
+        instance = object.__new__(cls)
+        for name, value in zip(cls.__slots__, values):
+            object.__setattr__(instance, name, value)
+        object.__setattr__(instance, '_key', key)
+        object.__setattr__(instance, '_renderings', {})
+        instance.validate()
+        return INTERNED_CONFIGS.setdefault(key, instance)
+
+
+
+def cached_rendering(method):
+    r'''
+    Decorator for methods of InternedConfig subclasses that render
+    text. The result is computed once per instance and set of
+    arguments.
+    '''
+    def cached(self, *args, **kwargs):
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        try:
+            return self._renderings[key]
+        except KeyError:
+            return self._renderings.setdefault(key, method(self, *args, **kwargs))
+    cached.__name__ = method.__name__
+    cached.__doc__  = method.__doc__
+    return cached
+
+
+
+class InternedConfig(AutoReprBaseClass):
+    r'''
+    Base class for small, immutable configuration objects such as
+    Stokes, TiedArrayBeams and NDPPP. Equal configurations share one
+    instance, so they are validated and rendered only once per
+    project, and compare and hash cheaply.
+
+    Subclasses list their members in ``__slots__`` and implement
+    ``__new__``, which normalises its arguments to hashable values and
+    returns ``interned_config(cls, values)``. They override
+    ``validate()`` to check the values of a new instance; the default
+    accepts any values.
+
+    **Examples**
+
+    >>> class Setting(InternedConfig):
+    ...     __slots__ = ('name', 'steps')
+    ...     def __new__(cls, name, steps = 1):
+    ...         return interned_config(cls, (name, steps))
+    ...     def validate(self):
+    ...         typecheck(self.steps, int, 'Setting.steps')
+    >>> setting = Setting('a', steps = 2)
+    >>> setting
+    Setting(name  = 'a',
+            steps = 2)
+    >>> setting is Setting('a', 2), setting == Setting('a', 3)
+    (True, False)
+    >>> setting.replace(steps = 3) is Setting('a', 3)
+    True
+    >>> setting.steps = 4
+    Traceback (most recent call last):
+    ...
+    AttributeError: Setting is immutable; use replace() to obtain a modified copy
+    >>> Setting('a', 2.0)
+    Traceback (most recent call last):
+    ...
+    TypeError: type(Setting.steps)(2.0) not in ['int']
+    >>> key = Setting('unused')._key
+    >>> key in INTERNED_CONFIGS
+    False
+    '''
+    __slots__ = ('__weakref__', '_key', '_renderings')
+
+    def validate(self):
+        r'''
+        Raise a ValueError or TypeError if problems with the
+        specification are detected.
+        '''
+        pass
+
+
+    def replace(self, **changes):
+        r'''
+        Return the shared instance that differs from this one in the
+        members given as keyword arguments.
+        '''
+        members = dict([(name, getattr(self, name))
+                        for name in self.__class__.__slots__])
+        members.update(changes)
+        return self.__class__(**members)
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError('%s is immutable; use replace() to obtain a modified copy' %
+                             self.__class__.__name__)
+
+
+    def __delattr__(self, name):
+        self.__setattr__(name, None)
+
+
+    def __eq__(self, other):
+        return self is other or (isinstance(other, InternedConfig) and
+                                 self._key == other._key)
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def __hash__(self):
+        return hash(self._key)
+
+
+    def __copy__(self):
+        return self
+
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+    def __reduce__(self):
+        return (interned_config, (self.__class__,
+                                  tuple([getattr(self, name)
+                                         for name in self.__class__.__slots__])))
+
+
+
+
 def with_auto_repr(cls):
     r'''
     Class decorator that adds a nicer default __repr__ method to a class.
@@ -303,9 +473,9 @@ def lofar_observer(date=None):
 
     '''
     lofar = ephem.Observer()
-    lofar.long = +6.869837540*pi/180
-    lofar.lat = +52.915122495*pi/180
-    lofar.elevation = +49.344
+    lofar.long = LOFAR_LONGITUDE_RAD
+    lofar.lat = LOFAR_LATITUDE_RAD
+    lofar.elevation = LOFAR_ELEVATION_M
     if date is not None:
         lofar.date = date
     return lofar
@@ -335,6 +505,63 @@ def lofar_sidereal_time(date):
     return lofar.sidereal_time()
 
 
+def lofar_sidereal_times(dates):
+    r'''
+    Returns a NumPy array with the LOFAR mean sidereal time in radians
+    at each of the ``dates``. The computation is vectorised (IAU 1982
+    GMST) and agrees with ``lofar_sidereal_time()`` to within about a
+    second of time, the size of the equation of the equinoxes.
+
+    **Parameters**
+
+    dates : sequence
+        Anything ephem.Date() accepts, or a NumPy array of ephem.Date
+        floats (days since 1899/12/31 12:00 UT) of any shape.
+
+    **Examples**
+
+    >>> lsts = lofar_sidereal_times(['2013/04/15 12:00:00',
+    ...                              '2013/04/15 18:00:00'])
+    >>> bool(abs(float(lofar_sidereal_time('2013/04/15 18:00:00')) - lsts[1]) < 1e-4)
+    True
+    >>> lofar_sidereal_times(array([[41378.0, 41378.25]])).shape
+    (1, 2)
+    '''
+    if isinstance(dates, ndarray):
+        days = dates.astype(float64)
+    else:
+        days = array([float(ephem.Date(date)) for date in dates])
+    # ephem.Date counts days from JD 2415020.0; J2000 is JD 2451545.0
+    days_j2000 = days - 36525.0
+    centuries  = days_j2000/36525.0
+    gmst_deg   = (280.46061837 + 360.98564736629*days_j2000 +
+                  0.000387933*centuries**2 - centuries**3/38710000.0)
+    return mod(gmst_deg*pi/180 + LOFAR_LONGITUDE_RAD, 2*pi)
+
+
+
+def elevation_rad(ra_rad, dec_rad, lst_rad, lat_rad=LOFAR_LATITUDE_RAD):
+    r'''
+    Elevation of J2000 directions at the given local sidereal
+    times. The arguments broadcast against each other, so elevations
+    of M sources at N times are obtained by passing ``lst_rad`` with
+    shape (N, 1). Precession, nutation, and refraction are ignored,
+    which is adequate for source selection.
+
+    **Examples**
+
+    >>> '%.2f' % (elevation_rad(0.0, LOFAR_LATITUDE_RAD, 0.0)*180/pi)
+    '90.00'
+    >>> elevation_rad(array([0.0, pi]), 0.0, array([[0.0], [pi]])).round(4)
+    array([[ 0.6473, -0.6473],
+           [-0.6473,  0.6473]])
+    '''
+    sin_el = (sin(dec_rad)*sin(lat_rad) +
+              cos(dec_rad)*cos(lat_rad)*cos(lst_rad - ra_rad))
+    return arcsin(clip(sin_el, -1.0, 1.0))
+
+
+
 def next_date_with_lofar_lst(lst_rad, start_date=None):
     r'''
     '''
@@ -466,11 +693,288 @@ def sort_station_list(stations):
 
 
 
+SUPERTERP_STATIONS = ['CS002', 'CS003', 'CS004', 'CS005', 'CS006', 'CS007']
+CORE_STATIONS      = (['CS001'] + SUPERTERP_STATIONS +
+                      ['CS011', 'CS013', 'CS017', 'CS021', 'CS024', 'CS026',
+                       'CS028', 'CS030', 'CS031', 'CS032', 'CS101', 'CS103',
+                       'CS201', 'CS301', 'CS302', 'CS401', 'CS501'])
+REMOTE_STATIONS    = ['RS106', 'RS205', 'RS208', 'RS210', 'RS305', 'RS306',
+                      'RS307', 'RS310', 'RS406', 'RS407', 'RS409', 'RS503',
+                      'RS508', 'RS509']
+EU_STATIONS        = ['DE601', 'DE602', 'DE603', 'DE604', 'DE605', 'FR606',
+                      'SE607', 'UK608', 'DE609', 'PL610', 'PL611', 'PL612',
+                      'IE613']
+
+# All known stations in canonical order. A station's position in this
+# tuple is its bit number in a StationSet mask.
+STATION_REGISTRY = tuple(sort_station_list(CORE_STATIONS + REMOTE_STATIONS +
+                                           EU_STATIONS))
+STATION_BIT      = dict([(name, bit)
+                         for bit, name in enumerate(STATION_REGISTRY)])
+
+
+
+class UnknownStationError(InvalidStationSetError):
+    r'''
+    To be raised if a station name is not in the station registry.
+    '''
+
+
+
+class StationSet(object):
+    r'''
+    An immutable set of LOFAR stations, stored as a bit mask over
+    ``STATION_REGISTRY``. Set operations are integer operations, and
+    iteration always yields the names in canonical order: first the
+    core, then the remote, and then the international stations, in
+    numerical order.
+
+    **Parameters**
+
+    stations : None, StationSet, or sequence of strings
+        Station names. Case does not matter.
+
+    **Raises**
+
+    UnknownStationError
+        If a name is not in ``STATION_REGISTRY``.
+
+    **Examples**
+
+    >>> core = StationSet.named('core')
+    >>> superterp = StationSet(['cs007', 'CS002', 'CS003', 'CS004',
+    ...                         'CS005', 'CS006'])
+    >>> superterp <= core, core <= superterp
+    (True, False)
+    >>> len(core - superterp)
+    18
+    >>> (StationSet(['RS106', 'DE601']) | superterp).names()
+    ['CS002', 'CS003', 'CS004', 'CS005', 'CS006', 'CS007', 'RS106', 'DE601']
+    >>> StationSet(['RS106', 'DE601', 'CS001']) & core
+    StationSet(['CS001'])
+    >>> 'CS003' in superterp, 'CS001' in superterp
+    (True, False)
+    >>> StationSet(['CS001', 'CS001']) == StationSet(['CS001'])
+    True
+    >>> bool(StationSet()), len(StationSet.named('all'))
+    (False, 51)
+    >>> StationSet(['CS001', 'WSRT'])
+    Traceback (most recent call last):
+    ...
+    lofarobsxml.utilities.UnknownStationError: WSRT is not a known station.
+    '''
+    __slots__ = ('mask',)
+
+    def __init__(self, stations=None):
+        if stations is None:
+            mask = 0
+        elif isinstance(stations, StationSet):
+            mask = stations.mask
+        else:
+            mask = 0
+            for station in stations:
+                try:
+                    mask |= 1 << STATION_BIT[station.upper()]
+                except KeyError:
+                    raise UnknownStationError('%s is not a known station.' %
+                                              station.upper())
+        self.mask = mask
+
+
+    @classmethod
+    def from_mask(cls, mask):
+        r'''
+        Construct a StationSet directly from an integer bit mask.
+        '''
+        station_set = cls()
+        station_set.mask = mask & ALL_STATIONS_MASK
+        return station_set
+
+
+    @classmethod
+    def named(cls, station_set):
+        r'''
+        Return the StationSet for one of the names accepted by
+        ``station_list()``.
+
+        **Raises**
+
+        InvalidStationSetError
+            If ``station_set`` is not a known set name.
+
+        **Examples**
+
+        >>> StationSet.named('superterp')
+        StationSet(['CS002', 'CS003', 'CS004', 'CS005', 'CS006', 'CS007'])
+        >>> StationSet.named('wsrt')
+        Traceback (most recent call last):
+        ...
+        lofarobsxml.utilities.InvalidStationSetError: wsrt is not a valid station set.
+        '''
+        try:
+            return cls.from_mask(NAMED_STATION_MASKS[station_set])
+        except KeyError:
+            raise InvalidStationSetError('%s is not a valid station set.' %
+                                         station_set)
+
+
+    def as_tuple(self):
+        r'''
+        Return the station names in canonical order as a tuple. Equal
+        sets return the same tuple object, so that observations using
+        the same stations can share it.
+
+        **Examples**
+
+        >>> StationSet(['RS106', 'CS001']).as_tuple()
+        ('CS001', 'RS106')
+        >>> (StationSet.named('nl').as_tuple() is
+        ...  StationSet(station_list('nl')).as_tuple())
+        True
+        '''
+        try:
+            return STATION_TUPLES[self.mask]
+        except KeyError:
+            return cache_setdefault(STATION_TUPLES, self.mask,
+                                    tuple(self.names()))
+
+
+    def names(self):
+        r'''
+        Return a list of the station names in canonical order.
+        '''
+        mask, bit, names = self.mask, 0, []
+        while mask:
+            if mask & 1:
+                names.append(STATION_REGISTRY[bit])
+            mask >>= 1
+            bit += 1
+        return names
+
+
+    def __iter__(self):
+        return iter(self.names())
+
+
+    def __len__(self):
+        return bin(self.mask).count('1')
+
+
+    def __bool__(self):
+        return self.mask != 0
+
+    __nonzero__ = __bool__
+
+
+    def __contains__(self, station):
+        bit = STATION_BIT.get(station.upper())
+        return bit is not None and bool(self.mask & (1 << bit))
+
+
+    def __or__(self, other):
+        return StationSet.from_mask(self.mask | StationSet(other).mask)
+
+
+    def __and__(self, other):
+        return StationSet.from_mask(self.mask & StationSet(other).mask)
+
+
+    def __sub__(self, other):
+        return StationSet.from_mask(self.mask & ~StationSet(other).mask)
+
+
+    def __xor__(self, other):
+        return StationSet.from_mask(self.mask ^ StationSet(other).mask)
+
+
+    def __le__(self, other):
+        return self.mask & ~StationSet(other).mask == 0
+
+
+    def __ge__(self, other):
+        return StationSet(other) <= self
+
+
+    def __eq__(self, other):
+        return isinstance(other, StationSet) and self.mask == other.mask
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def __hash__(self):
+        return hash(self.mask)
+
+
+    def __repr__(self):
+        return 'StationSet(%r)' % self.names()
+
+
+
+def station_mask(stations):
+    r'''
+    Return the bit mask of a sequence of station names.
+
+    **Examples**
+
+    >>> station_mask(['CS001', 'CS003'])
+    5
+    '''
+    return StationSet(stations).mask
+
+
+
+ALL_STATIONS_MASK   = (1 << len(STATION_REGISTRY)) - 1
+NAMED_STATION_MASKS = {'superterp': station_mask(SUPERTERP_STATIONS),
+                       'core'     : station_mask(CORE_STATIONS),
+                       'remote'   : station_mask(REMOTE_STATIONS),
+                       'nl'       : station_mask(CORE_STATIONS +
+                                                 REMOTE_STATIONS),
+                       'eu'       : station_mask(EU_STATIONS),
+                       'all'      : ALL_STATIONS_MASK,
+                       'none'     : 0}
+
+# Interned station tuples, keyed by StationSet mask
+STATION_TUPLES = {}
+
+# Number of entries after which a station cache is emptied. Sharing
+# is an optimisation only, so an emptied cache costs memory, not
+# correctness.
+MAX_STATION_CACHE_ENTRIES = 1024
+
+
+
+def cache_setdefault(cache, key, value, max_entries=MAX_STATION_CACHE_ENTRIES):
+    r'''
+    Like ``cache.setdefault(key, value)``, but empties ``cache`` first
+    if it holds ``max_entries`` entries and ``key`` is not among them.
+
+    **Examples**
+
+    >>> cache = {}
+    >>> cache_setdefault(cache, 1, 'a', max_entries = 2)
+    'a'
+    >>> cache_setdefault(cache, 1, 'b', max_entries = 2)
+    'a'
+    >>> cache_setdefault(cache, 2, 'b', max_entries = 2)
+    'b'
+    >>> cache_setdefault(cache, 3, 'c', max_entries = 2), sorted(cache)
+    ('c', [3])
+    '''
+    if key not in cache and len(cache) >= max_entries:
+        cache.clear()
+    return cache.setdefault(key, value)
+
+
+
 def station_list(station_set, include=None, exclude=None):
     r'''
-    Provides a sorted list of station names, given a station set name,
-    a list of stations to include, and a list of stations to
-    exclude. Names use upper case letters.
+    Provides a sorted list of station names, given a station set
+    name, a list of stations to include, and a list of stations to
+    exclude. Names use upper case letters. The list is a copy of the
+    tuple interned by ``StationSet.as_tuple()``, which Observations
+    built from it share.
 
     **Parameters**
 
@@ -489,6 +993,14 @@ def station_list(station_set, include=None, exclude=None):
 
     A sorted list of strings containing LOFAR station names.
 
+    **Raises**
+
+    InvalidStationSetError
+        If ``station_set`` is not a valid set name.
+
+    UnknownStationError
+        If ``include`` or ``exclude`` contain an unknown station.
+
     **Examples**
 
     >>> station_list('superterp')
@@ -504,7 +1016,9 @@ def station_list(station_set, include=None, exclude=None):
     True
     >>> station_list('eu')
     ['DE601', 'DE602', 'DE603', 'DE604', 'DE605', 'FR606', 'SE607', 'UK608', 'DE609', 'PL610', 'PL611', 'PL612', 'IE613']
-    >>> station_list('all')==station_list('nl', include=station_list('eu'))
+    >>> station_list('all') == station_list('nl', include=station_list('eu'))
+    True
+    >>> station_list('nl', exclude=['CS013']) == station_list('nl', exclude=['cs013'])
     True
     >>> len(unique(station_list('all')))
     51
@@ -512,42 +1026,110 @@ def station_list(station_set, include=None, exclude=None):
     Traceback (most recent call last):
     ...
     lofarobsxml.utilities.InvalidStationSetError: wsrt is not a valid station set.
+    >>> station_list('nl', exclude = ['CS013', 'RS4O7'])
+    Traceback (most recent call last):
+    ...
+    lofarobsxml.utilities.UnknownStationError: RS4O7 is not a known station.
 
     '''
-    superterp = ['CS002', 'CS003', 'CS004', 'CS005', 'CS006', 'CS007']
-    core = ['CS001'] + superterp + ['CS011', 'CS013', 'CS017', 'CS021',
-                                    'CS024', 'CS026', 'CS028', 'CS030',
-                                    'CS031', 'CS032', 'CS101', 'CS103',
-                                    'CS201', 'CS301', 'CS302', 'CS401',
-                                    'CS501']
-    remote = ['RS106', 'RS205', 'RS208', 'RS210', 'RS305', 'RS306', 'RS307',
-              'RS310', 'RS406', 'RS407', 'RS409', 'RS503', 'RS508', 'RS509']
-    netherlands = core + remote
-    europe = ['DE601', 'DE602', 'DE603', 'DE604', 'DE605', 'FR606', 'SE607',
-              'UK608', 'DE609', 'PL610', 'PL611', 'PL612', 'IE613']
-    all_stations = netherlands + europe
-
-    lookup_table = {'superterp': superterp,
-                    'core'     : core,
-                    'remote'   : remote,
-                    'nl'       : netherlands,
-                    'eu'       : europe,
-                    'all'      : all_stations,
-                    'none'     : []}
-    try:
-        if include is None:
-            include_list = []
-        else:
-            include_list = [station.upper() for station in include]
-        superset = unique(lookup_table[station_set] + include_list)
-    except (KeyError,):
-        raise InvalidStationSetError('%s is not a valid station set.' %
-                                     sys.exc_info()[1].args[0])
-    if exclude is None:
-        exclude_list = []
-    else:
-        exclude_list = [station.upper() for station in exclude]
-    return sort_station_list([s for s in superset if s not in exclude_list])
+    stations = StationSet.named(station_set)
+    if include is not None:
+        stations = stations | StationSet(include)
+    if exclude is not None:
+        stations = stations - StationSet(exclude)
+    return list(stations.as_tuple())
+
+
+
+# Core stations whose HBA1 ear shares input nodes with an international
+# station, as (core station, international station) pairs.
+HBA1_INPUT_NODE_CONFLICTS = [('CS001', 'DE601'),
+                             ('CS031', 'DE602'),
+                             ('CS028', 'DE603'),
+                             ('CS011', 'DE604'),
+                             ('CS401', 'DE605'),
+                             ('CS030', 'FR606'),
+                             ('CS301', 'SE607'),
+                             ('CS013', 'UK608')]
+
+# Conflicting station pairs per antenna set. Antenna sets that are
+# absent have no conflicts.
+STATION_CONFLICTS = {'HBA_ONE'       : HBA1_INPUT_NODE_CONFLICTS,
+                     'HBA_ONE_INNER' : HBA1_INPUT_NODE_CONFLICTS,
+                     'HBA_DUAL'      : HBA1_INPUT_NODE_CONFLICTS,
+                     'HBA_DUAL_INNER': HBA1_INPUT_NODE_CONFLICTS}
+
+# The same, as (NL bit, EU bit) mask pairs
+STATION_CONFLICT_MASKS = dict(
+    [(antenna_set, [(station_mask([nl]), station_mask([eu]))
+                    for nl, eu in pairs])
+     for antenna_set, pairs in STATION_CONFLICTS.items()])
+
+
+
+def resolve_station_conflicts(stations, antenna_set, prefer='nl'):
+    r'''
+    Remove one station of every conflicting pair in
+    ``STATION_CONFLICTS[antenna_set]`` that is entirely present in
+    ``stations``.
+
+    **Parameters**
+
+    stations : StationSet or sequence of strings
+        The stations in the observation.
+
+    antenna_set : string
+        The observation's antenna set, e.g. 'HBA_DUAL'.
+
+    prefer : string
+        Either 'nl', to keep the Dutch station of a conflicting pair,
+        or 'eu', to keep the international station.
+
+    **Returns**
+
+    A tuple (kept, dropped) of StationSets.
+
+    **Examples**
+
+    >>> kept, dropped = resolve_station_conflicts(
+    ...     ['CS001', 'CS002', 'CS028', 'RS407', 'DE601', 'DE605', 'UK608'],
+    ...     'HBA_DUAL', prefer='nl')
+    >>> kept.names(), dropped.names()
+    (['CS001', 'CS002', 'CS028', 'RS407', 'DE605', 'UK608'], ['DE601'])
+    >>> kept, dropped = resolve_station_conflicts(StationSet.named('all'),
+    ...                                           'HBA_ONE', prefer='eu')
+    >>> dropped
+    StationSet(['CS001', 'CS011', 'CS013', 'CS028', 'CS030', 'CS031', 'CS301', 'CS401'])
+    >>> len(kept)
+    43
+    >>> resolve_station_conflicts(['CS013', 'CS030', 'RS106', 'FR606', 'UK608'],
+    ...                           'HBA_ONE_INNER')[1]
+    StationSet(['FR606', 'UK608'])
+    >>> resolve_station_conflicts(StationSet.named('all'), 'HBA_ZERO')[1]
+    StationSet([])
+    >>> resolve_station_conflicts(['CS001'], 'HBA_DUAL', prefer='both')
+    Traceback (most recent call last):
+    ...
+    ValueError: 'both' is not a valid station conflict policy; choose one of 'nl', 'eu'
+    '''
+    validate_enumeration('station conflict policy', prefer, ['nl', 'eu'])
+    mask = StationSet(stations).mask
+    dropped = 0
+    for nl_bit, eu_bit in STATION_CONFLICT_MASKS.get(antenna_set, []):
+        if mask & nl_bit and mask & eu_bit:
+            dropped |= eu_bit if prefer == 'nl' else nl_bit
+    return StationSet.from_mask(mask & ~dropped), StationSet.from_mask(dropped)
+
+
+
+def conflicting_stations_to_drop(stations, prefer):
+    r'''
+    Return the set of names in ``stations`` that
+    ``resolve_station_conflicts()`` would drop for an HBA1 antenna set.
+    Names that are not in the station registry are ignored.
+    '''
+    known = [station for station in stations if station in STATION_BIT]
+    return set(resolve_station_conflicts(known, 'HBA_DUAL', prefer)[1])
 
 
 
@@ -581,23 +1163,8 @@ def exclude_conflicting_eu_stations(stations):
     ['CS001', 'CS002', 'CS028', 'RS407', 'DE605', 'UK608']
 
     '''
-    exclude_dict = {'DE601': 'CS001',
-                    'DE602': 'CS031',
-                    'DE603': 'CS028',
-                    'DE604': 'CS011',
-                    'DE605': 'CS401',
-                    'FR606': 'CS030',
-                    'SE607': 'CS301',
-                    'UK608': 'CS013'}
-    good_stations = []
-
-    for station in stations:
-        try:
-            if exclude_dict[station] not in stations:
-                good_stations.append(station)
-        except KeyError:
-            good_stations.append(station)
-    return good_stations
+    dropped = conflicting_stations_to_drop(stations, prefer='nl')
+    return [station for station in stations if station not in dropped]
 
 
 def exclude_conflicting_nl_stations(stations):
@@ -630,23 +1197,8 @@ def exclude_conflicting_nl_stations(stations):
     ['CS002', 'CS028', 'RS407', 'DE601', 'DE605', 'UK608']
 
     '''
-    exclude_dict = {'CS001': 'DE601',
-                    'CS031': 'DE602',
-                    'CS028': 'DE603',
-                    'CS011': 'DE604',
-                    'CS401': 'DE605',
-                    'CS030': 'FR606',
-                    'CS301': 'SE607',
-                    'CS013': 'UK608'}
-    good_stations = []
-
-    for station in stations:
-        try:
-            if exclude_dict[station] not in stations:
-                good_stations.append(station)
-        except KeyError:
-            good_stations.append(station)
-    return good_stations
+    dropped = conflicting_stations_to_drop(stations, prefer='eu')
+    return [station for station in stations if station not in dropped]
 
 
 
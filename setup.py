@@ -10,6 +10,6 @@ setup(name='lofar-obs-xml',
       author_email = 'brentjens@astron.nl',
       url          = 'http://www.lofar.org/operations/doku.php?id=operator:system_validation_observations',
       packages     = ['momxml', 'lofarobsxml'],
-      requires     = ['ephem'],
+      requires     = ['ephem', 'numpy'],
       scripts      = ['genvalobs'],
      )
@@ -0,0 +1,138 @@
+r'''
+A minimal stand-in for the Simbad sim-id service. It serves canned
+ASCII responses, such as the ones in the ``examples/`` directory, from
+a local HTTP server, so that name resolution can be tested without
+network access.
+'''
+
+import sys
+import threading
+import time
+
+if sys.version_info[0] > 2:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+else:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+
+NO_SUCH_OBJECT_RESPONSE = '''C.D.S.  -  SIMBAD4 rel 1.201  -  stub
+
+!! No known catalog could be found
+'''
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    r'''
+    HTTPServer that handles every request in its own thread.
+    '''
+    daemon_threads = True
+
+
+
+class StubSimbadServer(object):
+    r'''
+    Local HTTP server that answers Simbad sim-id queries with canned
+    responses. Use it as a context manager.
+
+    **Parameters**
+
+    responses : dict
+        Maps the value of the ``Ident`` query parameter to the ASCII
+        Simbad response. Unknown identifiers receive a response
+        without coordinates.
+
+    latency_s : float
+        Artificial delay in seconds before every response.
+
+    **Examples**
+
+    >>> from lofarobsxml.targetsource import simbad
+    >>> responses = {'NCP': open('examples/simbad-ncp.txt').read()}
+    >>> with StubSimbadServer(responses) as server:
+    ...     print(simbad('NCP', url=server.url))
+    ...     server.request_count
+    TargetSource(name      = 'NCP',
+                 ra_angle  = Angle(shms = ('+', 0, 0, 0.0)),
+                 dec_angle = Angle(sdms = ('+', 90, 0, 0.0)))
+    1
+    '''
+    def __init__(self, responses, latency_s=0.0):
+        self.responses     = responses
+        self.latency_s     = latency_s
+        self.request_count = 0
+        self.requested     = []
+        self.server        = None
+        self.thread        = None
+        self.url           = None
+        self._lock         = threading.Lock()
+
+
+    def handler_class(self):
+        r'''
+        Return a request handler class bound to this stub.
+        '''
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            r'''
+            Answers GET requests from ``stub.responses``.
+            '''
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                ident = query.get('Ident', [''])[0]
+                with stub._lock:
+                    stub.request_count += 1
+                    stub.requested.append(ident)
+                if stub.latency_s > 0:
+                    time.sleep(stub.latency_s)
+                body = stub.responses.get(ident, NO_SUCH_OBJECT_RESPONSE)
+                body = body.encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+    def start(self):
+        r'''
+        Start serving on a free port on localhost. Returns the URL to
+        pass as ``url`` to ``simbad()``.
+        '''
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                          self.handler_class())
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/simbad/sim-id' % self.server.server_address[1]
+        return self.url
+
+
+    def stop(self):
+        r'''
+        Shut the server down.
+        '''
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False